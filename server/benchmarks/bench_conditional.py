@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Benchmark: idle dashboard polling, full render vs cached body vs 304 Not Modified
+
+Loads `--events` analytics events and `--purchases` purchases into the
+server's in-memory stores (no WAL, no live feed), then times GET requests
+through the whole app (routing, gzip) while nothing changes: rendering every
+response as before, serving the body cached for the current data version,
+and answering a browser's If-None-Match revalidation with 304.
+
+Run from the server directory:
+    python benchmarks/bench_conditional.py [--events 200000 --purchases 20000]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+for name, value in (("WAL_MODE", "off"), ("EVENT_SEGMENT_EVENTS", "0"), ("LIVE_INTERVAL", "0")):
+    os.environ.setdefault(name, value)
+
+from fastapi.testclient import TestClient
+
+import main
+from config import event_store, realtime_aggregates, response_cache, time_rollups
+from models import AnalyticsEvent
+from routes.coupon import apply_purchase
+from utils.event_store import EVENT_TYPES
+
+PATHS = ["/analytics-realtime", "/analytics", "/analytics?window=1h", "/coupons", "/purchases"]
+
+
+def load(n_events: int, n_purchases: int, n_adids: int = 20_000, n_products: int = 500):
+    rng = random.Random(42)
+    now = time.time()
+    for b in range(n_events // 20):
+        adid = f"adid-{rng.randrange(n_adids)}"
+        events = []
+        for i in range(20):
+            event_type = rng.choice(EVENT_TYPES)
+            product = rng.randrange(n_products)
+            events.append(AnalyticsEvent(
+                eventType=event_type, productId=f"prod-{product}", productName=f"Product {product}", timestamp=i,
+                viewDuration=rng.randint(100, 20000) if event_type in ("view", "view_end") else None,
+            ))
+        received_at = now - rng.uniform(0, 7200)
+        event_store.append_batches([(adid, events)], received_at)
+        realtime_aggregates.add_batch(adid, events, received_at)
+        time_rollups.add_batch(adid, events, received_at)
+    for p in range(n_purchases):
+        product = rng.randrange(n_products)
+        apply_purchase({
+            "purchaseId": f"PURCHASE-{p}", "adid": f"adid-{rng.randrange(n_adids)}",
+            "items": [{"id": f"prod-{product}", "name": f"Product {product}", "price": 10.0,
+                       "discount": rng.choice((0, 2.0)), "finalPrice": round(rng.uniform(1, 100), 2)}],
+            "total": 10.0, "trackerEnabled": rng.random() < 0.7,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(now - rng.uniform(0, 7200))),
+        })
+
+
+def per_request(client: TestClient, path: str, repeat: int, headers: dict, clear: bool = False):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        if clear:
+            response_cache.clear()
+        response = client.get(path, headers=headers)
+    return (time.perf_counter() - start) / repeat * 1000, response
+
+
+def main_():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--events", type=int, default=200_000)
+    parser.add_argument("--purchases", type=int, default=20_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    load(args.events, args.purchases)
+    gzip = {"Accept-Encoding": "gzip"}
+    print(f"{'path':>22} {'render (ms)':>12} {'cached (ms)':>12} {'304 (ms)':>9} {'body (KB)':>10}")
+    with TestClient(main.app) as client:
+        for path in PATHS:
+            render, response = per_request(client, path, args.repeat, gzip, clear=True)
+            cached, _ = per_request(client, path, args.repeat, gzip)
+            etag = client.get(path, headers=gzip).headers["etag"]
+            revalidate, not_modified = per_request(client, path, args.repeat, {**gzip, "If-None-Match": etag})
+            assert not_modified.status_code == 304, path
+            print(f"{path:>22} {render:>12.2f} {cached:>12.2f} {revalidate:>9.2f} "
+                  f"{int(response.headers.get('content-length', len(response.content))) / 1024:>10,.0f}")
+
+
+if __name__ == "__main__":
+    main_()
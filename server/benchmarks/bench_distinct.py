@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Benchmark: exact sets vs HyperLogLog sketches for the dashboard's distinct counts
+
+Feeds `--events` view/click events from `--users` ADIDs over `--products`
+products into per-day RealtimeAggregates (`--days`), once with sets and once
+with HyperLogLog sketches (DISTINCT_COUNTING=hll). The days are then merged
+into one window, as a windowed dashboard query does, and the two modes are
+compared on total traced memory, the size of the per-product unique-ADID and
+per-ADID products-viewed/clicked collections, ingest and merge time, and the
+error of every product's unique-ADID count.
+
+Run from the server directory:
+    python benchmarks/bench_distinct.py [--events 500000 --users 200000 --products 50 --days 7]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.aggregates import RealtimeAggregates, merge_realtime
+from utils.hll import HyperLogLog, hash64
+
+EVENT_TYPES = ("view_start", "view", "click")
+
+
+def make_events(n_events: int, n_users: int, n_products: int, days: int):
+    rng = random.Random(42)
+    adids = [f"adid-{user:08d}" for user in range(n_users)]
+    products = [f"prod-{product} - Product {product}" for product in range(n_products)]
+    return [
+        (adids[rng.randrange(n_users)], rng.choice(EVENT_TYPES),
+         # Skewed popularity, so products range from a few to many distinct viewers
+         products[min(int(rng.expovariate(4 / n_products)), n_products - 1)],
+         rng.randint(100, 20000), i * days // n_events)
+        for i in range(n_events)
+    ]
+
+
+def build(events, distinct, days: int):
+    """One aggregates object per day"""
+    parts = [RealtimeAggregates(distinct) for _ in range(days)]
+    for adid, event_type, product_key, duration, day in events:
+        parts[day].add_event(adid, event_type, product_key, duration, day)
+    return parts
+
+
+def measure(events, distinct, days: int):
+    """Aggregates, their traced bytes (hash cache included) and the untraced ingest time"""
+    hash64.cache_clear()
+    start = time.perf_counter()
+    build(events, distinct, days)
+    seconds = time.perf_counter() - start
+    hash64.cache_clear()
+    tracemalloc.start()
+    parts = build(events, distinct, days)
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return parts, memory, seconds
+
+
+def collection_bytes(collections) -> int:
+    """Bytes of the distinct-count collections themselves (not of the values they point to)"""
+    total = 0
+    for collection in collections:
+        total += sys.getsizeof(collection)
+        if isinstance(collection, HyperLogLog):
+            total += sys.getsizeof(collection.hashes) + sys.getsizeof(collection.registers or b"")
+    return total
+
+
+def errors(exact: dict, approximate: dict):
+    relative = [abs(len(approximate[key]["unique_adids"]) - len(stats["unique_adids"])) / len(stats["unique_adids"])
+                for key, stats in exact.items() if stats["unique_adids"]]
+    return sum(relative) / len(relative) * 100, max(relative) * 100
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--events", type=int, default=500_000)
+    parser.add_argument("--users", type=int, default=200_000)
+    parser.add_argument("--products", type=int, default=50)
+    parser.add_argument("--days", type=int, default=7)
+    args = parser.parse_args()
+
+    events = make_events(args.events, args.users, args.products, args.days)
+    print(f"{len(events):,} events, {args.users:,} ADIDs, {args.products} products, {args.days} daily buckets")
+    print(f"{'mode':>6} {'memory MB':>10} {'product MB':>11} {'adid MB':>8} {'ingest (s)':>11} "
+          f"{'merge (s)':>10} {'mean err':>9} {'max err':>8}")
+    results = {}
+    for label, distinct in (("exact", set), ("hll", HyperLogLog)):
+        parts, memory, seconds = measure(events, distinct, args.days)
+        start = time.perf_counter()
+        merged = merge_realtime(parts, distinct)
+        merge_seconds = time.perf_counter() - start
+        results[label] = merged["product_stats"]
+        mean_error, max_error = errors(results["exact"], results[label])
+        product_bytes = collection_bytes(stats["unique_adids"] for stats in merged["product_stats"].values())
+        adid_bytes = collection_bytes(stats[key] for stats in merged["adid_stats"].values()
+                                      for key in ("products_viewed", "products_clicked"))
+        print(f"{label:>6} {memory / 2**20:>10.1f} {product_bytes / 2**20:>11.2f} {adid_bytes / 2**20:>8.1f} "
+              f"{seconds:>11.2f} {merge_seconds:>10.3f} "
+              f"{mean_error:>8.2f}% {max_error:>7.2f}%")
+
+
+if __name__ == "__main__":
+    main()
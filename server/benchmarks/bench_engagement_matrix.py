@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Benchmark: engagement matrix build with list.index vs interned-id bincount
+
+Run from the server directory:
+    python benchmarks/bench_engagement_matrix.py [--events 10000 50000 200000]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.event_store import EventStore, EVENT_TYPES
+from utils.similarity import build_engagement_matrix
+
+
+def make_store(n_events: int, n_products: int, n_users: int) -> EventStore:
+    rng = random.Random(42)
+    store = EventStore()
+    for i in range(n_events):
+        event_type = rng.choice(EVENT_TYPES)
+        product = rng.randrange(n_products)
+        store.append(
+            f"adid-{rng.randrange(n_users)}", event_type, f"prod-{product}", f"Product {product}",
+            timestamp=i, view_duration=rng.randint(100, 20000) if event_type in ("view", "view_end") else None,
+        )
+    return store
+
+
+def build_with_list_index(store: EventStore) -> np.ndarray:
+    """The previous implementation: two passes over decoded events, list.index per event"""
+    all_products = set()
+    all_users = set()
+    for event in store.rows():
+        all_products.add(event.product_key)
+        all_users.add(event.adid)
+    products_list = sorted(all_products)
+    users_list = sorted(all_users)
+    engagement_matrix = np.zeros((len(products_list), len(users_list)))
+    for event in store.rows():
+        product_idx = products_list.index(event.product_key)
+        user_idx = users_list.index(event.adid)
+        if event.eventType == "click":
+            engagement_matrix[product_idx, user_idx] += 10.0
+        elif event.eventType == "view":
+            engagement_matrix[product_idx, user_idx] += ((event.viewDuration or 0) / 1000.0) * 0.1
+    return engagement_matrix
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--events", type=int, nargs="+", default=[10000, 50000, 200000])
+    parser.add_argument("--products", type=int, default=500)
+    parser.add_argument("--users", type=int, default=2000)
+    args = parser.parse_args()
+
+    print(f"{'events':>8} {'list.index (s)':>15} {'bincount (s)':>13} {'speedup':>8}")
+    for n_events in args.events:
+        store = make_store(n_events, args.products, args.users)
+
+        start = time.perf_counter()
+        expected = build_with_list_index(store)
+        legacy_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        _, _, actual = build_engagement_matrix(store)
+        new_seconds = time.perf_counter() - start
+
+        np.testing.assert_allclose(actual, expected)
+        print(f"{n_events:>8} {legacy_seconds:>15.3f} {new_seconds:>13.4f} {legacy_seconds / new_seconds:>7.0f}x")
+
+
+if __name__ == "__main__":
+    main()
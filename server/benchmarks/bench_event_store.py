@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Memory benchmark: analytics events as a list of dicts vs the columnar EventStore
+
+Run from the server directory:
+    python benchmarks/bench_event_store.py [--events 200000]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tracemalloc
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import AnalyticsBatch
+from utils.event_store import EventStore
+
+EVENT_TYPES = ["view_start", "view_end", "view", "click"]
+
+
+def make_payloads(n_events: int, batch_size: int = 20, n_adids: int = 500, n_products: int = 50):
+    """Yield raw JSON batches shaped like the SDK's ClickTracker flushes"""
+    rng = random.Random(42)
+    products = [(f"prod-{i}", f"Product {i}") for i in range(n_products)]
+    for start in range(0, n_events, batch_size):
+        events = []
+        for _ in range(min(batch_size, n_events - start)):
+            product_id, product_name = rng.choice(products)
+            event_type = rng.choice(EVENT_TYPES)
+            events.append({
+                "eventType": event_type,
+                "productId": product_id,
+                "productName": product_name,
+                "timestamp": 1731234567000 + start,
+                "viewDuration": rng.randint(100, 20000) if event_type in ("view", "view_end") else None,
+            })
+        adid = f"{rng.randrange(n_adids):08x}-4b1c-4d2e-9f3a-5c6d7e8f9a0b"
+        yield json.dumps({"adid": adid, "events": events})
+
+
+def store_as_dicts(payloads):
+    """The previous representation: one dict per event appended to a list"""
+    analytics_events = []
+    for payload in payloads:
+        batch = AnalyticsBatch.model_validate_json(payload)
+        for event in batch.events:
+            analytics_events.append({
+                "adid": batch.adid,
+                "eventType": event.eventType,
+                "productId": event.productId,
+                "productName": event.productName,
+                "timestamp": event.timestamp,
+                "viewDuration": event.viewDuration,
+                "receivedAt": datetime.now().isoformat()
+            })
+    return analytics_events
+
+
+def store_as_columns(payloads):
+    store = EventStore()
+    for payload in payloads:
+        batch = AnalyticsBatch.model_validate_json(payload)
+        store.append_batch(batch.adid, batch.events)
+    return store
+
+
+def measure(build, payloads):
+    """Bytes retained by the structure once the parsed request objects are gone"""
+    tracemalloc.start()
+    result = build(payloads)
+    retained, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, retained
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--events", type=int, default=200_000)
+    args = parser.parse_args()
+
+    payloads = list(make_payloads(args.events))
+
+    _, dict_bytes = measure(store_as_dicts, payloads)
+    store, column_bytes = measure(store_as_columns, payloads)
+
+    print(f"Events stored: {len(store):,}")
+    print(f"  list of dicts : {dict_bytes / len(store):8.1f} bytes/event ({dict_bytes / 2**20:.1f} MiB)")
+    print(f"  EventStore    : {column_bytes / len(store):8.1f} bytes/event ({column_bytes / 2**20:.1f} MiB)")
+    print(f"    column buffers incl. spare capacity: {store.nbytes / len(store):.1f} bytes/event")
+    print(f"  reduction     : {dict_bytes / column_bytes:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Benchmark: /analytics-events throughput, inline handler vs bounded ingest queue
+
+Runs the handler coroutines directly (request parsing is the same for both),
+with `--concurrency` devices posting batches at once. "inline" is the
+previous handler: store + aggregate + one print per event inside the request.
+"queued" enqueues in the handler and lets the consumer task store in bulk;
+its time runs until the queue is fully drained.
+
+Prints go to a line-buffered --log-file (default os.devnull), so every line
+still costs a write call like an unredirected stdout would.
+
+Run from the server directory:
+    python benchmarks/bench_ingest.py [--batches 5000 --batch-size 20]
+"""
+import argparse
+import asyncio
+import contextlib
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi import HTTPException
+
+from models import AnalyticsBatch, AnalyticsEvent
+from utils.aggregates import RealtimeAggregates
+from utils.event_store import EventStore, EVENT_TYPES
+from utils.ingest import IngestQueue
+
+
+def make_batches(n_batches: int, batch_size: int, n_devices: int = 1000, n_products: int = 200):
+    rng = random.Random(42)
+    batches = []
+    for b in range(n_batches):
+        events = []
+        for i in range(batch_size):
+            event_type = rng.choice(EVENT_TYPES)
+            product = rng.randrange(n_products)
+            events.append(AnalyticsEvent(
+                eventType=event_type, productId=f"prod-{product}", productName=f"Product {product}",
+                timestamp=b * batch_size + i,
+                viewDuration=rng.randint(100, 20000) if event_type in ("view", "view_end") else None,
+            ))
+        batches.append(AnalyticsBatch(adid=f"adid-{rng.randrange(n_devices)}", events=events))
+    return batches
+
+
+def inline_handler(store, aggregates):
+    """The previous handler body"""
+    async def receive(batch):
+        print(f"[Server] Received {len(batch.events)} events from ADID: {batch.adid}")
+        received_at = time.time()
+        store.append_batch(batch.adid, batch.events, received_at)
+        aggregates.add_batch(batch.adid, batch.events, received_at)
+        for event in batch.events:
+            if event.viewDuration is not None:
+                print(f"  - {event.eventType}: {event.productId} - {event.productName} (duration: {event.viewDuration}ms)")
+            else:
+                print(f"  - {event.eventType}: {event.productId} - {event.productName}")
+        return {"success": True, "eventsReceived": len(batch.events)}
+    return receive
+
+
+def queued_handler(queue):
+    """Same as routes.coupon.receive_analytics_events, against a local queue"""
+    async def receive(batch):
+        if not queue.offer(batch.adid, batch.events):
+            raise HTTPException(status_code=503, headers={"Retry-After": str(queue.retry_after)})
+        return {"success": True, "eventsReceived": len(batch.events)}
+    return receive
+
+
+async def post_all(handler, batches, concurrency: int) -> int:
+    """Post every batch, `concurrency` requests at a time; returns the number of 503s"""
+    rejected = 0
+    for start in range(0, len(batches), concurrency):
+        results = await asyncio.gather(
+            *(handler(batch) for batch in batches[start:start + concurrency]), return_exceptions=True
+        )
+        rejected += sum(isinstance(result, HTTPException) for result in results)
+        # Yield to the loop between waves, as a server would between requests
+        await asyncio.sleep(0)
+    return rejected
+
+
+async def run_inline(batches, concurrency):
+    store, aggregates = EventStore(), RealtimeAggregates()
+    start = time.perf_counter()
+    await post_all(inline_handler(store, aggregates), batches, concurrency)
+    return time.perf_counter() - start, len(store), 0
+
+
+async def run_queued(batches, concurrency, max_events):
+    store, aggregates = EventStore(), RealtimeAggregates()
+    queue = IngestQueue(store, [aggregates], max_events=max_events)
+    queue.start()
+    start = time.perf_counter()
+    rejected = await post_all(queued_handler(queue), batches, concurrency)
+    await queue.stop()
+    return time.perf_counter() - start, len(store), rejected
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--batches", type=int, default=5000)
+    parser.add_argument("--batch-size", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--max-events", type=int, default=100_000, help="queue bound")
+    parser.add_argument("--log-file", default=os.devnull)
+    args = parser.parse_args()
+
+    batches = make_batches(args.batches, args.batch_size)
+    total = args.batches * args.batch_size
+    print(f"{args.batches} batches x {args.batch_size} events, concurrency {args.concurrency}")
+
+    with open(args.log_file, "w", buffering=1) as log, contextlib.redirect_stdout(log):
+        inline_time, inline_stored, _ = asyncio.run(run_inline(batches, args.concurrency))
+        queued_time, queued_stored, rejected = asyncio.run(
+            run_queued(batches, args.concurrency, args.max_events)
+        )
+
+    print(f"inline: {total / inline_time:>12,.0f} events/s  ({inline_time:.3f}s, {inline_stored} stored)")
+    print(f"queued: {total / queued_time:>12,.0f} events/s  ({queued_time:.3f}s, {queued_stored} stored, "
+          f"{rejected} batches rejected)")
+    print(f"speedup: {inline_time / queued_time:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Benchmark: /analytics-events latency while similarity is recomputed, on the event loop vs in the worker
+
+Loads `--events` analytics events into the server's in-memory store (no
+WAL, no live feed), then posts one small batch every `--interval` ms
+through the whole app and records each request's latency from when it was
+due (a blocked event loop delays every request behind it): with nothing
+else running, while a similarity graph and the neighbor lists are computed
+in the worker process (as the server does), and while the same work runs
+on the event loop (as the handlers used to). Each phase lasts until its
+computation is done, and at least `--seconds`.
+
+Run from the server directory:
+    python benchmarks/bench_ingest_latency.py [--events 300000 --interval 5]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+for name, value in (("WAL_MODE", "off"), ("EVENT_SEGMENT_EVENTS", "0"), ("LIVE_INTERVAL", "0")):
+    os.environ.setdefault(name, value)
+
+import httpx
+import numpy as np
+
+import main
+from config import event_store
+from routes.similarity import compute_neighbors, compute_similarity_graph, similarity_worker
+from bench_conditional import load
+
+BATCH = {"adid": "bench-device", "events": [
+    {"eventType": "click", "productId": "prod-1", "productName": "Product 1", "timestamp": 0},
+    {"eventType": "view", "productId": "prod-2", "productName": "Product 2", "timestamp": 0, "viewDuration": 1500},
+]}
+GRAPH_PARAMS = (0.1, "sparse", 10, None, None, None)
+
+
+async def inline(function, *args):
+    """The computation as the handlers used to run it: directly on the event loop"""
+    await asyncio.sleep(0)
+    return function(event_store, *args)
+
+
+async def phase(client: httpx.AsyncClient, work, interval: float, seconds: float) -> np.ndarray:
+    """Latency of each post from when it was due, so time spent waiting on a blocked loop counts"""
+    latencies = []
+    task = asyncio.ensure_future(work) if work is not None else None
+    start = due = time.perf_counter()
+    while time.perf_counter() - start < seconds or (task is not None and not task.done()):
+        await asyncio.sleep(max(0.0, due - time.perf_counter()))
+        response = await client.post("/analytics-events", json=BATCH)
+        assert response.status_code == 200, response.text
+        latencies.append(time.perf_counter() - due)
+        due += interval
+    if task is not None:
+        await task
+    return np.array(latencies) * 1000
+
+
+async def run(interval: float, seconds: float):
+    phases = [
+        ("idle", lambda: None),
+        ("graph, worker", lambda: similarity_worker.run(compute_similarity_graph, *GRAPH_PARAMS)),
+        ("graph, event loop", lambda: inline(compute_similarity_graph, *GRAPH_PARAMS)),
+        ("neighbors, worker", lambda: similarity_worker.run(compute_neighbors, 0.1, 10)),
+        ("neighbors, event loop", lambda: inline(compute_neighbors, 0.1, 10)),
+    ]
+    print(f"{'phase':>22} {'requests':>9} {'p50 (ms)':>9} {'p99 (ms)':>9} {'max (ms)':>9}")
+    async with main.app.router.lifespan_context(main.app):
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://bench") as client:
+            # Warm up the app and the worker process (its first job imports the similarity code)
+            await phase(client, similarity_worker.run(compute_neighbors, 0.1, 10), interval, 0.5)
+            for name, work in phases:
+                latencies = await phase(client, work(), interval, seconds)
+                p50, p99 = np.percentile(latencies, [50, 99])
+                print(f"{name:>22} {len(latencies):>9,} {p50:>9.2f} {p99:>9.2f} {latencies.max():>9.1f}")
+
+
+def main_():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--events", type=int, default=300_000)
+    parser.add_argument("--interval", type=float, default=5, help="milliseconds between posts")
+    parser.add_argument("--seconds", type=float, default=2)
+    args = parser.parse_args()
+
+    load(args.events, 0)
+    asyncio.run(run(args.interval / 1000, args.seconds))
+
+
+if __name__ == "__main__":
+    main_()
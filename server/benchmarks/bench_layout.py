@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Benchmark: similarity graph layout time against node count
+
+Compares networkx.spring_layout (cold, 50 iterations) with utils.layout:
+a cold layout, and a warm start after 1% new nodes joined the graph.
+Movement is the mean distance existing nodes moved between refreshes,
+in units of the [-1, 1] layout.
+
+Run from the server directory:
+    python benchmarks/bench_layout.py [--nodes 100 1000 5000 20000]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.layout import force_layout, incremental_layout
+
+try:
+    import networkx as nx
+except ImportError:
+    nx = None
+
+
+def make_graph(n_nodes: int, degree: int, seed: int = 42):
+    """Clustered random graph: most edges stay inside groups of ~20 products"""
+    rng = np.random.default_rng(seed)
+    n_edges = n_nodes * degree // 2
+    sources = rng.integers(0, n_nodes, n_edges)
+    local = (sources // 20) * 20 + rng.integers(0, 20, n_edges)
+    targets = np.where(rng.random(n_edges) < 0.9, local, rng.integers(0, n_nodes, n_edges))
+    targets = np.minimum(targets, n_nodes - 1)
+    keep = sources != targets
+    pairs = np.unique(np.sort(np.stack([sources[keep], targets[keep]], axis=1), axis=1), axis=0)
+    weights = rng.uniform(0.1, 1.0, len(pairs))
+    return pairs[:, 0], pairs[:, 1], weights
+
+
+def timed(fn):
+    start = time.perf_counter()
+    value = fn()
+    return time.perf_counter() - start, value
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--nodes", type=int, nargs="+", default=[100, 500, 1000, 2000, 5000, 20000])
+    parser.add_argument("--degree", type=int, default=6, help="average edges per node")
+    parser.add_argument("--networkx-max", type=int, default=5000,
+                        help="skip networkx above this many nodes")
+    args = parser.parse_args()
+
+    print(f"{'nodes':>7} {'edges':>8} {'networkx':>10} {'cold':>9} {'warm':>9} {'speedup':>8} {'movement':>9}")
+    for n in args.nodes:
+        sources, targets, weights = make_graph(n, args.degree)
+        names = [f"prod-{i}" for i in range(n)]
+
+        nx_time = None
+        if nx is not None and n <= args.networkx_max:
+            G = nx.Graph()
+            G.add_nodes_from(range(n))
+            G.add_weighted_edges_from(zip(sources.tolist(), targets.tolist(), weights.tolist()))
+            nx_time, _ = timed(lambda: nx.spring_layout(G, k=2, iterations=50, seed=42))
+
+        cold_time, cold = timed(lambda: force_layout(n, sources, targets, weights))
+
+        # Refresh: 1% of products are new, the rest keep their previous positions
+        existing = n - max(1, n // 100)
+        previous = {names[i]: cold[i].tolist() for i in range(existing)}
+        warm_time, warm = timed(lambda: incremental_layout(names, sources, targets, weights, previous))
+        movement = np.linalg.norm(warm[:existing] - cold[:existing], axis=1).mean()
+
+        baseline = nx_time if nx_time is not None else cold_time
+        print(f"{n:>7} {len(sources):>8} "
+              f"{'-' if nx_time is None else f'{nx_time:.3f}s':>10} "
+              f"{cold_time:>8.3f}s {warm_time:>8.3f}s {baseline / warm_time:>7.1f}x {movement:>9.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Benchmark: realtime dashboard viewers, page reloads vs coalesced live deltas
+
+Fills the realtime aggregates with `--products` products and `--adids` ADIDs,
+then for each number of viewers compares the server CPU per second of
+dashboards reloading the page every 5 seconds (render of the top `--top`
+products) with one live feed publishing a delta every second: marking the
+changes of `--rate` events per second at ingest, building and encoding the
+delta once, and every viewer's stream handing it on.
+
+Run from the server directory:
+    python benchmarks/bench_live.py [--viewers 1 100 1000 --rate 5000]
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.aggregates import RealtimeAggregates
+from utils.live import LiveFeed
+from utils.templates import environment
+from utils.topk import top_rows
+
+EVENT_TYPES = ("view_start", "view", "view_end", "click")
+RELOAD_INTERVAL = 5
+
+
+def batches(rng: random.Random, n_products: int, n_adids: int, n_events: int, batch_size: int = 10):
+    result = []
+    for _ in range(n_events // batch_size):
+        events = []
+        for _ in range(batch_size):
+            product = min(int(rng.paretovariate(1.1)) - 1, n_products - 1)
+            events.append(SimpleNamespace(eventType=rng.choice(EVENT_TYPES), productId=f"prod-{product}",
+                                          productName="Product", viewDuration=rng.randint(100, 20000)))
+        result.append((f"adid-{rng.randrange(n_adids)}", events))
+    return result
+
+
+def render_page(aggregates: RealtimeAggregates, top: int) -> int:
+    template = environment.get_template("analytics_realtime.html")
+    top_products = top_rows(aggregates.product_stats, lambda stats: (stats["clicks"], stats["total_view_duration"]),
+                            top, aggregates.rankings["product_clicks"])
+    page = "".join(template.generate(
+        updated="", window_text="all time", adid_count=len(aggregates.adid_stats),
+        product_count=len(aggregates.product_stats), top_products=top_products, window_query="", live=None,
+    ))
+    return len(page.encode())
+
+
+async def live_second(feed: LiveFeed, aggregates: RealtimeAggregates, second, viewers: int):
+    """CPU seconds for one second of ingest marks plus one publish fanned out to `viewers` streams"""
+    received = 0
+
+    async def viewer(stream):
+        nonlocal received
+        async for message in stream:
+            received += len(message)
+
+    streams = [feed.stream() for _ in range(viewers)]
+    tasks = [asyncio.create_task(viewer(stream)) for stream in streams]
+    await asyncio.sleep(0)  # subscribe, consume the retry line
+    received = 0
+
+    mark = 0.0
+    for adid, events in second:
+        start = time.perf_counter()
+        feed.add_batch(adid, events, 0)
+        mark += time.perf_counter() - start
+        aggregates.add_batch(adid, events, 0)
+
+    start = time.perf_counter()
+    feed.publish()
+    await asyncio.sleep(0)  # every viewer takes the message off its queue
+    publish = time.perf_counter() - start
+
+    feed.close_streams()
+    await asyncio.gather(*tasks)
+    return mark, publish, received / max(viewers, 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--viewers", type=int, nargs="+", default=[1, 100, 1000])
+    parser.add_argument("--products", type=int, default=5000)
+    parser.add_argument("--adids", type=int, default=100_000)
+    parser.add_argument("--rate", type=int, default=5000, help="events per second")
+    parser.add_argument("--top", type=int, default=100)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    aggregates = RealtimeAggregates(ranking_size=args.top)
+    for adid, events in batches(rng, args.products, args.adids, 500_000):
+        aggregates.add_batch(adid, events, 0)
+
+    repeat = 20
+    start = time.perf_counter()
+    for _ in range(repeat):
+        page_bytes = render_page(aggregates, args.top)
+    render = (time.perf_counter() - start) / repeat
+
+    print(f"page render: {render * 1000:.2f} ms, {page_bytes / 1024:.0f} KB; "
+          f"{args.rate:,} events/s over {args.products:,} products")
+    print(f"{'viewers':>8} {'reload CPU (ms/s)':>18} {'live mark (ms/s)':>17} {'live publish (ms/s)':>20} "
+          f"{'reload KB/s':>12} {'live KB/s':>10}")
+    for viewers in args.viewers:
+        feed = LiveFeed(aggregates, interval=1.0)
+        second = batches(rng, args.products, args.adids, args.rate)
+        mark, publish, per_viewer = asyncio.run(live_second(feed, aggregates, second, viewers))
+        reload_cpu = viewers * render / RELOAD_INTERVAL
+        reload_bytes = viewers * page_bytes / RELOAD_INTERVAL
+        print(f"{viewers:>8,} {reload_cpu * 1000:>18.1f} {mark * 1000:>17.2f} {publish * 1000:>20.2f} "
+              f"{reload_bytes / 1024:>12,.0f} {viewers * per_viewer / 1024:>10,.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Benchmark: startup recovery time, full log replay vs snapshot + log tail
+
+Writes a write-ahead log of `--records` event batches (`--batch-size` events
+each) for growing history sizes, then times rebuilding the event store and
+realtime aggregates two ways: replaying the whole log, and loading a snapshot
+taken `--tail` records before the end and replaying only the records after it
+(log segments covered by the snapshot are pruned first, as the server does).
+
+Run from the server directory:
+    python benchmarks/bench_recovery.py [--records 2000 10000 50000 --batch-size 20 --tail 1000]
+"""
+import argparse
+import asyncio
+import os
+import pickle
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import AnalyticsEvent
+from utils.aggregates import RealtimeAggregates
+from utils.event_store import EventStore, EVENT_TYPES
+from utils.snapshot import load_snapshot, save_snapshot
+from utils.wal import WriteAheadLog
+
+
+def make_record(rng: random.Random, batch_size: int) -> dict:
+    events = []
+    for i in range(batch_size):
+        event_type = rng.choice(EVENT_TYPES)
+        product = rng.randrange(200)
+        events.append([event_type, f"prod-{product}", f"Product {product}", i,
+                       rng.randint(100, 20000) if event_type in ("view", "view_end") else None])
+    return {"type": "events", "adid": f"adid-{rng.randrange(500)}", "receivedAt": time.time(), "events": events}
+
+
+def apply(record: dict, store: EventStore, aggregates: RealtimeAggregates):
+    # Same work as persistence.apply_record for event batches
+    events = [
+        AnalyticsEvent.model_construct(eventType=event_type, productId=product_id, productName=product_name,
+                                       timestamp=timestamp, viewDuration=view_duration)
+        for event_type, product_id, product_name, timestamp, view_duration in record["events"]
+    ]
+    store.append_batch(record["adid"], events, record["receivedAt"])
+    aggregates.add_batch(record["adid"], events, record["receivedAt"])
+
+
+async def write_history(directory: str, records: int, batch_size: int, tail: int) -> str:
+    """Log `records` batches, snapshotting the applied state `tail` records before the end"""
+    rng = random.Random(42)
+    wal = WriteAheadLog(os.path.join(directory, "wal"), "none", segment_bytes=8 * 2**20)
+    wal.open()
+    store, aggregates = EventStore(), RealtimeAggregates()
+    snapshot = None
+    for i in range(records):
+        record = make_record(rng, batch_size)
+        wal.submit(record)
+        apply(record, store, aggregates)
+        if i == records - tail - 1:
+            state = pickle.dumps({"realtime": vars(aggregates)}, protocol=pickle.HIGHEST_PROTOCOL)
+            snapshot = save_snapshot(os.path.join(directory, "snapshots"), wal.lsn, store.snapshot(), state)
+    await wal.close()
+    return snapshot
+
+
+def full_replay(directory: str) -> int:
+    store, aggregates = EventStore(), RealtimeAggregates()
+    for record in WriteAheadLog(os.path.join(directory, "wal")).replay():
+        apply(record, store, aggregates)
+    return len(store)
+
+
+def snapshot_recovery(directory: str, snapshot: str) -> int:
+    store, aggregates = EventStore(), RealtimeAggregates()
+    lsn, state = load_snapshot(snapshot, store)
+    vars(aggregates).update(state["realtime"])
+    for record in WriteAheadLog(os.path.join(directory, "wal")).replay(after_lsn=lsn):
+        apply(record, store, aggregates)
+    return len(store)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--records", type=int, nargs="+", default=[2000, 10000, 50000])
+    parser.add_argument("--batch-size", type=int, default=20)
+    parser.add_argument("--tail", type=int, default=1000, help="log records written after the snapshot")
+    parser.add_argument("--dir", default=None, help="parent directory for the temporary files")
+    args = parser.parse_args()
+
+    print(f"{'records':>8} {'events':>10} {'full replay':>12} {'snapshot+tail':>14} {'speedup':>8}")
+    for records in args.records:
+        tail = min(args.tail, records - 1)
+        with tempfile.TemporaryDirectory(dir=args.dir) as directory:
+            snapshot = asyncio.run(write_history(directory, records, args.batch_size, tail))
+
+            start = time.perf_counter()
+            events = full_replay(directory)
+            full = time.perf_counter() - start
+
+            wal = WriteAheadLog(os.path.join(directory, "wal"))
+            for _ in wal.replay():
+                pass
+            wal.prune(int(os.path.basename(snapshot).split("-")[1]))
+
+            start = time.perf_counter()
+            assert snapshot_recovery(directory, snapshot) == events
+            fast = time.perf_counter() - start
+        print(f"{records:>8} {events:>10,} {full:>11.2f}s {fast:>13.2f}s {full / fast:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Benchmark: dashboard HTML rendering, string concatenation vs streamed templates
+
+Renders the /analytics page with `--rows` ADID rows (what `?top=N` asks for)
+three ways: `html_content += f"..."` per row as the dashboard used to, the
+Jinja2 template rendered to one string, and the template streamed in chunks
+the way the dashboard now serves it (shared_page: one producer task whose
+chunks are read by the request and kept for the response cache). Reports the time to the first byte, the time for
+the whole page and the peak memory allocated while producing it.
+
+Run from the server directory:
+    python benchmarks/bench_render.py [--rows 1000 10000 100000]
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+for name, value in (("WAL_MODE", "off"), ("EVENT_SEGMENT_EVENTS", "0"), ("LIVE_INTERVAL", "0")):
+    os.environ.setdefault(name, value)
+
+from routes.analytics import shared_page
+from utils.aggregates import RevenueAggregates
+from utils.templates import environment
+
+
+def page_context(n_rows: int) -> dict:
+    rng = random.Random(42)
+    aggregates = RevenueAggregates()
+    for i in range(n_rows):
+        aggregates.add_purchase({
+            "adid": f"{rng.getrandbits(128):032x}",
+            "items": [{"id": f"prod-{rng.randrange(50)}", "name": "Product", "price": 10.0,
+                       "discount": rng.choice((0, 0, 1.5)), "finalPrice": round(rng.uniform(1, 100), 2)}],
+            "trackerEnabled": rng.random() < 0.7,
+        })
+    snapshot = aggregates.snapshot()
+    by_revenue = lambda item: item[1]["total_revenue"]
+    return {
+        "window_text": "all time",
+        "totals": snapshot["totals"],
+        "top_adids": sorted(snapshot["analytics"].items(), key=by_revenue, reverse=True),
+        "top_products": sorted(snapshot["product_analytics"].items(), key=lambda item: item[0]),
+        "product_count": len(snapshot["product_analytics"]),
+    }
+
+
+def concatenated(context: dict):
+    """The ADID table as the handler used to build it; yields once, with the whole page"""
+    html_content = """
+    <!DOCTYPE html>
+    <html>
+    <head>
+        <title>DemoShop Analytics Dashboard</title>
+    </head>
+    <body>
+        <table>
+            <tbody>
+    """
+    for adid, data in context["top_adids"]:
+        tracker_badge = "🟢 ON" if data["tracker_enabled"] else "🔴 OFF"
+        html_content += f"""
+                        <tr>
+                            <td class="adid-cell">{adid[:16]}...</td>
+                            <td>{tracker_badge}</td>
+                            <td>{data["purchases"]}</td>
+                            <td>{data["items_purchased"]}</td>
+                            <td class="revenue-cell">${data["revenue_with_coupon"]:.2f}</td>
+                            <td style="color: #a0aec0; font-weight: 600;">${data["revenue_without_coupon"]:.2f}</td>
+                            <td class="revenue-cell" style="font-weight: 700; font-size: 18px;">${data["total_revenue"]:.2f}</td>
+                            <td class="savings-cell">${data["total_savings"]:.2f}</td>
+                        </tr>
+            """
+    html_content += """
+            </tbody>
+        </table>
+    </body>
+    </html>
+    """
+    yield html_content.encode()
+
+
+def rendered(context: dict):
+    yield environment.get_template("analytics.html").render(**context).encode()
+
+
+async def streamed(context: dict):
+    response = shared_page(("bench_render", id(context)), 0, lambda: 0, "analytics.html", lambda: context)
+    async for chunk in response.body_iterator:
+        yield chunk
+
+
+def consume(chunks):
+    """(seconds to the first chunk, seconds in total, bytes); chunks are dropped as a server would after sending"""
+    async def drain():
+        start = time.perf_counter()
+        first, size = None, 0
+        if hasattr(chunks, "__aiter__"):
+            async for chunk in chunks:
+                first = first or time.perf_counter() - start
+                size += len(chunk)
+        else:
+            for chunk in chunks:
+                first = first or time.perf_counter() - start
+                size += len(chunk)
+        return first, time.perf_counter() - start, size
+    return asyncio.run(drain())
+
+
+def peak_memory(chunks) -> int:
+    tracemalloc.start()
+    consume(chunks)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000, 10_000, 100_000])
+    args = parser.parse_args()
+
+    environment.get_template("analytics.html")
+    print(f"{'rows':>8} {'renderer':>13} {'first byte (ms)':>16} {'total (ms)':>11} {'page (KB)':>10} {'peak (KB)':>10}")
+    for n_rows in args.rows:
+        context = page_context(n_rows)
+        for name, renderer in (("concatenated", concatenated), ("rendered", rendered), ("streamed", streamed)):
+            first, total, size = consume(renderer(context))
+            peak = peak_memory(renderer(context))
+            print(f"{n_rows:>8,} {name:>13} {first * 1000:>16.2f} {total * 1000:>11.1f} {size / 1024:>10,.0f} "
+                  f"{peak / 1024:>10,.0f}")
+
+
+if __name__ == "__main__":
+    main()
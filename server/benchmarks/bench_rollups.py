@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Benchmark: windowed dashboard queries, rollup buckets vs filtered full scan
+
+Spreads `--events` events and `--purchases` purchases evenly over `--days`
+days, then answers /analytics-realtime and /analytics for the last hour, last
+day and whole range: by merging the minute/hour/day rollups covering the window,
+and by scanning every event and purchase and comparing timestamps.
+
+Run from the server directory:
+    python benchmarks/bench_rollups.py [--events 200000 --purchases 20000 --days 30]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import AnalyticsEvent
+from utils.aggregates import recompute_realtime, recompute_revenue
+from utils.event_store import EventStore, EVENT_TYPES
+from utils.rollups import TimeRollups, purchase_time
+
+BATCH_SIZE = 10
+
+
+def build(n_events: int, n_purchases: int, days: float, n_products: int, n_users: int):
+    rng = random.Random(42)
+    store, rollups, purchases = EventStore(), TimeRollups(), []
+    end = time.time()
+    start = end - days * 86400
+    n_batches = n_events // BATCH_SIZE
+    ingest_seconds = 0.0
+    for i in range(n_batches):
+        received_at = start + (end - start) * i / n_batches
+        adid = f"adid-{rng.randrange(n_users)}"
+        events = []
+        for j in range(BATCH_SIZE):
+            event_type = rng.choice(EVENT_TYPES)
+            product = rng.randrange(n_products)
+            events.append(AnalyticsEvent.model_construct(
+                eventType=event_type, productId=f"prod-{product}", productName=f"Product {product}", timestamp=j,
+                viewDuration=rng.randint(100, 20000) if event_type in ("view", "view_end") else None,
+            ))
+        store.append_batch(adid, events, received_at)
+        began = time.perf_counter()
+        rollups.add_batch(adid, events, received_at)
+        ingest_seconds += time.perf_counter() - began
+    for i in range(n_purchases):
+        product = rng.randrange(n_products)
+        discounted = rng.random() < 0.3
+        purchase = {
+            "adid": f"adid-{rng.randrange(n_users)}",
+            "items": [{"id": f"prod-{product}", "name": f"Product {product}", "price": 10.0,
+                       "discount": 0.2 if discounted else 0, "finalPrice": 8.0 if discounted else 10.0}],
+            "trackerEnabled": rng.random() < 0.7,
+            "timestamp": datetime.fromtimestamp(start + (end - start) * i / n_purchases).isoformat(),
+        }
+        purchases.append(purchase)
+        rollups.add_purchase(purchase)
+    return store, rollups, purchases, end, ingest_seconds
+
+
+def scan(store: EventStore, purchases, since: float, until: float):
+    events = [event for event in store.rows() if since <= event.receivedAt < until]
+    window_purchases = [purchase for purchase in purchases if since <= purchase_time(purchase) < until]
+    return recompute_realtime(events, window_purchases), recompute_revenue(window_purchases)
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    fn(*args)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--events", type=int, default=200_000)
+    parser.add_argument("--purchases", type=int, default=20_000)
+    parser.add_argument("--days", type=float, default=30)
+    parser.add_argument("--products", type=int, default=200)
+    parser.add_argument("--users", type=int, default=1000)
+    args = parser.parse_args()
+
+    store, rollups, purchases, now, ingest_seconds = build(
+        args.events, args.purchases, args.days, args.products, args.users
+    )
+    print(f"{len(store):,} events, {len(purchases):,} purchases over {args.days:g} days; "
+          f"rollup ingest {ingest_seconds / len(store) * 1e6:.2f} us/event; {rollups.stats()}")
+    print(f"{'window':>8} {'buckets':>8} {'rollups (s)':>12} {'scan (s)':>9} {'speedup':>8}")
+    for label, seconds in (("1h", 3600), ("1d", 86400), ("all", args.days * 86400 + 60)):
+        since = now - seconds
+        buckets = len(rollups.cover(since, now))
+        fast = timed(lambda: (rollups.realtime(since, now), rollups.revenue(since, now)))
+        slow = timed(scan, store, purchases, since, now)
+        print(f"{label:>8} {buckets:>8} {fast:>12.4f} {slow:>9.3f} {slow / fast:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
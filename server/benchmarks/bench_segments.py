@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Benchmark: all-in-heap event store vs sealed memory-mapped segments
+
+For each history size, fills one store entirely in memory and one that seals
+every `--segment-events` events into memory-mapped column files, then
+compares heap bytes, the engagement matrix build behind /product-similarity,
+and the pickled snapshot the similarity worker process receives.
+
+Run from the server directory:
+    python benchmarks/bench_segments.py [--events 1000000 5000000 --segment-events 1000000]
+"""
+import argparse
+import os
+import pickle
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.event_store import Column, EventStore, EVENT_TYPES, NO_DURATION, VIEW
+from utils.similarity import build_engagement_matrix
+
+
+def random_columns(rng: np.random.Generator, count: int, n_products: int, n_users: int) -> dict:
+    event_type = rng.integers(0, len(EVENT_TYPES), count).astype(np.uint16)
+    return {
+        "timestamp": np.arange(count, dtype=np.int64),
+        "received_at": np.full(count, time.time()),
+        "duration": np.where(event_type == VIEW, rng.integers(100, 20000, count), NO_DURATION).astype(np.int64),
+        "event_type": event_type,
+        "adid": rng.integers(0, n_users, count).astype(np.uint32),
+        "product": rng.integers(0, n_products, count).astype(np.uint32),
+    }
+
+
+def fill(store: EventStore, n_events: int, n_products: int, n_users: int, chunk: int):
+    """Same events for every store: sealed chunk by chunk, or kept in one set of heap columns"""
+    for user in range(n_users):
+        store.adids.intern(f"adid-{user}")
+    for product in range(n_products):
+        store.intern_product(f"prod-{product}", f"Product {product}")
+    rng = np.random.default_rng(42)
+    parts = [random_columns(rng, min(chunk, n_events - start), n_products, n_users)
+             for start in range(0, n_events, chunk)]
+    if store.segment_dir is None:
+        for name in store.COLUMNS:
+            setattr(store, name, Column.from_array(np.concatenate([part[name] for part in parts])))
+        return
+    for part in parts:
+        for name, values in part.items():
+            setattr(store, name, Column.from_array(values))
+        store.seal()
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--events", type=int, nargs="+", default=[1_000_000, 5_000_000])
+    parser.add_argument("--segment-events", type=int, default=1_000_000)
+    parser.add_argument("--products", type=int, default=500)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--dir", default=None, help="parent directory for the temporary segment files")
+    args = parser.parse_args()
+
+    print(f"{'events':>9} {'store':>9} {'heap MB':>8} {'mapped MB':>10} {'matrix (s)':>11} {'pickle MB':>10}")
+    for n_events in args.events:
+        with tempfile.TemporaryDirectory(dir=args.dir) as directory:
+            results = {}
+            for label, segment_dir in (("heap", None), ("segments", directory)):
+                store = EventStore(segment_dir, args.segment_events)
+                fill(store, n_events, args.products, args.users, args.segment_events)
+                seconds, (_, _, matrix) = timed(build_engagement_matrix, store)
+                results[label] = matrix
+                pickled = len(pickle.dumps(store.snapshot(), protocol=pickle.HIGHEST_PROTOCOL))
+                print(f"{n_events:>9,} {label:>9} {store.nbytes / 2**20:>8.1f} {store.mapped_bytes / 2**20:>10.1f} "
+                      f"{seconds:>11.2f} {pickled / 2**20:>10.2f}")
+            np.testing.assert_allclose(results["segments"], results["heap"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Benchmark: a burst of identical dashboard requests, each computed vs coalesced
+
+Loads `--events` analytics events and `--purchases` purchases into the
+server's in-memory stores (no WAL, no live feed), then sends `--concurrency`
+identical GET requests at once through the whole app, with an empty
+response cache as right after a write: every request computing and
+rendering its own page, then requests sharing one computation.
+
+Run from the server directory:
+    python benchmarks/bench_singleflight.py [--events 200000 --concurrency 1 10 50]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+for name, value in (("WAL_MODE", "off"), ("EVENT_SEGMENT_EVENTS", "0"), ("LIVE_INTERVAL", "0")):
+    os.environ.setdefault(name, value)
+
+import httpx
+
+import main
+from config import request_flights, response_cache
+from bench_conditional import load
+
+PATHS = ["/analytics", "/analytics?window=1h", "/analytics-realtime?window=1h"]
+
+
+async def burst(client: httpx.AsyncClient, path: str, concurrency: int, repeat: int) -> float:
+    """Milliseconds until all `concurrency` responses are complete"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        response_cache.clear()
+        responses = await asyncio.gather(*(client.get(path) for _ in range(concurrency)))
+        assert all(response.status_code == 200 for response in responses), path
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+async def run(concurrency_levels, repeat: int):
+    share = request_flights.share
+    print(f"{'path':>30} {'requests':>9} {'separate (ms)':>14} {'coalesced (ms)':>15} {'computations':>13}")
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://bench") as client:
+        for path in PATHS:
+            for concurrency in concurrency_levels:
+                request_flights.share = lambda key, source, route=None: source()
+                alone = await burst(client, path, concurrency, repeat)
+                request_flights.share = share
+                route = path.split("?")[0]
+                before = request_flights.routes.get(route, {}).get("computations", 0)
+                coalesced = await burst(client, path, concurrency, repeat)
+                computations = (request_flights.routes[route]["computations"] - before) / repeat
+                print(f"{path:>30} {concurrency:>9} {alone:>14.1f} {coalesced:>15.1f} {computations:>13.1f}")
+
+
+def main_():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--events", type=int, default=200_000)
+    parser.add_argument("--purchases", type=int, default=20_000)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 10, 50])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    load(args.events, args.purchases)
+    asyncio.run(run(args.concurrency, args.repeat))
+
+
+if __name__ == "__main__":
+    main_()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Benchmark: dashboard top-N tables, full sort per render vs ingest-time rankings
+
+For each number of products/ADIDs, folds `--events` events and `--purchases`
+purchases (with skewed popularity) into the realtime and revenue aggregates,
+with and without rankings of `--top` rows, then compares the ingest cost of
+keeping the rankings up to date with the per-render cost of picking the top
+rows: sorted() over every row as the dashboards used to, heapq.nlargest, and
+the ranking.
+
+Run from the server directory:
+    python benchmarks/bench_topk.py [--rows 1000 10000 100000 --top 100]
+"""
+import argparse
+import heapq
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.aggregates import REALTIME_RANKINGS, REVENUE_RANKINGS, RealtimeAggregates, RevenueAggregates
+from utils.topk import top_rows
+
+EVENT_TYPES = ("view_start", "view", "view_end", "click")
+
+
+def workload(n_rows: int, n_events: int, n_purchases: int):
+    rng = random.Random(42)
+
+    def pick():
+        return min(int(rng.paretovariate(1.1)) - 1, n_rows - 1)
+
+    events = [(f"adid-{rng.randrange(n_rows)}", rng.choice(EVENT_TYPES), f"prod-{pick()} - Product",
+               rng.randint(100, 20000)) for _ in range(n_events)]
+    # Every row exists, plus a skewed tail of repeat activity
+    events += [(f"adid-{i}", "click", f"prod-{i} - Product", None) for i in range(n_rows)]
+    purchases = [{
+        "adid": f"adid-{pick() if i >= n_rows else i}",
+        "items": [{"id": f"prod-{pick() if i >= n_rows else i}", "name": "Product", "price": 10.0,
+                   "discount": 0, "finalPrice": round(rng.uniform(1, 100), 2)}],
+        "trackerEnabled": rng.random() < 0.7,
+    } for i in range(n_purchases + n_rows)]
+    return events, purchases
+
+
+def ingest(events, purchases, ranking_size):
+    realtime, revenue = RealtimeAggregates(ranking_size=ranking_size), RevenueAggregates(ranking_size)
+    start = time.perf_counter()
+    for adid, event_type, product_key, duration in events:
+        realtime.add_event(adid, event_type, product_key, duration, 0)
+    for purchase in purchases:
+        revenue.add_purchase(purchase)
+    return realtime, revenue, time.perf_counter() - start
+
+
+def per_render(fn, repeat: int = 20) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000, 10_000, 100_000])
+    parser.add_argument("--events", type=int, default=300_000)
+    parser.add_argument("--purchases", type=int, default=50_000)
+    parser.add_argument("--top", type=int, default=100)
+    args = parser.parse_args()
+
+    print(f"{'rows':>8} {'ingest plain':>13} {'ingest ranked':>14} {'sorted (ms)':>12} {'nlargest (ms)':>14} "
+          f"{'ranking (ms)':>13}")
+    for n_rows in args.rows:
+        events, purchases = workload(n_rows, args.events, args.purchases)
+        _, _, plain = ingest(events, purchases, None)
+        realtime, revenue, ranked = ingest(events, purchases, args.top)
+        tables = [(realtime, name, rows, key) for name, (rows, key) in REALTIME_RANKINGS.items()]
+        tables += [(revenue, name, rows, key) for name, (rows, key) in REVENUE_RANKINGS.items()]
+
+        def full_sort():
+            for aggregates, _, rows, key in tables:
+                sorted(getattr(aggregates, rows).items(), key=lambda item: key(item[1]), reverse=True)
+
+        def nlargest():
+            for aggregates, _, rows, key in tables:
+                heapq.nlargest(args.top, getattr(aggregates, rows).items(), key=lambda item: key(item[1]))
+
+        def ranking():
+            for aggregates, name, rows, key in tables:
+                top_rows(getattr(aggregates, rows), key, args.top, aggregates.rankings[name])
+
+        for aggregates, name, rows, key in tables:
+            expected = [key(row) for _, row in heapq.nlargest(args.top, getattr(aggregates, rows).items(),
+                                                               key=lambda item: key(item[1]))]
+            actual = [key(row) for _, row in top_rows(getattr(aggregates, rows), key, args.top,
+                                                      aggregates.rankings[name])]
+            assert actual == expected, name
+        print(f"{n_rows:>8,} {plain:>12.2f}s {ranked:>13.2f}s {per_render(full_sort):>12.2f} "
+              f"{per_render(nlargest):>14.2f} {per_render(ranking):>13.3f}")
+
+
+if __name__ == "__main__":
+    main()
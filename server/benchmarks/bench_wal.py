@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Benchmark: ingest throughput for each write-ahead log durability mode
+
+`--clients` concurrent devices each post `--requests` event batches back to
+back. Every request writes its batch record to the WAL, as
+/analytics-events does, and then hands the batch to the ingest queue.
+Modes: off (memory only), none (no fsync), group (group commit), fsync
+(per-request fsync). The WAL lives in a temporary directory on --dir's
+filesystem; fsync cost depends heavily on the disk.
+
+Run from the server directory:
+    python benchmarks/bench_wal.py [--clients 50 --requests 40 --batch-size 20]
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import AnalyticsBatch, AnalyticsEvent
+from utils.aggregates import RealtimeAggregates
+from utils.event_store import EventStore, EVENT_TYPES
+from utils.ingest import IngestQueue
+from utils.wal import WriteAheadLog, DURABILITY_MODES
+
+
+def make_batch(rng: random.Random, adid: str, batch_size: int) -> AnalyticsBatch:
+    events = []
+    for i in range(batch_size):
+        event_type = rng.choice(EVENT_TYPES)
+        product = rng.randrange(200)
+        events.append(AnalyticsEvent(
+            eventType=event_type, productId=f"prod-{product}", productName=f"Product {product}", timestamp=i,
+            viewDuration=rng.randint(100, 20000) if event_type in ("view", "view_end") else None,
+        ))
+    return AnalyticsBatch(adid=adid, events=events)
+
+
+async def run(mode: str, directory: str, clients: int, requests: int, batch_size: int):
+    rng = random.Random(42)
+    batches = [[make_batch(rng, f"adid-{c}", batch_size) for _ in range(requests)] for c in range(clients)]
+    wal = None
+    if mode != "off":
+        wal = WriteAheadLog(directory, mode)
+        wal.open()
+        wal.start()
+    queue = IngestQueue(EventStore(), [RealtimeAggregates()], max_events=10**9)
+    queue.start()
+    latencies = []
+
+    async def client(requests):
+        # Same work as the /analytics-events handler
+        for batch in requests:
+            start = time.perf_counter()
+            queue.offer(batch.adid, batch.events)
+            if wal is not None:
+                await wal.append({
+                    "type": "events",
+                    "adid": batch.adid,
+                    "receivedAt": time.time(),
+                    "events": [
+                        [event.eventType, event.productId, event.productName, event.timestamp, event.viewDuration]
+                        for event in batch.events
+                    ],
+                })
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client(requests) for requests in batches))
+    elapsed = time.perf_counter() - start
+    await queue.stop()
+    fsyncs = 0
+    if wal is not None:
+        await wal.close()
+        fsyncs = wal.fsyncs
+    return elapsed, np.array(latencies), fsyncs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=40, help="requests per client")
+    parser.add_argument("--batch-size", type=int, default=20)
+    parser.add_argument("--dir", default=None, help="parent directory for the temporary WAL")
+    parser.add_argument("--modes", nargs="+", default=["off", *DURABILITY_MODES])
+    args = parser.parse_args()
+
+    total_requests = args.clients * args.requests
+    total_events = total_requests * args.batch_size
+    print(f"{args.clients} clients x {args.requests} requests x {args.batch_size} events")
+    print(f"{'mode':>6} {'events/s':>12} {'requests/s':>11} {'p50':>9} {'p99':>9} {'fsyncs':>7}")
+    for mode in args.modes:
+        with tempfile.TemporaryDirectory(dir=args.dir) as directory:
+            elapsed, latencies, fsyncs = asyncio.run(
+                run(mode, directory, args.clients, args.requests, args.batch_size)
+            )
+        print(f"{mode:>6} {total_events / elapsed:>12,.0f} {total_requests / elapsed:>11,.0f} "
+              f"{np.percentile(latencies, 50) * 1000:>7.2f}ms {np.percentile(latencies, 99) * 1000:>7.2f}ms "
+              f"{fsyncs:>7}")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,9 +2,101 @@
 Configuration and shared data structures
 """
 from collections import defaultdict
+import os
+
+from utils.event_store import EventStore
+from utils.aggregates import RealtimeAggregates, RevenueAggregates
+from utils.cache import ResponseCache
+from utils.hll import HyperLogLog
+from utils.ingest import IngestQueue
+from utils.singleflight import SingleFlight
+from utils.live import LiveFeed
+from utils.rollups import TimeRollups, MINUTE, HOUR, DAY, parse_window
+from utils.wal import WriteAheadLog
+
+# Logging: LOG_LEVEL (DEBUG shows per-event lines), LOG_JSON=1 for JSON lines,
+# LOG_SAMPLE_RATE=N keeps 1 in N per-event / per-item lines
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO")
+LOG_JSON = os.environ.get("LOG_JSON", "0") == "1"
+LOG_SAMPLE_RATE = int(os.environ.get("LOG_SAMPLE_RATE", "1"))
+
+# Write-ahead log: WAL_MODE is none (no fsync), group (group commit, default) or fsync
+# (per request); "off" keeps everything in memory only
+WAL_DIR = os.environ.get("WAL_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "wal"))
+WAL_MODE = os.environ.get("WAL_MODE", "group")
+
+# Snapshots (with the WAL enabled): taken every SNAPSHOT_INTERVAL seconds or SNAPSHOT_RECORDS
+# log records, whichever comes first; startup loads the latest one and replays the log tail
+SNAPSHOT_DIR = os.environ.get("SNAPSHOT_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "snapshots"))
+SNAPSHOT_INTERVAL = float(os.environ.get("SNAPSHOT_INTERVAL", "300"))
+SNAPSHOT_RECORDS = int(os.environ.get("SNAPSHOT_RECORDS", "50000"))
+
+
+def _retention(name: str, default: str):
+    """Retention period from the environment (e.g. 2d, 90d); 0 keeps data forever"""
+    seconds = parse_window(os.environ.get(name, default))
+    return seconds if seconds > 0 else None
+
+
+# Event store: every EVENT_SEGMENT_EVENTS events are sealed into memory-mapped column files
+# under EVENT_SEGMENT_DIR (0 keeps all events on the heap); sealed raw events are deleted
+# after EVENT_RETENTION
+EVENT_SEGMENT_DIR = os.environ.get("EVENT_SEGMENT_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "segments"))
+EVENT_SEGMENT_EVENTS = int(os.environ.get("EVENT_SEGMENT_EVENTS", "1000000"))
+EVENT_RETENTION = _retention("EVENT_RETENTION", "30d")
+
+# Dashboard rollups: minute buckets kept for ROLLUP_MINUTE_RETENTION, hour buckets for
+# ROLLUP_HOUR_RETENTION, day buckets for ROLLUP_DAY_RETENTION (0 = forever)
+ROLLUP_RETENTION = {
+    MINUTE: _retention("ROLLUP_MINUTE_RETENTION", "2d"),
+    HOUR: _retention("ROLLUP_HOUR_RETENTION", "90d"),
+    DAY: _retention("ROLLUP_DAY_RETENTION", "0"),
+}
+
+# Unique ADIDs per product and products viewed/clicked per ADID: DISTINCT_COUNTING is exact
+# (sets) or hll (HyperLogLog sketches: exact up to 512 values, then ~1.6% standard error
+# in 4 KiB each); existing snapshots keep the mode they were taken with
+DISTINCT_COUNTING = os.environ.get("DISTINCT_COUNTING", "exact")
+if DISTINCT_COUNTING not in ("exact", "hll"):
+    raise ValueError(f"DISTINCT_COUNTING must be exact or hll, not {DISTINCT_COUNTING!r}")
+DISTINCT = HyperLogLog if DISTINCT_COUNTING == "hll" else set
+
+# Dashboard tables (top products by clicks / view time / revenue, top ADIDs by revenue) are
+# served from rankings of the RANKING_SIZE largest rows, kept up to date on ingest (0 sorts
+# all rows on every request instead)
+RANKING_SIZE = int(os.environ.get("RANKING_SIZE", "100"))
+
+# Live realtime dashboard: changes are pushed to open pages every LIVE_INTERVAL seconds
+# (0 turns the push channel off; pages then reload every few seconds)
+LIVE_INTERVAL = float(os.environ.get("LIVE_INTERVAL", "1"))
 
 # In-memory storage for demo purposes
 coupon_history = []
 purchase_history = []
-analytics_events = []  # Store all analytics events
+event_store = EventStore(  # Store all analytics events (columnar)
+    EVENT_SEGMENT_DIR if EVENT_SEGMENT_EVENTS > 0 else None, EVENT_SEGMENT_EVENTS, EVENT_RETENTION
+)
+realtime_aggregates = RealtimeAggregates(DISTINCT, RANKING_SIZE)  # /analytics-realtime counters, updated on ingest
+revenue_aggregates = RevenueAggregates(RANKING_SIZE)  # /analytics revenue and tracker-uplift totals
+time_rollups = TimeRollups(ROLLUP_RETENTION, DISTINCT)  # Minute/hour/day buckets of both, for windowed queries
+
+# Deltas for the live dashboard, published on an interval to /analytics-realtime/stream
+live_feed = LiveFeed(realtime_aggregates, LIVE_INTERVAL) if LIVE_INTERVAL > 0 else None
+
+# /analytics-events enqueues here; a consumer task stores and aggregates in bulk (the live
+# feed goes first, it tells new ADIDs by their absence from the realtime aggregates)
+event_ingest = IngestQueue(
+    event_store, ([live_feed] if live_feed is not None else []) + [realtime_aggregates, time_rollups],
+    max_events=100_000
+)
+
+# Rendered dashboard pages and list bodies by data version, with ETags for conditional GETs
+# (bodies gzipped from the same size as main.py's GZipMiddleware)
+response_cache = ResponseCache(maxsize=64, max_bytes=16 << 20, gzip_min_size=1024)
+
+# Concurrent identical dashboard requests share one computation (page renders, similarity graphs)
+request_flights = SingleFlight()
 
+# Coupons, purchases and event batches are logged here before they are acknowledged,
+# and replayed into the stores above on startup
+write_ahead_log = WriteAheadLog(WAL_DIR, WAL_MODE) if WAL_MODE != "off" else None
@@ -5,10 +5,18 @@ Run with: uvicorn main:app --reload --port 8080
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.responses import HTMLResponse
 from fastapi.staticfiles import StaticFiles
 import os
 
+from config import LOG_LEVEL, LOG_JSON, LOG_SAMPLE_RATE
+from utils.log import get_logger, setup_logging, shutdown_logging
+
+# Log through a background writer thread instead of printing in request handlers
+setup_logging(LOG_LEVEL, json_lines=LOG_JSON, sample_rate=LOG_SAMPLE_RATE)
+logger = get_logger("main")
+
 # Initialize FastAPI app
 app = FastAPI(title="DemoShop Coupon API")
 
@@ -26,14 +34,42 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Compress larger responses (graph JSON, analytics pages)
+app.add_middleware(GZipMiddleware, minimum_size=1024)
+
 # Import routes after app initialization to avoid circular imports
 from routes import coupon, analytics, similarity
+from config import event_store, event_ingest, write_ahead_log, live_feed
+import persistence
 
 # Register routes
 app.include_router(coupon.router)
 app.include_router(analytics.router)
 app.include_router(similarity.router)
 
+@app.on_event("startup")
+async def start_background_workers():
+    if write_ahead_log is not None:
+        persistence.recover()
+        write_ahead_log.open()
+        write_ahead_log.start()
+        persistence.start_snapshots()
+    event_ingest.start()
+    if live_feed is not None:
+        live_feed.start()
+    similarity.similarity_worker.start()
+
+@app.on_event("shutdown")
+async def stop_background_workers():
+    if live_feed is not None:
+        await live_feed.stop()
+    await event_ingest.stop()
+    if write_ahead_log is not None:
+        await persistence.stop_snapshots()
+        await write_ahead_log.close()
+    await similarity.similarity_worker.stop()
+    shutdown_logging()
+
 @app.get("/", response_class=HTMLResponse)
 async def root():
     """Main analytics dashboard index"""
@@ -44,7 +80,18 @@ async def root():
 async def health_check():
     return {"status": "healthy"}
 
+@app.get("/persistence/status")
+async def persistence_status():
+    """Startup recovery timings, last snapshot, WAL counters and event store segments (for debugging)"""
+    return {
+        "event_store": event_store.stats(),
+        "recovery": persistence.recovery_stats,
+        "last_snapshot": persistence.last_snapshot,
+        "wal": write_ahead_log.stats() if write_ahead_log is not None else None
+    }
+
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8080)
+    # Open live streams never end by themselves; cancel them after 5s so shutdown can proceed
+    uvicorn.run(app, host="0.0.0.0", port=8080, timeout_graceful_shutdown=5)
 
@@ -1,7 +1,7 @@
 """
 Pydantic models for API requests and responses
 """
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import List
 
 class CouponRequest(BaseModel):
@@ -34,8 +34,10 @@ class AnalyticsEvent(BaseModel):
     eventType: str  # 'view', 'click'
     productId: str
     productName: str
-    timestamp: int
-    viewDuration: int | None = None
+    # Bounded to what the int64 event-store columns hold; -1 is the store's
+    # "no duration" sentinel, so a client can't send it.
+    timestamp: int = Field(ge=0, lt=2**63)
+    viewDuration: int | None = Field(default=None, ge=0, lt=2**63)
 
 class AnalyticsBatch(BaseModel):
     adid: str
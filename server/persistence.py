@@ -0,0 +1,227 @@
+"""
+Periodic snapshots and fast startup: latest snapshot + write-ahead log tail
+"""
+from typing import Dict, Optional
+import asyncio
+import os
+import pickle
+import signal
+import time
+import traceback
+
+from config import (
+    DISTINCT, RANKING_SIZE, SNAPSHOT_DIR, SNAPSHOT_INTERVAL, SNAPSHOT_RECORDS,
+    coupon_history, purchase_history, event_store, event_ingest, realtime_aggregates, revenue_aggregates,
+    time_rollups, write_ahead_log,
+)
+from models import AnalyticsEvent
+from routes.coupon import apply_coupon, apply_purchase
+from utils.log import get_logger
+from utils.snapshot import latest_snapshot, load_snapshot, save_snapshot, snapshot_path
+
+logger = get_logger("persistence")
+
+# Seconds between checks whether a snapshot is due
+SNAPSHOT_CHECK_INTERVAL = 5.0
+
+last_snapshot = {"lsn": 0, "time": time.time(), "path": None}
+recovery_stats: Dict = {}
+
+_snapshot_task: Optional[asyncio.Task] = None
+_stopping: Optional[asyncio.Event] = None
+
+
+def apply_record(record: dict):
+    """Apply one write-ahead log record to the in-memory stores"""
+    kind = record["type"]
+    if kind == "events":
+        events = [
+            AnalyticsEvent.model_construct(eventType=event_type, productId=product_id,
+                                           productName=product_name, timestamp=timestamp,
+                                           viewDuration=view_duration)
+            for event_type, product_id, product_name, timestamp, view_duration in record["events"]
+        ]
+        event_store.append_batch(record["adid"], events, record["receivedAt"])
+        realtime_aggregates.add_batch(record["adid"], events, record["receivedAt"])
+        time_rollups.add_batch(record["adid"], events, record["receivedAt"])
+    elif kind == "purchase":
+        apply_purchase(record["purchase"])
+    elif kind == "coupon":
+        apply_coupon(record["coupon"])
+
+
+def recover() -> Dict:
+    """
+    Rebuild the in-memory stores at startup.
+
+    Loads the newest snapshot (column files are read straight into arrays,
+    aggregates are unpickled), then replays only the log records written
+    after it. Startup cost is bounded by the snapshot size plus at most
+    SNAPSHOT_RECORDS / SNAPSHOT_INTERVAL worth of log, not by total history.
+    A record that fails to apply is logged with its lsn and skipped.
+    """
+    start = time.perf_counter()
+    path = latest_snapshot(SNAPSHOT_DIR)
+    lsn = 0
+    if path is not None:
+        lsn, state = load_snapshot(path, event_store)
+        vars(realtime_aggregates).update(state["realtime"])
+        vars(revenue_aggregates).update(state["revenue"])
+        # Rankings are derived from the rows; rebuilding them picks up a changed RANKING_SIZE
+        realtime_aggregates.rank(RANKING_SIZE)
+        revenue_aggregates.rank(RANKING_SIZE)
+        time_rollups.restore(state["rollups"])
+        if realtime_aggregates.distinct is not DISTINCT:
+            logger.warning("Snapshot uses %s distinct counting, keeping it over DISTINCT_COUNTING",
+                           realtime_aggregates.distinct.__name__)
+        coupon_history[:] = state["coupons"]
+        purchase_history[:] = state["purchases"]
+    loaded = time.perf_counter()
+
+    replayed = skipped = 0
+    for record in write_ahead_log.replay(after_lsn=lsn):
+        try:
+            apply_record(record)
+        except Exception:
+            # One bad record must not keep the server from starting
+            skipped += 1
+            logger.exception("Skipping log record %s (%s) that could not be applied",
+                             record.get("lsn"), record.get("type"),
+                             extra={"fields": {"lsn": record.get("lsn"), "type": record.get("type")}})
+            continue
+        replayed += 1
+    # The snapshot's records may all be pruned from the log; numbering must continue after it
+    write_ahead_log.lsn = max(write_ahead_log.lsn, lsn)
+    done = time.perf_counter()
+
+    last_snapshot.update(lsn=lsn, time=time.time(), path=path)
+    recovery_stats.update({
+        "snapshot": path,
+        "snapshot_lsn": lsn,
+        "snapshot_seconds": round(loaded - start, 3),
+        "replayed_records": replayed,
+        "skipped_records": skipped,
+        "replay_seconds": round(done - loaded, 3),
+        "total_seconds": round(done - start, 3),
+        "events": len(event_store),
+    })
+    logger.info("Recovered %d events in %.2fs (snapshot %s in %.2fs, %d log records in %.2fs, %d skipped)",
+                len(event_store), done - start, path or "none", loaded - start, replayed, done - loaded,
+                skipped, extra={"fields": recovery_stats})
+    return recovery_stats
+
+
+def _state() -> bytes:
+    """The pickled non-columnar state"""
+    return pickle.dumps({
+        "realtime": vars(realtime_aggregates),
+        "revenue": vars(revenue_aggregates),
+        "rollups": time_rollups,
+        "coupons": coupon_history,
+        "purchases": purchase_history,
+    }, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def _write_forked(lsn: int):
+    """
+    In the forked child: write the snapshot from the copy-on-write image of the parent, then exit.
+
+    The parent forks with other threads running (the log listener, executor
+    and WAL commit threads), and only this thread exists in the child. Any
+    lock one of them held at fork time stays held here forever, so the child
+    only pickles plain data, writes and fsyncs files, and leaves with
+    os._exit: no logging, no sys.stdout/stderr (their buffers have locks the
+    listener thread takes), no executors, no event loop, no atexit handlers.
+    """
+    code = 1
+    try:
+        # Signals (Ctrl+C reaches the whole process group) are the parent's business
+        signal.set_wakeup_fd(-1)
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        save_snapshot(SNAPSHOT_DIR, lsn, event_store, _state())
+        code = 0
+    except BaseException:
+        # Straight to fd 2; the parent logs the non-zero exit status
+        os.write(2, traceback.format_exc().encode(errors="replace"))
+    finally:
+        os._exit(code)
+
+
+async def take_snapshot() -> Optional[str]:
+    """
+    Snapshot everything covered by the log so far, then prune old log segments.
+
+    The state has to be captured at one point on the event loop: handlers
+    apply a record right after submitting it to the log, so after draining
+    the ingest queue every record up to write_ahead_log.lsn is applied.
+    Pickling the aggregates and histories takes seconds once they are large
+    (a Python-level copy of them is slower still), so where os.fork exists
+    the copy is the fork: the child pickles and writes its copy-on-write
+    image while the loop goes on. Elsewhere the state is pickled on the loop
+    and only the files are written in a worker thread.
+    """
+    event_ingest.drain()
+    lsn = write_ahead_log.lsn
+    if lsn == last_snapshot["lsn"]:
+        return None
+
+    loop = asyncio.get_running_loop()
+    start = time.perf_counter()
+    events = len(event_store)
+    if hasattr(os, "fork"):
+        pid = os.fork()
+        if pid == 0:
+            _write_forked(lsn)
+        captured = time.perf_counter()
+        _, status = await loop.run_in_executor(None, os.waitpid, pid, 0)
+        if os.waitstatus_to_exitcode(status) != 0:
+            raise RuntimeError(f"Snapshot writer exited with status {os.waitstatus_to_exitcode(status)}")
+        path = snapshot_path(SNAPSHOT_DIR, lsn)
+    else:
+        store = event_store.snapshot()
+        state = _state()
+        captured = time.perf_counter()
+        path = await loop.run_in_executor(None, save_snapshot, SNAPSHOT_DIR, lsn, store, state)
+    last_snapshot.update(lsn=lsn, time=time.time(), path=path)
+    removed = write_ahead_log.prune(lsn)
+    logger.info("Snapshot %s: %d events, captured in %.3fs, written in %.2fs, %d log segments pruned",
+                path, events, captured - start, time.perf_counter() - captured, removed)
+    return path
+
+
+def snapshot_due() -> bool:
+    behind = write_ahead_log.lsn - last_snapshot["lsn"]
+    return behind >= SNAPSHOT_RECORDS or (behind > 0 and time.time() - last_snapshot["time"] >= SNAPSHOT_INTERVAL)
+
+
+async def _snapshot_loop():
+    while True:
+        try:
+            await asyncio.wait_for(_stopping.wait(), SNAPSHOT_CHECK_INTERVAL)
+            return
+        except asyncio.TimeoutError:
+            pass
+        if snapshot_due():
+            try:
+                await take_snapshot()
+            except Exception:
+                logger.exception("Snapshot failed")
+
+
+def start_snapshots():
+    global _snapshot_task, _stopping
+    if _snapshot_task is None:
+        _stopping = asyncio.Event()
+        _snapshot_task = asyncio.get_running_loop().create_task(_snapshot_loop())
+
+
+async def stop_snapshots():
+    """Stop the periodic task and take a final snapshot so the next start replays nothing"""
+    global _snapshot_task
+    if _snapshot_task is not None:
+        # Let a snapshot that is being written finish instead of cancelling it halfway
+        _stopping.set()
+        await _snapshot_task
+        _snapshot_task = None
+    await take_snapshot()
@@ -1,22 +1,51 @@
 """
 Coupon and Purchase endpoints
 """
-from fastapi import APIRouter
+from fastapi import APIRouter, HTTPException, Request
 from datetime import datetime
+import logging
+import time
 
 from models import CouponRequest, CouponResponse, PurchaseRequest, PurchaseResponse, AnalyticsBatch
-from config import coupon_history, purchase_history, analytics_events
-from utils.helpers import generate_coupon_id, generate_purchase_id
+from config import (
+    coupon_history, purchase_history, event_ingest, realtime_aggregates, revenue_aggregates,
+    time_rollups, write_ahead_log, live_feed, request_flights, response_cache,
+)
+from utils.helpers import generate_coupon_id, generate_purchase_id, json_body
+from utils.log import get_logger
 
 router = APIRouter()
+logger = get_logger("coupon")
+
+
+def log_record(record: dict):
+    """
+    Submit a record to the WAL; returns an awaitable to wait on before acknowledging, or None.
+
+    Callers apply the record to the in-memory stores right after this (before
+    awaiting), so snapshots always cover exactly the records logged so far.
+    """
+    if write_ahead_log is None:
+        return None
+    return write_ahead_log.submit(record)
+
+
+def apply_coupon(coupon_record: dict):
+    coupon_history.append(coupon_record)
+
+
+def apply_purchase(purchase_record: dict):
+    purchase_history.append(purchase_record)
+    realtime_aggregates.add_purchase(purchase_record)
+    revenue_aggregates.add_purchase(purchase_record)
+    time_rollups.add_purchase(purchase_record)
+    if live_feed is not None:
+        live_feed.add_purchase(purchase_record)
+
 
 @router.post("/coupon", response_model=CouponResponse)
 async def create_coupon(request: CouponRequest):
     """Create a discount coupon for a product"""
-    print(f"[Server] Received coupon request:")
-    print(f"  - ADID: {request.adid}")
-    print(f"  - Product: {request.productName}")
-    
     coupon_id = generate_coupon_id()
     discount = 0.2  # 20% discount
     
@@ -27,31 +56,30 @@ async def create_coupon(request: CouponRequest):
         "discount": discount,
         "timestamp": datetime.now().isoformat()
     }
-    coupon_history.append(coupon_record)
+    committed = log_record({"type": "coupon", "coupon": coupon_record})
+    apply_coupon(coupon_record)
+    if committed is not None:
+        await committed
     
-    print(f"[Server] Sending coupon: {coupon_id} - {discount * 100}%")
+    logger.info("Sending coupon %s (%s%%) to ADID %s for %s", coupon_id, discount * 100,
+                request.adid, request.productName,
+                extra={"fields": {"coupon_id": coupon_id, "adid": request.adid,
+                                  "product": request.productName, "discount": discount}})
     
     return CouponResponse(couponId=coupon_id, discount=discount)
 
 @router.get("/coupons")
-async def get_coupon_history():
+async def get_coupon_history(request: Request):
     """Get all issued coupons (for debugging)"""
-    return {
+    # The history is append-only, so its length is its version
+    return response_cache.respond(request, ("/coupons",), len(coupon_history), "application/json", lambda: json_body({
         "total": len(coupon_history),
         "coupons": coupon_history
-    }
+    }))
 
 @router.post("/purchase", response_model=PurchaseResponse)
 async def record_purchase(request: PurchaseRequest):
     """Record a purchase"""
-    print(f"[Server] Received purchase:")
-    print(f"  - ADID: {request.adid}")
-    print(f"  - Items: {len(request.items)}")
-    for item in request.items:
-        print(f"    • {item.id} - {item.name}: ${item.finalPrice:.2f}")
-    print(f"  - Total: ${request.total:.2f}")
-    print(f"  - Tracker: {'ON' if request.trackerEnabled else 'OFF'}")
-    
     purchase_id = generate_purchase_id()
     
     purchase_record = {
@@ -62,9 +90,22 @@ async def record_purchase(request: PurchaseRequest):
         "trackerEnabled": request.trackerEnabled,
         "timestamp": datetime.now().isoformat()
     }
-    purchase_history.append(purchase_record)
+    committed = log_record({"type": "purchase", "purchase": purchase_record})
+    apply_purchase(purchase_record)
+    if committed is not None:
+        await committed
     
-    print(f"[Server] Purchase recorded: {purchase_id}")
+    logger.info("Purchase recorded: %s, ADID %s, %d items, $%.2f, tracker %s",
+                purchase_id, request.adid, len(request.items), request.total,
+                "ON" if request.trackerEnabled else "OFF",
+                extra={"fields": {"purchase_id": purchase_id, "adid": request.adid,
+                                  "items": len(request.items), "total": request.total,
+                                  "tracker_enabled": request.trackerEnabled}})
+    if logger.isEnabledFor(logging.DEBUG):
+        for item in request.items:
+            logger.debug("  • %s - %s: $%.2f", item.id, item.name, item.finalPrice,
+                         extra={"sampled": True, "fields": {"purchase_id": purchase_id, "item": item.id,
+                                                            "final_price": item.finalPrice}})
     
     return PurchaseResponse(
         success=True,
@@ -73,34 +114,50 @@ async def record_purchase(request: PurchaseRequest):
     )
 
 @router.get("/purchases")
-async def get_purchase_history():
+async def get_purchase_history(request: Request):
     """Get all purchases (for debugging)"""
-    return {
+    return response_cache.respond(request, ("/purchases",), len(purchase_history), "application/json", lambda: json_body({
         "total": len(purchase_history),
         "purchases": purchase_history
-    }
+    }))
 
 @router.post("/analytics-events")
 async def receive_analytics_events(batch: AnalyticsBatch):
-    """Receive a batch of analytics events from SDK"""
-    print(f"[Server] Received {len(batch.events)} events from ADID: {batch.adid}")
-    
-    for event in batch.events:
-        event_record = {
-            "adid": batch.adid,
-            "eventType": event.eventType,
-            "productId": event.productId,
-            "productName": event.productName,
-            "timestamp": event.timestamp,
-            "viewDuration": event.viewDuration,
-            "receivedAt": datetime.now().isoformat()
-        }
-        analytics_events.append(event_record)
-        
-        if event.viewDuration is not None:
-            print(f"  - {event.eventType}: {event.productId} - {event.productName} (duration: {event.viewDuration}ms)")
-        else:
-            print(f"  - {event.eventType}: {event.productId} - {event.productName}")
+    """
+    Receive a batch of analytics events from SDK
+
+    The batch is stamped with its receive time and only queued (and written to
+    the WAL) here; the ingest consumer stores and aggregates queued batches in
+    bulk. Answers 503 + Retry-After when the queue is full.
+    """
+    received_at = time.time()
+    if not event_ingest.offer(batch.adid, batch.events, received_at):
+        raise HTTPException(
+            status_code=503,
+            detail="Event queue is full, retry later",
+            headers={"Retry-After": str(event_ingest.retry_after)}
+        )
+    committed = log_record({
+        "type": "events",
+        "adid": batch.adid,
+        "receivedAt": received_at,
+        "events": [
+            [event.eventType, event.productId, event.productName, event.timestamp, event.viewDuration]
+            for event in batch.events
+        ],
+    })
+    if committed is not None:
+        await committed
     
     return {"success": True, "eventsReceived": len(batch.events)}
 
+@router.get("/analytics-events/status")
+async def get_ingest_status():
+    """Ingest queue depth, WAL, live feed, response cache and counters (for debugging)"""
+    return {
+        **event_ingest.stats(),
+        "wal": write_ahead_log.stats() if write_ahead_log is not None else None,
+        "live": live_feed.stats() if live_feed is not None else None,
+        "response_cache": response_cache.stats(),
+        "single_flight": request_flights.stats()
+    }
@@ -1,367 +1,268 @@
 """
-Product similarity graph endpoint
+Product similarity graph endpoints
 """
-from fastapi import APIRouter
-from fastapi.responses import HTMLResponse
-from collections import defaultdict
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import HTMLResponse, Response
+from datetime import datetime
 import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
-import plotly.graph_objects as go
-import networkx as nx
 import json
+import os
+from typing import Literal, Optional
+import bisect
+import time
 
-from config import analytics_events, purchase_history
+from config import event_store, purchase_history, request_flights, response_cache
+from routes.analytics import time_window
+from utils.cache import VersionedLRUCache
+from utils.layout import incremental_layout
+from utils.rollups import parse_window
+from utils.similarity_worker import SimilarityWorker
+from utils.similarity import (
+    build_engagement_matrix, engagement_totals, nearest_neighbors, neighbor_edges, product_neighbors,
+    similarity_pairs,
+)
 
 router = APIRouter()
 
+# Serialized graph pages, valid until the worker publishes a newer graph for their parameters
+graph_cache = VersionedLRUCache(maxsize=64, evict_stale=False)
+# Neighbor lists, valid until the event store changes
+neighbor_cache = VersionedLRUCache(maxsize=64)
+
+
 @router.get("/product-similarity", response_class=HTMLResponse)
-async def get_product_similarity(threshold: float = 0.1):
+async def get_product_similarity(request: Request):
     """
     Display interactive product similarity graph based on user engagement
+
+    The page is a static shell; graph.js draws the graph from /product-similarity.json
+    using the same query parameters.
+    """
+    def render() -> bytes:
+        with open(os.path.join(os.path.dirname(os.path.dirname(__file__)), "templates", "product_similarity.html"), "rb") as f:
+            return f.read()
+    return response_cache.respond(request, ("/product-similarity",), 0, "text/html; charset=utf-8", render)
+
+
+@router.get("/product-similarity.json")
+async def get_product_similarity_json(
+    request: Request,
+    threshold: float = 0.1,
+    backend: Literal["auto", "dense", "sparse"] = "auto",
+    top_k: Optional[int] = Query(None, ge=1),
+    offset: int = Query(0, ge=0),
+    limit: Optional[int] = Query(None, ge=1),
+    positions: bool = True,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    window: Optional[str] = None,
+):
+    """
+    Product similarity graph as JSON: nodes, edges and (optionally) layout positions
+
+    Edges are ordered by similarity, strongest first, and can be paged with offset/limit.
+    since/until/window restrict it to events received in that time range.
+    The graph is computed by the background worker; this serves its latest completed result.
+    """
+    similarity_threshold = max(0.0, min(1.0, threshold))  # Clamp between 0 and 1
+    time_range = window_params(since, until, window)
+    result = await similarity_worker.get((similarity_threshold, backend, top_k, *time_range))
+
+    # Serialized bodies are reused until the worker publishes a newer graph
+    key = ("graph", similarity_threshold, backend, top_k, *time_range, offset, limit, positions)
+    headers = {
+        **response_cache.headers(key, result.version),
+        "X-Similarity-Age": f"{result.age:.1f}",
+        "X-Similarity-Version": str(result.version),
+    }
+    if response_cache.not_modified(request, key, result.version):
+        return Response(status_code=304, headers=headers)
+    body = graph_cache.get(key, result.version)
+    if body is None:
+        graph = result.content
+        end = None if limit is None else offset + limit
+        payload = {
+            **graph["stats"],
+            "total_edges": len(graph["edges"]),
+            "offset": offset,
+            "limit": limit,
+            "nodes": graph["nodes"],
+            "edges": graph["edges"][offset:end],
+        }
+        if positions:
+            payload["positions"] = graph["positions"]
+        body = json.dumps(payload, separators=(",", ":"))
+        graph_cache.put(key, result.version, body)
+
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+def window_params(since: Optional[str], until: Optional[str], window: Optional[str]) -> tuple:
+    """
+    (since, until, window_seconds) for the worker's parameter key.
+
+    A rolling window stays a duration, resolved against the clock each time the
+    graph is recomputed, so one cached result serves every request for it.
     """
+    start, end = time_window(since, until, window)
+    if window is not None:
+        return None, end, parse_window(window)
+    return start, end, None
+
+
+def compute_similarity_graph(store, similarity_threshold: float, backend: str, top_k: Optional[int],
+                             since: Optional[float] = None, until: Optional[float] = None,
+                             window: Optional[float] = None, previous: Optional[dict] = None) -> dict:
+    """
+    Compute product similarity and a force layout; edges are sorted strongest first
+
+    since/until (epoch seconds) or a rolling window (seconds before until/now) limit
+    the events used. previous maps product name -> [x, y] from the last graph for
+    these parameters; the layout warm-starts from it so existing products keep their place.
+    """
+    if window is not None:
+        since = (until if until is not None else time.time()) - window
     # Build user-product engagement matrix
     # Each product has a vector of user engagement scores
-    
-    # Collect all products and users
-    all_products = set()
-    all_users = set()
-    
-    for event in analytics_events:
-        product_id = event.get("productId", "unknown")
-        product_name = event["productName"]
-        product_key = f"{product_id} - {product_name}"
-        all_products.add(product_key)
-        all_users.add(event["adid"])
-    
-    # If no data, return empty message
-    if len(all_products) < 2:
-        return HTMLResponse(content="""
-            <html><body style="font-family: Arial; padding: 50px; text-align: center;">
-                <h1>Not enough data yet</h1>
-                <p>Need at least 2 products with user interactions to calculate similarity.</p>
-                <p><a href="/analytics-realtime">Go back to Analytics</a></p>
-            </body></html>
-        """)
-    
-    products_list = sorted(list(all_products))
-    users_list = sorted(list(all_users))
-    
-    # Build engagement matrix: rows=products, cols=users
     # Weight: Each click = 10 points, Each second of view = 0.1 points
-    # This gives clicks 100x more weight than views (80/20 effective ratio)
-    engagement_matrix = np.zeros((len(products_list), len(users_list)))
+    # backend: "dense" ndarray, "sparse" CSR (memory scales with engaged pairs), or "auto"
+    products_list, users_list, engagement_matrix = build_engagement_matrix(store, backend, since, until)
     
-    for event in analytics_events:
-        product_id = event.get("productId", "unknown")
-        product_name = event["productName"]
-        product_key = f"{product_id} - {product_name}"
-        adid = event["adid"]
-        
-        product_idx = products_list.index(product_key)
-        user_idx = users_list.index(adid)
-        
-        if event["eventType"] == "click":
-            # Each click contributes 10 points (high weight)
-            engagement_matrix[product_idx, user_idx] += 10.0
-        elif event["eventType"] == "view":
-            # Each second of view contributes 0.1 points (low weight)
-            view_duration = event.get("viewDuration", 0)
-            engagement_matrix[product_idx, user_idx] += (view_duration / 1000.0) * 0.1
+    stats = {
+        "total_products": len(products_list),
+        "total_users": len(users_list),
+        "threshold": similarity_threshold,
+        "backend": backend,
+        "top_k": top_k,
+        "since": since,
+        "until": until,
+        "computed_at": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+    }
+    
+    # Not enough data; the page shows a message instead of a graph
+    if len(products_list) < 2:
+        return {"stats": stats, "nodes": [], "edges": [], "positions": []}
     
     # Calculate similarity based on shared user engagement
     # This gives intuitive results: 100% = same users with same engagement, 0% = no shared users
-    n_products = len(products_list)
-    similarity_matrix = np.zeros((n_products, n_products))
-    
-    for i in range(n_products):
-        for j in range(i, n_products):
-            if i == j:
-                similarity_matrix[i, j] = 1.0
-            else:
-                # Get engagement vectors for both products
-                vec_i = engagement_matrix[i, :]
-                vec_j = engagement_matrix[j, :]
-                
-                # Calculate shared engagement (minimum of both)
-                shared_engagement = np.minimum(vec_i, vec_j).sum()
-                
-                # Calculate total engagement (maximum of both) 
-                total_engagement = np.maximum(vec_i, vec_j).sum()
-                
-                # Similarity = shared / total (Jaccard-like coefficient)
-                if total_engagement > 0:
-                    similarity = shared_engagement / total_engagement
-                else:
-                    similarity = 0.0
-                
-                similarity_matrix[i, j] = similarity
-                similarity_matrix[j, i] = similarity  # Symmetric
-    
-    # Build graph data (nodes and edges)
-    nodes = []
-    for i, product in enumerate(products_list):
-        total_engagement = np.sum(engagement_matrix[i, :])
-        nodes.append({
-            "id": i,
-            "name": product,
-            "engagement": float(total_engagement)
-        })
-    
-    # Build NetworkX graph for layout
-    G = nx.Graph()
-    for i, product in enumerate(products_list):
-        G.add_node(i, name=product, engagement=float(np.sum(engagement_matrix[i, :])))
-    
-    similarity_threshold = max(0.0, min(1.0, threshold))  # Clamp between 0 and 1
-    
-    edges = []
-    for i in range(len(products_list)):
-        for j in range(i + 1, len(products_list)):
-            similarity = similarity_matrix[i, j]
-            if similarity > similarity_threshold:
-                G.add_edge(i, j, weight=float(similarity))
-                edges.append({
-                    "source": i,
-                    "target": j,
-                    "similarity": float(similarity)
-                })
-    
-    # Use spring layout for node positions
-    if len(G.nodes()) > 0:
-        pos = nx.spring_layout(G, k=2, iterations=50, seed=42)
+    # Similarity = shared / total (Jaccard-like coefficient); only pairs above the threshold come back
+    if top_k is None:
+        source_idx, target_idx, similarities = similarity_pairs(engagement_matrix, similarity_threshold)
     else:
-        pos = {}
-    
-    # Create Plotly figure
-    edge_traces = []
-    for edge in G.edges(data=True):
-        x0, y0 = pos[edge[0]]
-        x1, y1 = pos[edge[1]]
-        similarity = edge[2]['weight']
-        
-        # Edge line
-        edge_trace = go.Scatter(
-            x=[x0, x1, None],
-            y=[y0, y1, None],
-            mode='lines',
-            line=dict(
-                width=2 + similarity * 6,
-                color=f'rgba(59, 130, 246, {0.3 + similarity * 0.5})'
-            ),
-            hoverinfo='text',
-            text=f'{similarity*100:.0f}%',
-            showlegend=False
-        )
-        edge_traces.append(edge_trace)
-        
-        # Edge label (similarity percentage)
-        mid_x = (x0 + x1) / 2
-        mid_y = (y0 + y1) / 2
-        edge_label = go.Scatter(
-            x=[mid_x],
-            y=[mid_y],
-            mode='text',
-            text=[f'{similarity*100:.0f}%'],
-            textfont=dict(size=10, color='#64748b'),
-            hoverinfo='skip',
-            showlegend=False
+        # Candidates come from shared users only, so this avoids the full P x P comparison
+        source_idx, target_idx, similarities = neighbor_edges(
+            *nearest_neighbors(engagement_matrix, top_k, similarity_threshold)
         )
-        edge_traces.append(edge_label)
-    
-    # Node trace
-    node_x = []
-    node_y = []
-    node_text = []
-    node_size = []
-    node_hover = []
-    
-    for node in G.nodes(data=True):
-        x, y = pos[node[0]]
-        node_x.append(x)
-        node_y.append(y)
-        node_text.append(node[1]['name'])
-        node_size.append(15 + np.sqrt(node[1]['engagement']) * 3)
-        node_hover.append(f"{node[1]['name']}<br>Engagement: {node[1]['engagement']:.1f}")
-    
-    node_trace = go.Scatter(
-        x=node_x,
-        y=node_y,
-        mode='markers+text',
-        marker=dict(
-            size=node_size,
-            color='#3b82f6',
-            line=dict(width=2, color='white')
-        ),
-        text=node_text,
-        textposition='top center',
-        textfont=dict(size=11, color='#0f172a', family='Inter, Arial'),
-        hoverinfo='text',
-        hovertext=node_hover,
-        showlegend=False
-    )
+    product_engagement = engagement_totals(engagement_matrix)
     
-    # Create figure
-    fig = go.Figure(data=edge_traces + [node_trace])
+    # Build graph data (nodes and edges)
+    nodes = [
+        {"id": i, "name": product, "engagement": round(float(product_engagement[i]), 3)}
+        for i, product in enumerate(products_list)
+    ]
+    order = np.argsort(-similarities, kind="stable")
+    edges = [
+        {"source": i, "target": j, "similarity": round(similarity, 4)}
+        for i, j, similarity in zip(
+            source_idx[order].tolist(), target_idx[order].tolist(), similarities[order].tolist()
+        )
+    ]
     
-    fig.update_layout(
-        showlegend=False,
-        hovermode='closest',
-        margin=dict(b=0, l=0, r=0, t=0),
-        xaxis=dict(showgrid=False, zeroline=False, showticklabels=False),
-        yaxis=dict(showgrid=False, zeroline=False, showticklabels=False),
-        plot_bgcolor='white',
-        height=700,
-        dragmode='pan',
-    )
+    # Force layout for node positions (coordinates in [-1, 1]), refined from the previous layout
+    pos = incremental_layout(products_list, source_idx, target_idx, similarities, previous)
+    positions = np.round(pos, 4).tolist()
     
-    # Convert to HTML
-    graph_html = fig.to_html(
-        include_plotlyjs='cdn', 
-        div_id='graph', 
-        config={
-            'displayModeBar': False,
-            'scrollZoom': False,
-            'doubleClick': False,
-            'displaylogo': False
-        }
+    return {"stats": stats, "nodes": nodes, "edges": edges, "positions": positions}
+
+
+def previous_positions(graph: dict) -> dict:
+    """Layout state carried into the next recomputation: product name -> [x, y]"""
+    return {node["name"]: xy for node, xy in zip(graph["nodes"], graph["positions"])}
+
+
+# Recomputes graphs in a worker process: when 500+ new events arrived or every 30s while behind
+similarity_worker = SimilarityWorker(
+    event_store, compute_similarity_graph, refresh_interval=30.0, min_new_events=500,
+    warm_start=previous_positions, flights=request_flights, route="/product-similarity.json",
+)
+
+
+@router.get("/product-similarity/status")
+async def get_similarity_status():
+    """Background similarity worker state and the age of each cached result (for debugging)"""
+    return {
+        "worker": similarity_worker.stats(),
+        "results": [
+            {
+                "threshold": params[0], "backend": params[1], "top_k": params[2],
+                "version": result.version, "age_seconds": round(result.age, 1),
+                "stale": result.version != event_store.version,
+            }
+            for params, result in similarity_worker.results.items()
+        ],
+        "graph_cache": graph_cache.stats(),
+        "neighbor_cache": neighbor_cache.stats(),
+        "single_flight": request_flights.stats()
+    }
+
+
+@router.get("/product-similarity/neighbors")
+async def get_product_neighbors(
+    threshold: float = 0.1,
+    top_k: int = Query(10, ge=1),
+    product: Optional[str] = None,
+):
+    """
+    Nearest-neighbor products by shared user engagement, as JSON
+
+    Returns up to top_k neighbors above the threshold for every product, or only for `product`.
+    """
+    similarity_threshold = max(0.0, min(1.0, threshold))
+    key = ("neighbors", similarity_threshold, top_k, product)
+    version = event_store.version
+    cached = neighbor_cache.get(key, version)
+    if cached is not None:
+        return cached
+
+    # Computed in the similarity worker's process pool, once for every identical request in flight
+    neighbors = await request_flights.do(
+        (key, version), lambda: similarity_worker.run(compute_neighbors, similarity_threshold, top_k, product),
+        route="/product-similarity/neighbors",
     )
-    
-    # Generate clean HTML
-    html_content = f"""
-    <!DOCTYPE html>
-    <html lang="en">
-    <head>
-        <meta charset="UTF-8">
-        <meta name="viewport" content="width=device-width, initial-scale=1.0">
-        <title>Product Similarity Graph - DemoShop Analytics</title>
-        <link rel="stylesheet" href="/static/css/common.css">
-        <style>
-            .graph-container {{
-                background: white;
-                padding: 30px;
-                border-radius: 12px;
-                box-shadow: 0 1px 3px rgba(0, 0, 0, 0.1);
-                margin-bottom: 24px;
-            }}
-            .legend {{
-                background: white;
-                padding: 25px;
-                border-radius: 12px;
-                box-shadow: 0 1px 3px rgba(0, 0, 0, 0.1);
-                margin-bottom: 24px;
-            }}
-            .legend h3 {{
-                color: #0f172a;
-                margin-bottom: 15px;
-                font-size: 18px;
-                font-weight: 600;
-            }}
-            .legend-item {{
-                display: flex;
-                align-items: center;
-                margin-bottom: 12px;
-                color: #475569;
-                font-size: 14px;
-            }}
-            .legend-color {{
-                width: 20px;
-                height: 20px;
-                border-radius: 50%;
-                margin-right: 12px;
-                flex-shrink: 0;
-            }}
-            .stats {{
-                background: white;
-                padding: 25px;
-                border-radius: 12px;
-                box-shadow: 0 1px 3px rgba(0, 0, 0, 0.1);
-            }}
-            .stats h3 {{
-                color: #0f172a;
-                margin-bottom: 15px;
-                font-size: 18px;
-                font-weight: 600;
-            }}
-            .stat-row {{
-                display: flex;
-                justify-content: space-between;
-                padding: 12px 0;
-                border-bottom: 1px solid #f1f5f9;
-            }}
-            .stat-row:last-child {{
-                border-bottom: none;
-            }}
-            .stat-label {{
-                font-weight: 500;
-                color: #475569;
-                font-size: 14px;
-            }}
-            .stat-value {{
-                color: #0f172a;
-                font-weight: 600;
-                font-size: 14px;
-            }}
-        </style>
-    </head>
-    <body>
-        <div class="container">
-            <a href="/" class="back-link">← Back to Dashboard</a>
-            
-            <div class="header">
-                <h1>🔗 Product Similarity Graph</h1>
-                <p>Visualizing product relationships based on user engagement patterns using Cosine Similarity</p>
-            </div>
-            
-            <div class="graph-container">
-                {graph_html}
-            </div>
-            
-            <div class="legend">
-                <h3>How to Interpret</h3>
-                <div class="legend-item">
-                    <div class="legend-color" style="background: #3b82f6;"></div>
-                    <span><strong>Blue Circles</strong>: Products (larger = more engagement)</span>
-                </div>
-                <div class="legend-item">
-                    <div class="legend-color" style="background: rgba(59, 130, 246, 0.5);"></div>
-                    <span><strong>Lines</strong>: Similarity connections (thicker = more similar)</span>
-                </div>
-                <div class="legend-item">
-                    <div class="legend-color" style="background: #64748b;"></div>
-                    <span><strong>Percentages</strong>: Similarity scores between products</span>
-                </div>
-                <div class="legend-item">
-                    <span style="margin-left: 32px;">💡 Hover over nodes for details | Close products = similar user behavior</span>
-                </div>
-            </div>
-            
-            <div class="stats">
-                <h3>Graph Statistics</h3>
-                <div class="stat-row">
-                    <span class="stat-label">Total Products:</span>
-                    <span class="stat-value">{len(products_list)}</span>
-                </div>
-                <div class="stat-row">
-                    <span class="stat-label">Total Users:</span>
-                    <span class="stat-value">{len(users_list)}</span>
-                </div>
-                <div class="stat-row">
-                    <span class="stat-label">Similarity Connections:</span>
-                    <span class="stat-value">{len(edges)}</span>
-                </div>
-                <div class="stat-row">
-                    <span class="stat-label">Similarity Threshold:</span>
-                    <span class="stat-value">{similarity_threshold:.1%}</span>
-                </div>
-                <div class="stat-row">
-                    <span class="stat-label">Algorithm:</span>
-                    <span class="stat-value">Cosine Similarity</span>
-                </div>
-            </div>
-        </div>
-    </body>
-    </html>
+    if neighbors is None:
+        raise HTTPException(status_code=404, detail=f"Unknown product: {product}")
+
+    result = {
+        "threshold": similarity_threshold,
+        "top_k": top_k,
+        "neighbors": neighbors
+    }
+    neighbor_cache.put(key, version, result)
+    return result
+
+
+def compute_neighbors(store, similarity_threshold: float, top_k: int, product: Optional[str] = None) -> Optional[dict]:
     """
-    
-    return HTMLResponse(content=html_content)
+    Product name -> its top_k neighbors above the threshold, for every product or only `product`
+
+    None when `product` is not in the store.
+    """
+    products_list, _, engagement_matrix = build_engagement_matrix(store, "sparse")
+
+    if product is not None:
+        position = bisect.bisect_left(products_list, product)
+        if position == len(products_list) or products_list[position] != product:
+            return None
+        # Score only the products that share a user with this one
+        targets, similarities = product_neighbors(engagement_matrix, position, top_k, similarity_threshold)
+        return {product: [
+            {"product": products_list[j], "similarity": similarity}
+            for j, similarity in zip(targets.tolist(), similarities.tolist())
+        ]}
 
+    neighbors = {name: [] for name in products_list}
+    if len(products_list) >= 2:
+        sources, targets, similarities = nearest_neighbors(engagement_matrix, top_k, similarity_threshold)
+        for i, j, similarity in zip(sources.tolist(), targets.tolist(), similarities.tolist()):
+            neighbors[products_list[i]].append({"product": products_list[j], "similarity": similarity})
+    return neighbors
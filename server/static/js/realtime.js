@@ -0,0 +1,207 @@
+// Real-time dashboard: the selector lists one page of ADIDs; a user's performance is fetched
+// when selected. The page defines windowQuery (its since/until/window parameters).
+const ADID_PAGE = 50;
+let searchTimer = null;
+
+function withWindow(url) {
+    return windowQuery ? url + (url.includes('?') ? '&' : '?') + windowQuery : url;
+}
+
+function scheduleSearch() {
+    clearTimeout(searchTimer);
+    searchTimer = setTimeout(searchAdids, 200);
+}
+
+async function searchAdids() {
+    const query = document.getElementById('adidSearch').value.trim();
+    const response = await fetch(withWindow(
+        `/analytics-realtime/adids?limit=${ADID_PAGE}&q=${encodeURIComponent(query)}`
+    ));
+    const page = await response.json();
+    const selector = document.getElementById('adidSelector');
+    const selected = selector.value || localStorage.getItem('selectedAdid');
+
+    let placeholder = 'Select a user (ADID) to view their performance...';
+    if (page.total === 0) {
+        placeholder = query ? 'No matching ADIDs' : 'No user activity yet';
+    }
+    selector.innerHTML = '';
+    selector.add(new Option(placeholder, ''));
+    page.adids.forEach(adid => selector.add(new Option(adid, adid)));
+    if (selected && page.adids.includes(selected)) {
+        selector.value = selected;
+    }
+
+    document.getElementById('adidCount').textContent = page.total > page.adids.length
+        ? `Showing ${page.adids.length} of ${page.total} ADIDs - type the start of an ADID to narrow down`
+        : '';
+}
+
+async function updateUserPerformance() {
+    const selector = document.getElementById('adidSelector');
+    const selectedAdid = selector.value;
+    const table = document.getElementById('userPerformanceTable');
+    const tbody = document.getElementById('userPerformanceBody');
+
+    // Store selection in localStorage
+    if (selectedAdid) {
+        localStorage.setItem('selectedAdid', selectedAdid);
+    } else {
+        localStorage.removeItem('selectedAdid');
+    }
+
+    if (!selectedAdid) {
+        table.style.display = 'none';
+        return;
+    }
+
+    const response = await fetch(withWindow(`/analytics-realtime/adid/${encodeURIComponent(selectedAdid)}`));
+    if (selector.value !== selectedAdid) {
+        return;  // another ADID was selected meanwhile
+    }
+    if (!response.ok) {
+        table.style.display = 'none';
+        return;
+    }
+    const performance = await response.json();
+
+    table.style.display = 'block';
+
+    // Products come sorted by clicks + purchases (descending)
+    let html = '';
+    performance.products.forEach(stats => {
+        const viewSeconds = (stats.view_duration / 1000).toFixed(1);
+        html += `
+            <tr>
+                <td><strong>${stats.product}</strong></td>
+                <td>${stats.clicks}</td>
+                <td>${viewSeconds}s</td>
+                <td>${stats.purchased}</td>
+                <td>$${stats.revenue.toFixed(2)}</td>
+            </tr>
+        `;
+    });
+
+    if (html === '') {
+        html = '<tr><td colspan="5" style="text-align: center; color: #999;">No product interactions yet</td></tr>';
+    }
+
+    tbody.innerHTML = html;
+}
+
+// Restore selection on page load: searching for the saved ADID puts it in the list
+window.addEventListener('DOMContentLoaded', async function() {
+    const savedAdid = localStorage.getItem('selectedAdid');
+    if (savedAdid) {
+        document.getElementById('adidSearch').value = savedAdid;
+    }
+    await searchAdids();
+    if (savedAdid && document.getElementById('adidSelector').value === savedAdid) {
+        updateUserPerformance();
+    }
+});
+
+// Live mode (all-time pages, when the server pushes updates): the page defines live as
+// {sort, top}, or null to keep reloading every few seconds instead
+const LIVE_PURCHASES = 10;
+let adidSearchTimer = null;
+
+function tableRows() {
+    const rows = new Map();
+    document.querySelectorAll('#productTable tbody tr').forEach(tr => rows.set(tr.dataset.product, {
+        clicks: Number(tr.dataset.clicks),
+        total_view_duration: Number(tr.dataset.view),
+        unique_adids: Number(tr.dataset.viewers),
+    }));
+    return rows;
+}
+
+function cell(row, text, strong) {
+    const td = row.insertCell();
+    if (strong) {
+        td.appendChild(document.createElement('strong')).textContent = text;
+    } else {
+        td.textContent = text;
+    }
+}
+
+function updateProducts(delta) {
+    // Counters only grow, so the changed products and the rows already shown contain the new top rows
+    const rows = tableRows();
+    Object.entries(delta.products).forEach(([product, stats]) => rows.set(product, stats));
+    const key = live.sort === 'view_time'
+        ? ([, s]) => [s.total_view_duration, s.clicks]
+        : ([, s]) => [s.clicks, s.total_view_duration];
+    const top = [...rows.entries()]
+        .sort((a, b) => { const x = key(a), y = key(b); return y[0] - x[0] || y[1] - x[1]; })
+        .slice(0, live.top);
+
+    const tbody = document.querySelector('#productTable tbody');
+    tbody.innerHTML = '';
+    top.forEach(([product, stats]) => {
+        if (stats.clicks === 0 && stats.total_view_duration === 0) {
+            return;
+        }
+        const row = tbody.insertRow();
+        row.dataset.product = product;
+        row.dataset.clicks = stats.clicks;
+        row.dataset.view = stats.total_view_duration;
+        row.dataset.viewers = stats.unique_adids;
+        cell(row, product, true);
+        cell(row, stats.clicks);
+        cell(row, `${(stats.total_view_duration / 1000).toFixed(1)}s`);
+        cell(row, stats.unique_adids);
+    });
+    document.getElementById('productTitle').textContent = 'Product Performance'
+        + (top.length < delta.product_count ? ` (top ${top.length} of ${delta.product_count})` : '');
+}
+
+function addPurchases(purchases) {
+    if (purchases.length === 0) {
+        return;
+    }
+    const tbody = document.getElementById('livePurchasesBody');
+    purchases.forEach(purchase => {
+        const row = tbody.insertRow(0);
+        cell(row, new Date(purchase.timestamp).toLocaleTimeString());
+        cell(row, purchase.adid);
+        cell(row, purchase.items.join(', '));
+        cell(row, `$${purchase.total.toFixed(2)}`);
+        cell(row, purchase.trackerEnabled ? '🟢 ON' : '🔴 OFF');
+    });
+    while (tbody.rows.length > LIVE_PURCHASES) {
+        tbody.deleteRow(-1);
+    }
+    document.getElementById('livePurchases').style.display = 'block';
+}
+
+function applyDelta(delta) {
+    document.getElementById('updated').textContent = delta.updated;
+    document.getElementById('adidTotal').textContent = delta.adid_count;
+    updateProducts(delta);
+    addPurchases(delta.purchases);
+
+    // New ADIDs matching the search change the selector's page; reload it at most every few seconds
+    const query = document.getElementById('adidSearch').value.trim();
+    if (delta.new_adid_count > 0 && !adidSearchTimer
+            && (delta.new_adid_count > delta.new_adids.length || delta.new_adids.some(adid => adid.startsWith(query)))) {
+        adidSearchTimer = setTimeout(() => { adidSearchTimer = null; searchAdids(); }, 5000);
+    }
+    const selected = document.getElementById('adidSelector').value;
+    if (selected && (delta.active_adid_count > delta.active_adids.length || delta.active_adids.includes(selected))) {
+        updateUserPerformance();
+    }
+}
+
+if (live) {
+    let connected = false;
+    const source = new EventSource('/analytics-realtime/stream');
+    source.addEventListener('delta', event => applyDelta(JSON.parse(event.data)));
+    source.addEventListener('open', () => {
+        // Updates sent while disconnected are lost: start over from a fresh page
+        if (connected) {
+            location.reload();
+        }
+        connected = true;
+    });
+}
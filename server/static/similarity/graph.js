@@ -159,3 +159,43 @@ function updateThreshold(threshold) {
     window.location.href = url.toString();
 }
 
+// Fetch graph data for the current page's query parameters and draw it
+async function loadSimilarityGraph() {
+    const params = new URLSearchParams(window.location.search);
+    const message = document.getElementById('graphMessage');
+    
+    const response = await fetch('/product-similarity.json?' + params.toString());
+    if (!response.ok) {
+        message.textContent = `Failed to load graph data (HTTP ${response.status})`;
+        return;
+    }
+    const data = await response.json();
+    
+    const thresholdPercent = Math.round(data.threshold * 100);
+    document.getElementById('threshold').value = thresholdPercent;
+    document.getElementById('thresholdValue').textContent = thresholdPercent + '%';
+    document.getElementById('statProducts').textContent = data.total_products;
+    document.getElementById('statUsers').textContent = data.total_users;
+    document.getElementById('statEdges').textContent = data.total_edges;
+    document.getElementById('statThreshold').textContent = (data.threshold * 100).toFixed(1) + '%';
+    document.getElementById('statComputedAt').textContent = data.computed_at;
+    
+    if (data.nodes.length < 2) {
+        message.textContent = 'Not enough data yet. Need at least 2 products with user interactions to calculate similarity.';
+        return;
+    }
+    message.remove();
+    
+    // Start from the server-side layout (coordinates roughly in [-1, 1]) so the simulation settles quickly
+    const width = document.getElementById('graph').parentElement.clientWidth - 60;
+    const height = 700;
+    if (data.positions) {
+        data.nodes.forEach((node, i) => {
+            node.x = width / 2 + data.positions[i][0] * width * 0.4;
+            node.y = height / 2 + data.positions[i][1] * height * 0.4;
+        });
+    }
+    
+    const simulation = createSimilarityGraph(data.nodes, data.edges);
+    if (data.positions) simulation.alpha(0.3);
+}
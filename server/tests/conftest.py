@@ -0,0 +1,11 @@
+import os
+import sys
+
+# Tests import the server modules the way main.py does, from the server directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Importing config (via main or routes) must not touch server/data: memory only, no live
+# feed, no segment files, quiet logs. Tests that need persistence start their own server.
+for name, value in (("WAL_MODE", "off"), ("LIVE_INTERVAL", "0"), ("EVENT_SEGMENT_EVENTS", "0"),
+                    ("LOG_LEVEL", "WARNING")):
+    os.environ.setdefault(name, value)
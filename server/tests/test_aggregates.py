@@ -0,0 +1,119 @@
+"""
+Ingest-time aggregates, rollups and rankings must agree with a full recompute
+"""
+from datetime import datetime
+from types import SimpleNamespace
+import random
+
+import pytest
+
+from utils.aggregates import (
+    REALTIME_RANKINGS, REVENUE_RANKINGS, RealtimeAggregates, RevenueAggregates,
+    diff_aggregates, recompute_realtime, recompute_revenue,
+)
+from utils.event_store import EVENT_TYPES, EventStore
+from utils.hll import HyperLogLog
+from utils.rollups import HOUR, MINUTE, TimeRollups, purchase_time
+from utils.topk import diff_ranking
+
+START = 1_700_000_000 // HOUR * HOUR
+
+
+def build(distinct):
+    """
+    30 hours of event batches and purchases from 60 ADIDs over 25 products,
+    fed to the aggregates and rollups in receive order, the way the ingest
+    consumer does.
+    """
+    rng = random.Random(11)
+    store = EventStore()
+    realtime = RealtimeAggregates(distinct, ranking_size=5)
+    revenue = RevenueAggregates(ranking_size=5)
+    rollups = TimeRollups(distinct=distinct)
+    purchases = []
+    for n in range(600):
+        received_at = START + n * 180 + rng.random() * 60
+        adid = f"adid-{rng.randrange(60)}"
+        if n % 4 == 3:
+            items = []
+            for _ in range(rng.randint(1, 3)):
+                product = rng.randrange(25)
+                discount = rng.choice((0, 0.2))
+                items.append({"id": f"prod-{product}", "name": f"Product {product}", "price": 10.0 + product,
+                              "discount": discount, "finalPrice": round((10.0 + product) * (1 - discount), 2)})
+            purchase = {"purchaseId": f"PURCHASE-{n}", "adid": adid, "items": items,
+                        "total": sum(item["finalPrice"] for item in items),
+                        "trackerEnabled": rng.random() < 0.7,
+                        "timestamp": datetime.fromtimestamp(received_at).isoformat()}
+            purchases.append(purchase)
+            realtime.add_purchase(purchase)
+            revenue.add_purchase(purchase)
+            rollups.add_purchase(purchase)
+            continue
+        events = []
+        for i in range(rng.randint(1, 6)):
+            event_type = rng.choice(EVENT_TYPES)
+            product = rng.randrange(25)
+            events.append(SimpleNamespace(
+                eventType=event_type, productId=f"prod-{product}", productName=f"Product {product}",
+                timestamp=int(received_at * 1000) + i,
+                viewDuration=rng.randint(100, 20000) if event_type in ("view", "view_end") else None,
+            ))
+        store.append_batch(adid, events, received_at)
+        realtime.add_batch(adid, events, received_at)
+        rollups.add_batch(adid, events, received_at)
+    return SimpleNamespace(store=store, realtime=realtime, revenue=revenue, rollups=rollups, purchases=purchases)
+
+
+@pytest.fixture(scope="module", params=[set, HyperLogLog], ids=["exact", "hll"])
+def data(request):
+    return build(request.param)
+
+
+def test_realtime_matches_recompute(data):
+    expected = recompute_realtime(data.store.rows(), data.purchases, data.realtime.distinct)
+    assert diff_aggregates(expected, data.realtime.snapshot()) == []
+
+
+def test_revenue_matches_recompute(data):
+    assert diff_aggregates(recompute_revenue(data.purchases), data.revenue.snapshot()) == []
+
+
+def test_rollups_merge_to_all_time(data):
+    assert data.rollups.complete_history()
+    assert diff_aggregates(data.realtime.snapshot(), data.rollups.realtime()) == []
+    assert diff_aggregates(data.revenue.snapshot(), data.rollups.revenue()) == []
+
+
+@pytest.mark.parametrize("since, until", [
+    (START + 2 * HOUR, START + 5 * HOUR),  # whole merged hours
+    (START + 95 * MINUTE, START + 20 * HOUR + 7 * MINUTE),  # minute edges around merged hours
+    (START + 29 * HOUR, START + 31 * HOUR),  # the newest, unmerged minutes
+])
+def test_rollup_window_matches_recompute(data, since, until):
+    events = [row for row in data.store.rows() if since <= row.receivedAt < until]
+    purchases = [purchase for purchase in data.purchases if since <= purchase_time(purchase) < until]
+    assert events and purchases
+    assert diff_aggregates(recompute_realtime(events, purchases, data.realtime.distinct),
+                           data.rollups.realtime(since, until)) == []
+    assert diff_aggregates(recompute_revenue(purchases), data.rollups.revenue(since, until)) == []
+
+
+def test_rankings_match_sorting(data):
+    for aggregates, definitions in ((data.realtime, REALTIME_RANKINGS), (data.revenue, REVENUE_RANKINGS)):
+        assert set(aggregates.rankings) == set(definitions)
+        for name, ranking in aggregates.rankings.items():
+            rows, key = definitions[name]
+            assert diff_ranking(ranking, getattr(aggregates, rows), key) == [], name
+
+
+def test_hll_counts():
+    exact = HyperLogLog(range(400))
+    assert len(exact) == 400  # below m / 8 the hashes are kept and counted exactly
+
+    left, right = HyperLogLog(range(60_000)), HyperLogLog(range(40_000, 100_000))
+    for sketch, count in ((left, 60_000), (right, 60_000)):
+        assert abs(len(sketch) - count) / count < 0.05  # ~3 standard errors at precision 12
+    union = left | right
+    assert union == HyperLogLog(range(100_000))  # merging equals sketching the union
+    assert abs(len(union) - 100_000) / 100_000 < 0.05
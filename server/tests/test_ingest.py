@@ -0,0 +1,71 @@
+"""
+Ingest queue: backpressure, bulk stores, and what one bad batch may cost
+"""
+from types import SimpleNamespace
+
+import pytest
+
+from utils.event_store import EventStore
+from utils.ingest import IngestQueue
+
+
+def event(timestamp: int, event_type: str = "click", duration=None):
+    return SimpleNamespace(eventType=event_type, productId="prod-1", productName="Product 1",
+                           timestamp=timestamp, viewDuration=duration)
+
+
+class Recorder:
+    """Stands in for an aggregates object: remembers every batch folded into it"""
+
+    def __init__(self):
+        self.batches = []
+
+    def add_batch(self, adid, events, received_at):
+        self.batches.append((adid, len(events), received_at))
+
+
+def test_offer_refuses_when_full():
+    queue = IngestQueue(EventStore(), [], max_events=10)
+    assert queue.offer("a", [event(1)] * 6)
+    assert queue.offer("b", [event(2)] * 4)
+    assert not queue.offer("c", [event(3)])
+    assert queue.stats()["rejected"] == 1 and len(queue) == 10
+
+    assert queue.drain() == 10
+    assert queue.offer("c", [event(3)])
+    # A batch larger than the whole queue is still taken when nothing else is waiting
+    assert IngestQueue(EventStore(), [], max_events=10).offer("d", [event(4)] * 11)
+
+
+def test_drain_keeps_each_batch_receive_time():
+    store, recorder = EventStore(), Recorder()
+    queue = IngestQueue(store, [recorder])
+    queue.offer("a", [event(1), event(2)], received_at=100.0)
+    queue.offer("b", [event(3)], received_at=101.5)
+
+    assert queue.drain() == 3
+    assert list(store.received_at.view()) == [100.0, 100.0, 101.5]
+    assert recorder.batches == [("a", 2, 100.0), ("b", 1, 101.5)]
+    assert store.version == 1  # one bulk append
+
+
+def test_bad_batch_only_drops_itself():
+    store, recorder = EventStore(), Recorder()
+    queue = IngestQueue(store, [recorder])
+    queue.offer("a", [event(1), event(2)], received_at=100.0)
+    queue.offer("bad", [event(3), event(2**70)], received_at=101.0)  # does not fit the int64 column
+    queue.offer("c", [event(4)], received_at=102.0)
+
+    assert queue.drain() == 3
+    assert [adid for adid, _, _ in recorder.batches] == ["a", "c"]
+    assert [store.adids[code] for code in store.adid.view()] == ["a", "a", "c"]
+    assert queue.stats()["failed"] == 2 and len(queue) == 0
+
+
+def test_failed_append_leaves_columns_aligned():
+    store = EventStore()
+    store.append_batch("a", [event(1)], received_at=100.0)
+    with pytest.raises(OverflowError):
+        store.append_batches([("b", [event(2)], 101.0), ("c", [event(3, "view", 2**64)], 102.0)])
+    assert {len(getattr(store, name)) for name in store.COLUMNS} == {1}
+    assert len(store) == 1 and store.version == 1
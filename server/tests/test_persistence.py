@@ -0,0 +1,154 @@
+"""
+Recovery across restarts: every acknowledged record survives a crash
+"""
+import json
+import os
+import subprocess
+import sys
+import textwrap
+
+from utils.wal import WriteAheadLog
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCRIPT = """
+import json, multiprocessing, os
+from fastapi.testclient import TestClient
+import main
+
+def crash():
+    print(json.dumps(result), flush=True)
+    # The similarity worker would outlive us and hold stdout open
+    for child in multiprocessing.active_children():
+        child.kill()
+    os._exit(0)
+
+def status():
+    return client.get("/persistence/status").json()
+
+def post_events(adid, count, start=0):
+    response = client.post("/analytics-events", json={{"adid": adid, "events": [
+        {{"eventType": "view", "productId": f"prod-{{i % 7}}", "productName": f"Product {{i % 7}}",
+          "timestamp": 1_700_000_000_000 + start + i, "viewDuration": 1000 + i}}
+        for i in range(count)
+    ]}})
+    assert response.status_code == 200, response.text
+
+def post_purchase(adid, price):
+    item = {{"id": "prod-1", "name": "Product 1", "price": price, "discount": 0.2, "finalPrice": price * 0.8}}
+    response = client.post("/purchase", json={{"adid": adid, "items": [item, {{**item, "discount": 0,
+                                                                            "finalPrice": price}}],
+                                               "total": price * 1.8, "trackerEnabled": adid.endswith("1")}})
+    assert response.status_code == 200, response.text
+
+# What the dashboards show, and whether it matches a recompute from the stored history
+def dashboards():
+    import config
+    return {{"events": len(config.event_store), "purchases": len(config.purchase_history),
+             "totals": config.revenue_aggregates.snapshot()["totals"],
+             "clicks": {{product: stats["clicks"] for product, stats in config.realtime_aggregates.product_stats.items()}},
+             "consistency": client.get("/analytics/consistency").json()}}
+
+result = None
+with TestClient(main.app) as client:
+{body}
+print(json.dumps(result), flush=True)
+"""
+
+
+def run_server(data_dir, body: str):
+    """
+    Start the app in a fresh process on data_dir, run `body` with `client`
+    bound to a TestClient, and return what it assigned to `result`.
+
+    `crash()` in the body exits without the shutdown hooks (no final snapshot,
+    no WAL close), like a killed process.
+    """
+    script = SCRIPT.format(body=textwrap.indent(textwrap.dedent(body), "    "))
+    env = dict(os.environ,
+               WAL_DIR=os.path.join(data_dir, "wal"),
+               SNAPSHOT_DIR=os.path.join(data_dir, "snapshots"),
+               EVENT_SEGMENT_DIR=os.path.join(data_dir, "segments"),
+               WAL_MODE="group", EVENT_SEGMENT_EVENTS="100", LIVE_INTERVAL="0", LOG_LEVEL="WARNING")
+    done = subprocess.run([sys.executable, "-c", script], cwd=SERVER_DIR, env=env,
+                          capture_output=True, text=True, timeout=120)
+    assert done.returncode == 0, done.stderr
+    return json.loads(done.stdout.strip().splitlines()[-1])
+
+
+def test_log_numbering_continues_after_pruned_snapshot(tmp_path):
+    # Run 1: the events end up in the snapshot taken on shutdown
+    first = run_server(tmp_path, """
+        for n in range(4):
+            post_events(f"adid-{n}", 30, n * 30)
+        result = status()["wal"]["lsn"]
+    """)
+    assert first == 4
+    # Every segment is covered by the snapshot, so pruning may delete all of them
+    for name in os.listdir(tmp_path / "wal"):
+        os.remove(tmp_path / "wal" / name)
+
+    # Run 2: acknowledged writes, then a crash before any new snapshot
+    second = run_server(tmp_path, """
+        recovered = status()["event_store"]["events"]
+        for n in range(5):
+            post_events("adid-new", 1, 10_000 + n)
+        result = {"recovered": recovered, "lsn": status()["wal"]["lsn"]}
+        crash()
+    """)
+    assert second == {"recovered": 120, "lsn": 9}
+
+    # Run 3: the snapshot plus the five logged records
+    third = run_server(tmp_path, """
+        result = status()
+    """)
+    assert third["event_store"]["events"] == 125
+    assert third["recovery"]["replayed_records"] == 5
+    assert third["wal"]["lsn"] == 9
+
+
+def test_record_that_fails_to_apply_is_skipped(tmp_path):
+    # A record logged by a server that accepted an out-of-range timestamp, between two good ones
+    log = WriteAheadLog(str(tmp_path / "wal"), mode="fsync")
+    list(log.replay())
+    log.open()
+    for timestamp in (1_700_000_000_000, 2**70, 1_700_000_000_001):
+        log.submit({"type": "events", "adid": "adid-1", "receivedAt": 1_700_000_000.0,
+                    "events": [["view", "prod-1", "Product 1", timestamp, 1000]]})
+    log._file.close()
+
+    recovered = run_server(tmp_path, """
+        result = status()
+    """)
+    assert recovered["recovery"]["replayed_records"] == 2
+    assert recovered["recovery"]["skipped_records"] == 1
+    assert recovered["event_store"]["events"] == 2
+
+
+def test_recovers_snapshot_plus_log_tail(tmp_path):
+    # Run 1: sealed segments, hot events and purchases, all in the snapshot taken on shutdown
+    run_server(tmp_path, """
+        for n in range(6):
+            post_events(f"adid-{n % 3}", 40, n * 40)
+            post_purchase(f"adid-{n % 3}", 10.0 + n)
+    """)
+
+    # Run 2: more of both, logged but not in any snapshot, then a crash
+    before = run_server(tmp_path, """
+        for n in range(4):
+            post_events(f"adid-{n}", 7, 1000 + n * 7)
+            post_purchase(f"adid-{n}", 20.0 + n)
+        result = dashboards()
+        crash()
+    """)
+    assert before["events"] == 268 and before["purchases"] == 10
+
+    after = run_server(tmp_path, """
+        result = {"dashboards": dashboards(), "status": status()}
+    """)
+    recovery = after["status"]["recovery"]
+    assert recovery["snapshot_lsn"] == 12 and recovery["replayed_records"] == 8
+    assert after["status"]["event_store"]["segments"] == 2
+    assert after["dashboards"] == before
+    consistency = after["dashboards"]["consistency"]
+    assert all(check["consistent"] for check in consistency.values()), consistency
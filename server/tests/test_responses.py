@@ -0,0 +1,114 @@
+"""
+HTTP behaviour of the dashboards and the ingest endpoint: ETags, 304s, 503 and 422
+"""
+import asyncio
+import gzip
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from config import event_ingest, response_cache
+from utils.singleflight import SingleFlight
+
+# No lifespan: the ingest consumer is not running, so queued batches stay queued until drained here
+client = TestClient(main.app)
+
+
+def events(count: int, **fields):
+    return [{"eventType": "click", "productId": "prod-1", "productName": "Product 1",
+             "timestamp": 1_700_000_000_000 + i, **fields} for i in range(count)]
+
+
+def purchase(adid: str, price: float):
+    item = {"id": "prod-1", "name": "Product 1", "price": price, "discount": 0, "finalPrice": price}
+    return {"adid": adid, "items": [item], "total": price}
+
+
+@pytest.fixture(autouse=True)
+def empty_queue():
+    event_ingest.drain()
+    yield
+    event_ingest.drain()
+
+
+def test_etag_revalidation():
+    first = client.get("/purchases")
+    etag = first.headers["etag"]
+    assert first.status_code == 200 and first.headers["vary"] == "Accept-Encoding"
+
+    again = client.get("/purchases", headers={"If-None-Match": etag})
+    assert again.status_code == 304 and again.content == b""
+    assert again.headers["etag"] == etag and again.headers["vary"] == "Accept-Encoding"
+
+    # A write moves the data version, so the old ETag no longer matches
+    assert client.post("/purchase", json=purchase("adid-etag", 12.5)).status_code == 200
+    changed = client.get("/purchases", headers={"If-None-Match": etag})
+    assert changed.status_code == 200 and changed.headers["etag"] != etag
+
+
+def test_dashboard_page_is_cached_per_version():
+    client.post("/purchase", json=purchase("adid-page", 30.0))
+    first = client.get("/analytics", headers={"Accept-Encoding": "identity"})
+    assert first.status_code == 200 and b"adid-page" in first.content
+
+    hits = response_cache.hits
+    cached = client.get("/analytics", headers={"Accept-Encoding": "identity"})
+    assert response_cache.hits == hits + 1
+    assert cached.content == first.content and cached.headers["etag"] == first.headers["etag"]
+
+    compressed = client.get("/analytics", headers={"Accept-Encoding": "gzip"})
+    assert compressed.headers["content-encoding"] == "gzip" and compressed.headers["vary"] == "Accept-Encoding"
+    assert compressed.content == first.content  # the client decoded it
+
+    revalidated = client.get("/analytics", headers={"If-None-Match": first.headers["etag"]})
+    assert revalidated.status_code == 304 and revalidated.headers["vary"] == "Accept-Encoding"
+
+
+def test_full_queue_answers_503(monkeypatch):
+    monkeypatch.setattr(event_ingest, "max_events", 5)
+    accepted = client.post("/analytics-events", json={"adid": "adid-1", "events": events(5)})
+    assert accepted.status_code == 200 and len(event_ingest) == 5
+
+    refused = client.post("/analytics-events", json={"adid": "adid-2", "events": events(1)})
+    assert refused.status_code == 503
+    assert refused.headers["retry-after"] == str(event_ingest.retry_after)
+    assert len(event_ingest) == 5
+
+    event_ingest.drain()
+    assert client.post("/analytics-events", json={"adid": "adid-2", "events": events(1)}).status_code == 200
+
+
+@pytest.mark.parametrize("fields", [{"timestamp": 2**70}, {"timestamp": -1}, {"viewDuration": -1},
+                                    {"viewDuration": 2**63}])
+def test_out_of_range_events_are_rejected(fields):
+    response = client.post("/analytics-events", json={"adid": "adid-1", "events": events(1, **fields)})
+    assert response.status_code == 422
+    assert len(event_ingest) == 0
+
+
+def test_share_runs_one_source_for_concurrent_readers():
+    flights, completed = SingleFlight(), []
+    calls = []
+
+    async def chunks():
+        for n in range(3):
+            await asyncio.sleep(0.01)
+            yield f"chunk {n};".encode()
+
+    def source():
+        calls.append(1)
+        return chunks()
+
+    async def read(stream):
+        return b"".join([chunk async for chunk in stream])
+
+    async def run():
+        streams = [flights.share("page", source, route="/page", on_complete=completed.append) for _ in range(3)]
+        return await asyncio.gather(*(read(stream) for stream in streams))
+
+    bodies = asyncio.run(run())
+    assert len(calls) == 1
+    assert bodies == [b"chunk 0;chunk 1;chunk 2;"] * 3 and completed == bodies[:1]
+    assert flights.stats()["routes"]["/page"] == {"requests": 3, "computations": 1, "coalesced": 2}
+    assert flights.stats()["in_flight"] == 0
@@ -0,0 +1,60 @@
+"""
+The sparse (CSR) similarity backend must give the same results as the dense one
+"""
+from types import SimpleNamespace
+import random
+
+import numpy as np
+import pytest
+import scipy.sparse as sp
+
+from utils.event_store import EVENT_TYPES, EventStore
+from utils.similarity import build_engagement_matrix, nearest_neighbors, similarity_pairs
+
+
+@pytest.fixture(scope="module")
+def store() -> EventStore:
+    """2,000 events from 150 users over 40 products, with a few popular products"""
+    rng = random.Random(7)
+    store = EventStore()
+    for n in range(200):
+        events = []
+        for i in range(10):
+            event_type = rng.choice(EVENT_TYPES)
+            product = min(int(rng.paretovariate(1.2)) - 1, 39)
+            events.append(SimpleNamespace(
+                eventType=event_type, productId=f"prod-{product}", productName=f"Product {product}",
+                timestamp=n * 10 + i,
+                viewDuration=rng.randint(100, 20000) if event_type in ("view", "view_end") else None,
+            ))
+        store.append_batch(f"adid-{rng.randrange(150)}", events, received_at=1_700_000_000 + n)
+    return store
+
+
+def test_engagement_matrix(store):
+    dense_products, dense_users, dense = build_engagement_matrix(store, "dense")
+    sparse_products, sparse_users, sparse = build_engagement_matrix(store, "sparse")
+    assert sp.issparse(sparse) and not sp.issparse(dense)
+    assert sparse_products == dense_products
+    assert sparse_users == dense_users
+    np.testing.assert_allclose(sparse.toarray(), dense)
+
+
+@pytest.mark.parametrize("threshold", [0.0, 0.1, 0.3])
+def test_similarity_edges(store, threshold):
+    _, _, dense = build_engagement_matrix(store, "dense")
+    _, _, sparse = build_engagement_matrix(store, "sparse")
+    dense_rows, dense_cols, dense_sims = similarity_pairs(dense, threshold)
+    sparse_rows, sparse_cols, sparse_sims = similarity_pairs(sparse, threshold)
+    assert len(dense_rows) > 0
+    np.testing.assert_array_equal(sparse_rows, dense_rows)
+    np.testing.assert_array_equal(sparse_cols, dense_cols)
+    np.testing.assert_allclose(sparse_sims, dense_sims, rtol=1e-12)
+
+
+@pytest.mark.parametrize("top_k", [1, 5, None])
+def test_nearest_neighbors(store, top_k):
+    _, _, dense = build_engagement_matrix(store, "dense")
+    _, _, sparse = build_engagement_matrix(store, "sparse")
+    for expected, actual in zip(nearest_neighbors(dense, top_k, 0.1), nearest_neighbors(sparse, top_k, 0.1)):
+        np.testing.assert_allclose(actual, expected, rtol=1e-12)
@@ -0,0 +1,704 @@
+"""
+Dashboard aggregates maintained incrementally at ingest time
+"""
+from typing import Callable, Dict, Iterable, List, Optional
+import math
+
+from utils.topk import TopK
+
+
+def _new_adid_stats(distinct: Callable = set) -> Dict:
+    return {
+        "view_starts": 0,
+        "view_ends": 0,
+        "clicks": 0,
+        "total_view_duration": 0,
+        "products_viewed": distinct(),
+        "products_clicked": distinct(),
+        "last_activity": None
+    }
+
+
+def _new_product_stats(distinct: Callable = set) -> Dict:
+    return {
+        "clicks": 0,
+        "total_view_duration": 0,
+        "unique_adids": distinct()
+    }
+
+
+def product_revenue(buckets: Dict) -> float:
+    """Total revenue of a product_analytics row, over its tracker/coupon buckets"""
+    return buckets["tracker_on_with_coupon"]["revenue"] + buckets["tracker_on_without_coupon"]["revenue"] \
+        + buckets["tracker_off"]["revenue"]
+
+
+# Dashboard rankings: name -> (rows they rank, sort key of a row). Keys only grow as events and
+# purchases are added; ties on the first component are broken by the second
+REALTIME_RANKINGS = {
+    "product_clicks": ("product_stats", lambda stats: (stats["clicks"], stats["total_view_duration"])),
+    "product_view_time": ("product_stats", lambda stats: (stats["total_view_duration"], stats["clicks"])),
+}
+REVENUE_RANKINGS = {
+    "adid_revenue": ("analytics", lambda row: row["total_revenue"]),
+    "product_revenue": ("product_analytics", product_revenue),
+}
+
+
+def _rankings(aggregates, rankings: Dict, size: Optional[int]) -> Dict[str, TopK]:
+    """TopK rankings of an aggregates object's current rows (none when size is None)"""
+    if not size:
+        return {}
+    return {
+        name: TopK.from_rows(size, getattr(aggregates, rows), key)
+        for name, (rows, key) in rankings.items()
+    }
+
+
+def _new_performance() -> Dict:
+    return {
+        "clicks": 0,
+        "view_duration": 0,
+        "purchased": 0,
+        "revenue": 0.0
+    }
+
+
+class RealtimeAggregates:
+    """
+    Per-ADID and per-product counters behind /analytics-realtime.
+
+    Updated once per event and once per purchased item, so reading the
+    dashboard never rescans analytics events or purchase history.
+
+    `distinct` builds the unique-ADID and products-viewed/clicked
+    collections: exact sets, or HyperLogLog sketches (utils.hll) whose
+    memory stays bounded however many distinct values they see. With a
+    ranking_size, the top products by clicks and by view time
+    (REALTIME_RANKINGS) are kept up to date as well.
+    """
+
+    distinct: Callable = set
+
+    def __init__(self, distinct: Callable = set, ranking_size: Optional[int] = None):
+        self.distinct = distinct
+        self.adid_stats: Dict[str, Dict] = {}
+        self.product_stats: Dict[str, Dict] = {}
+        # adid -> product_key -> {"product", "quantity", "revenue", "discounted"}
+        self.adid_purchases: Dict[str, Dict[str, Dict]] = {}
+        self.adid_product_performance: Dict[str, Dict[str, Dict]] = {}
+        self.rankings = _rankings(self, REALTIME_RANKINGS, ranking_size)
+
+    def rank(self, ranking_size: Optional[int]):
+        """Rebuild the rankings from the current rows (e.g. after restoring a snapshot)"""
+        self.rankings = _rankings(self, REALTIME_RANKINGS, ranking_size)
+
+    def _ranked(self, product_key: str, product: Dict):
+        for name, ranking in self.rankings.items():
+            ranking.update(product_key, REALTIME_RANKINGS[name][1](product))
+
+    def _adid(self, adid: str) -> Dict:
+        stats = self.adid_stats.get(adid)
+        if stats is None:
+            stats = self.adid_stats[adid] = _new_adid_stats(self.distinct)
+        return stats
+
+    def _product(self, product_key: str) -> Dict:
+        stats = self.product_stats.get(product_key)
+        if stats is None:
+            stats = self.product_stats[product_key] = _new_product_stats(self.distinct)
+        return stats
+
+    def _performance(self, adid: str, product_key: str) -> Dict:
+        products = self.adid_product_performance.get(adid)
+        if products is None:
+            products = self.adid_product_performance[adid] = {}
+        performance = products.get(product_key)
+        if performance is None:
+            performance = products[product_key] = _new_performance()
+        return performance
+
+    def add_event(self, adid: str, event_type: str, product_key: str,
+                  view_duration: Optional[int], received_at):
+        """Fold one analytics event into the aggregates"""
+        stats = self._adid(adid)
+        stats["last_activity"] = received_at
+
+        if event_type == "view_start":
+            stats["view_starts"] += 1
+            stats["products_viewed"].add(product_key)
+            self._product(product_key)["unique_adids"].add(adid)
+        elif event_type == "view_end":
+            stats["view_ends"] += 1
+            if view_duration is not None:
+                stats["total_view_duration"] += view_duration
+                product = self._product(product_key)
+                product["total_view_duration"] += view_duration
+                self._performance(adid, product_key)["view_duration"] += view_duration
+                if self.rankings:
+                    self._ranked(product_key, product)
+        elif event_type == "view":
+            # Periodic view event (every 10 seconds of continuous viewing)
+            if view_duration is not None:
+                stats["total_view_duration"] += view_duration
+                product = self._product(product_key)
+                product["total_view_duration"] += view_duration
+                stats["products_viewed"].add(product_key)
+                product["unique_adids"].add(adid)
+                self._performance(adid, product_key)["view_duration"] += view_duration
+                if self.rankings:
+                    self._ranked(product_key, product)
+        elif event_type == "click":
+            stats["clicks"] += 1
+            stats["products_clicked"].add(product_key)
+            product = self._product(product_key)
+            product["clicks"] += 1
+            self._performance(adid, product_key)["clicks"] += 1
+            if self.rankings:
+                self._ranked(product_key, product)
+
+    def add_batch(self, adid: str, events: Iterable, received_at):
+        """Fold a batch of SDK events (AnalyticsEvent objects) for one ADID"""
+        for event in events:
+            self.add_event(adid, event.eventType, f"{event.productId} - {event.productName}",
+                           event.viewDuration, received_at)
+
+    def add_purchase(self, purchase: Dict):
+        """Fold one purchase record (as stored in purchase_history)"""
+        adid = purchase["adid"]
+        purchases = self.adid_purchases.get(adid)
+        if purchases is None:
+            purchases = self.adid_purchases[adid] = {}
+
+        for item in purchase["items"]:
+            product_key = f"{item.get('id', 'unknown')} - {item['name']}"
+
+            performance = self._performance(adid, product_key)
+            performance["purchased"] += 1
+            performance["revenue"] += item["finalPrice"]
+
+            existing = purchases.get(product_key)
+            if existing:
+                existing["quantity"] += 1
+                existing["revenue"] += item["finalPrice"]
+                if item["discount"] > 0:
+                    existing["discounted"] += 1
+            else:
+                purchases[product_key] = {
+                    "product": product_key,
+                    "quantity": 1,
+                    "revenue": item["finalPrice"],
+                    "discounted": 1 if item["discount"] > 0 else 0
+                }
+
+    @classmethod
+    def merged(cls, parts: Iterable["RealtimeAggregates"], distinct: Callable = set) -> "RealtimeAggregates":
+        """Aggregates of several disjoint time ranges combined (see merge_realtime)"""
+        aggregates = cls(distinct)
+        vars(aggregates).update(merge_realtime(parts, distinct))
+        return aggregates
+
+    def snapshot(self) -> Dict:
+        """The dashboard's view of the aggregates, shaped like recompute_realtime()"""
+        return {
+            "adid_stats": self.adid_stats,
+            "product_stats": self.product_stats,
+            "adid_purchases": self.adid_purchases,
+            "adid_product_performance": self.adid_product_performance,
+        }
+
+
+def recompute_realtime(events: Iterable, purchases: Iterable[Dict], distinct: Callable = set) -> Dict:
+    """
+    Rebuild the /analytics-realtime aggregates from scratch.
+
+    This is the original full-scan implementation, kept as the reference
+    that RealtimeAggregates is checked against (with the same `distinct`).
+    """
+    adid_stats: Dict[str, Dict] = {}
+    product_stats: Dict[str, Dict] = {}
+    adid_purchases: Dict[str, List[Dict]] = {}
+    adid_product_performance: Dict[str, Dict[str, Dict]] = {}
+
+    def performance(adid, product_key):
+        return adid_product_performance.setdefault(adid, {}).setdefault(product_key, _new_performance())
+
+    def product_row(product_key):
+        stats = product_stats.get(product_key)
+        if stats is None:
+            stats = product_stats[product_key] = _new_product_stats(distinct)
+        return stats
+
+    for event in events:
+        adid = event.adid
+        event_type = event.eventType
+        product_key = event.product_key
+        stats = adid_stats.get(adid)
+        if stats is None:
+            stats = adid_stats[adid] = _new_adid_stats(distinct)
+
+        stats["last_activity"] = event.receivedAt
+
+        if event_type == "view_start":
+            stats["view_starts"] += 1
+            stats["products_viewed"].add(product_key)
+            product_row(product_key)["unique_adids"].add(adid)
+        elif event_type == "view_end":
+            stats["view_ends"] += 1
+            if event.viewDuration is not None:
+                duration = event.viewDuration
+                stats["total_view_duration"] += duration
+                product_row(product_key)["total_view_duration"] += duration
+                performance(adid, product_key)["view_duration"] += duration
+        elif event_type == "view":
+            if event.viewDuration is not None:
+                duration = event.viewDuration
+                stats["total_view_duration"] += duration
+                product = product_row(product_key)
+                product["total_view_duration"] += duration
+                stats["products_viewed"].add(product_key)
+                product["unique_adids"].add(adid)
+                performance(adid, product_key)["view_duration"] += duration
+        elif event_type == "click":
+            stats["clicks"] += 1
+            stats["products_clicked"].add(product_key)
+            product_row(product_key)["clicks"] += 1
+            performance(adid, product_key)["clicks"] += 1
+
+    for purchase in purchases:
+        adid = purchase["adid"]
+        for item in purchase["items"]:
+            product_key = f"{item.get('id', 'unknown')} - {item['name']}"
+
+            performance(adid, product_key)["purchased"] += 1
+            performance(adid, product_key)["revenue"] += item["finalPrice"]
+
+            rows = adid_purchases.setdefault(adid, [])
+            existing = next((p for p in rows if p["product"] == product_key), None)
+            if existing:
+                existing["quantity"] += 1
+                existing["revenue"] += item["finalPrice"]
+                if item["discount"] > 0:
+                    existing["discounted"] += 1
+            else:
+                rows.append({
+                    "product": product_key,
+                    "quantity": 1,
+                    "revenue": item["finalPrice"],
+                    "discounted": 1 if item["discount"] > 0 else 0
+                })
+
+    return {
+        "adid_stats": adid_stats,
+        "product_stats": product_stats,
+        "adid_purchases": {
+            adid: {row["product"]: row for row in rows} for adid, rows in adid_purchases.items()
+        },
+        "adid_product_performance": adid_product_performance,
+    }
+
+
+def _new_adid_revenue() -> Dict:
+    return {
+        "purchases": 0,
+        "purchases_with_coupon": 0,
+        "purchases_without_coupon": 0,
+        "total_revenue": 0.0,
+        "revenue_with_coupon": 0.0,
+        "revenue_without_coupon": 0.0,
+        "total_savings": 0.0,
+        "items_purchased": 0,
+        "tracker_enabled": False
+    }
+
+
+def _new_product_revenue() -> Dict:
+    return {
+        "tracker_on_with_coupon": {"quantity": 0, "revenue": 0.0, "savings": 0.0},
+        "tracker_on_without_coupon": {"quantity": 0, "revenue": 0.0, "savings": 0.0},
+        "tracker_off": {"quantity": 0, "revenue": 0.0, "savings": 0.0}
+    }
+
+
+def _fold_purchase_items(adid_revenue: Dict, product_revenue: Dict[str, Dict],
+                         purchase: Dict, tracker_enabled: bool,
+                         product_totals: Optional[Dict] = None):
+    """Add one purchase's items to an ADID row and the product buckets (and their running totals)"""
+    discounted_items = [item for item in purchase["items"] if item["discount"] > 0]
+    non_discounted_items = [item for item in purchase["items"] if item["discount"] == 0]
+
+    adid_revenue["purchases"] += 1
+    adid_revenue["tracker_enabled"] = tracker_enabled
+    if discounted_items:
+        adid_revenue["purchases_with_coupon"] += 1
+    if non_discounted_items:
+        adid_revenue["purchases_without_coupon"] += 1
+
+    for item in discounted_items:
+        final_price = item["finalPrice"]
+        savings = item["price"] - final_price
+        adid_revenue["total_revenue"] += final_price
+        adid_revenue["revenue_with_coupon"] += final_price
+        adid_revenue["items_purchased"] += 1
+        adid_revenue["total_savings"] += savings
+
+        product_key = f"{item.get('id', 'unknown')} - {item['name']}"
+        product = product_revenue.get(product_key)
+        if product is None:
+            product = product_revenue[product_key] = _new_product_revenue()
+        name = "tracker_on_with_coupon" if tracker_enabled else "tracker_off"
+        bucket = product[name]
+        bucket["quantity"] += 1
+        bucket["revenue"] += final_price
+        bucket["savings"] += savings
+        if product_totals is not None:
+            product_totals[(name, "quantity")] += 1
+            product_totals[(name, "revenue")] += final_price
+            product_totals[(name, "savings")] += savings
+
+    for item in non_discounted_items:
+        adid_revenue["total_revenue"] += item["finalPrice"]
+        adid_revenue["revenue_without_coupon"] += item["finalPrice"]
+        adid_revenue["items_purchased"] += 1
+
+        product_key = f"{item.get('id', 'unknown')} - {item['name']}"
+        product = product_revenue.get(product_key)
+        if product is None:
+            product = product_revenue[product_key] = _new_product_revenue()
+        name = "tracker_on_without_coupon" if tracker_enabled else "tracker_off"
+        bucket = product[name]
+        bucket["quantity"] += 1
+        bucket["revenue"] += item["finalPrice"]
+        if product_totals is not None:
+            product_totals[(name, "quantity")] += 1
+            product_totals[(name, "revenue")] += item["finalPrice"]
+
+
+def _projection(total_tracker_on: float, total_tracker_off: float,
+                adids_tracker_on: int, total_unique_adids: int) -> Dict:
+    """Revenue projection if every ADID had the tracker enabled"""
+    tracker_on_percentage = (adids_tracker_on / total_unique_adids * 100) if total_unique_adids > 0 else 0
+    avg_revenue_tracker_on = total_tracker_on / adids_tracker_on if adids_tracker_on > 0 else 0
+    current_total_revenue = total_tracker_on + total_tracker_off
+    projected_revenue_100 = avg_revenue_tracker_on * total_unique_adids if total_unique_adids > 0 else 0
+    additional_revenue = projected_revenue_100 - current_total_revenue
+    percentage_increase = (additional_revenue / current_total_revenue * 100) if current_total_revenue > 0 else 0
+    return {
+        "total_unique_adids": total_unique_adids,
+        "tracker_on_percentage": tracker_on_percentage,
+        "current_total_revenue": current_total_revenue,
+        "projected_revenue_100": projected_revenue_100,
+        "additional_revenue": additional_revenue,
+        "percentage_increase": percentage_increase,
+    }
+
+
+class RevenueAggregates:
+    """
+    Per-ADID revenue, per-product tracker/coupon buckets and the running
+    totals behind /analytics.
+
+    record_purchase-time cost is O(items in the purchase); the dashboard
+    reads totals in O(1), and with a ranking_size the top ADIDs and products
+    by revenue (REVENUE_RANKINGS) in O(ranking_size).
+    """
+
+    # (bucket, field) pairs summed over all products for the TOTAL row
+    PRODUCT_TOTALS = (
+        ("tracker_on_with_coupon", "quantity"), ("tracker_on_with_coupon", "revenue"),
+        ("tracker_on_with_coupon", "savings"), ("tracker_on_without_coupon", "quantity"),
+        ("tracker_on_without_coupon", "revenue"), ("tracker_off", "quantity"),
+        ("tracker_off", "revenue"), ("tracker_off", "savings"),
+    )
+
+    # Per-ADID fields whose sum over all ADIDs is kept as a running total
+    ROW_TOTALS = (
+        "purchases", "total_savings", "revenue_with_coupon", "revenue_without_coupon",
+        "purchases_with_coupon", "purchases_without_coupon",
+    )
+
+    def __init__(self, ranking_size: Optional[int] = None):
+        self.analytics: Dict[str, Dict] = {}
+        self.product_analytics: Dict[str, Dict] = {}
+        self.adids_tracker_on = set()
+        self.adids_tracker_off = set()
+        self.totals = {
+            "purchases": 0,
+            "total_savings": 0.0,
+            "revenue_with_coupon": 0.0,
+            "revenue_without_coupon": 0.0,
+            "purchases_with_coupon": 0,
+            "purchases_without_coupon": 0,
+            # Split by each ADID's latest tracker flag, so rows move between sides when it flips
+            "total_tracker_on": 0.0,
+            "total_tracker_off": 0.0,
+            "purchases_tracker_on": 0,
+            "purchases_tracker_off": 0,
+        }
+        self.product_totals = {key: 0 for key in self.PRODUCT_TOTALS}
+        self.rankings = _rankings(self, REVENUE_RANKINGS, ranking_size)
+
+    def rank(self, ranking_size: Optional[int]):
+        """Rebuild the rankings from the current rows (e.g. after restoring a snapshot)"""
+        self.rankings = _rankings(self, REVENUE_RANKINGS, ranking_size)
+
+    def add_purchase(self, purchase: Dict):
+        """Fold one purchase record (as stored in purchase_history)"""
+        adid = purchase["adid"]
+        tracker_enabled = purchase.get("trackerEnabled", True)
+        totals = self.totals
+
+        if tracker_enabled:
+            self.adids_tracker_on.add(adid)
+        else:
+            self.adids_tracker_off.add(adid)
+
+        row = self.analytics.get(adid)
+        if row is None:
+            row = self.analytics[adid] = _new_adid_revenue()
+        else:
+            # Take the ADID's previous contribution out of its tracker side
+            side = "on" if row["tracker_enabled"] else "off"
+            totals[f"total_tracker_{side}"] -= row["total_revenue"]
+            totals[f"purchases_tracker_{side}"] -= row["purchases"]
+
+        before = {key: row[key] for key in self.ROW_TOTALS}
+        _fold_purchase_items(row, self.product_analytics, purchase, tracker_enabled, self.product_totals)
+        for key, value in before.items():
+            totals[key] += row[key] - value
+
+        side = "on" if tracker_enabled else "off"
+        totals[f"total_tracker_{side}"] += row["total_revenue"]
+        totals[f"purchases_tracker_{side}"] += row["purchases"]
+
+        if self.rankings:
+            self.rankings["adid_revenue"].update(adid, row["total_revenue"])
+            ranking = self.rankings["product_revenue"]
+            for item in purchase["items"]:
+                product_key = f"{item.get('id', 'unknown')} - {item['name']}"
+                ranking.update(product_key, product_revenue(self.product_analytics[product_key]))
+
+    @classmethod
+    def merged(cls, parts: Iterable["RevenueAggregates"]) -> "RevenueAggregates":
+        """
+        Aggregates of consecutive time ranges, oldest first, combined.
+
+        Each ADID row keeps the tracker flag of its latest part, as
+        recompute_revenue() keeps the flag of the latest purchase.
+        """
+        aggregates = cls()
+        analytics = aggregates.analytics
+        product_analytics = aggregates.product_analytics
+        for part in parts:
+            aggregates.adids_tracker_on |= part.adids_tracker_on
+            aggregates.adids_tracker_off |= part.adids_tracker_off
+            for adid, row in part.analytics.items():
+                merged = analytics.get(adid)
+                if merged is None:
+                    analytics[adid] = dict(row)
+                else:
+                    _add_counts(merged, row, ADID_REVENUE_COUNTS)
+                    merged["tracker_enabled"] = row["tracker_enabled"]
+            for product_key, buckets in part.product_analytics.items():
+                merged = product_analytics.get(product_key)
+                if merged is None:
+                    merged = product_analytics[product_key] = _new_product_revenue()
+                for name, bucket in buckets.items():
+                    _add_counts(merged[name], bucket, PRODUCT_REVENUE_COUNTS)
+        aggregates.totals = _revenue_totals(analytics)
+        aggregates.product_totals = _product_totals(product_analytics)
+        return aggregates
+
+    def snapshot(self) -> Dict:
+        """The dashboard's view of the aggregates, shaped like recompute_revenue()"""
+        return _revenue_snapshot(
+            self.analytics, self.product_analytics,
+            self.adids_tracker_on, self.adids_tracker_off,
+            dict(self.totals), dict(self.product_totals),
+        )
+
+
+def _revenue_snapshot(analytics, product_analytics, adids_tracker_on, adids_tracker_off,
+                      totals, product_totals) -> Dict:
+    totals.update(_projection(
+        totals["total_tracker_on"], totals["total_tracker_off"],
+        len(adids_tracker_on), len(analytics),
+    ))
+    totals["customers"] = len(analytics)
+    for (bucket, field), value in product_totals.items():
+        totals[f"{bucket}_{field}"] = value
+    return {
+        "analytics": analytics,
+        "product_analytics": product_analytics,
+        "adids_tracker_on": adids_tracker_on,
+        "adids_tracker_off": adids_tracker_off,
+        "totals": totals,
+    }
+
+
+def recompute_revenue(purchases: Iterable[Dict]) -> Dict:
+    """
+    Rebuild the /analytics aggregates from scratch by walking every purchase.
+
+    Reference implementation for RevenueAggregates; totals are summed over
+    the rebuilt rows exactly as the dashboard used to do on every request.
+    """
+    analytics: Dict[str, Dict] = {}
+    product_analytics: Dict[str, Dict] = {}
+    adids_tracker_on = set()
+    adids_tracker_off = set()
+
+    for purchase in purchases:
+        adid = purchase["adid"]
+        tracker_enabled = purchase.get("trackerEnabled", True)
+        if tracker_enabled:
+            adids_tracker_on.add(adid)
+        else:
+            adids_tracker_off.add(adid)
+        row = analytics.setdefault(adid, _new_adid_revenue())
+        _fold_purchase_items(row, product_analytics, purchase, tracker_enabled)
+
+    return _revenue_snapshot(
+        analytics, product_analytics, adids_tracker_on, adids_tracker_off,
+        _revenue_totals(analytics), _product_totals(product_analytics)
+    )
+
+
+def _revenue_totals(analytics: Dict[str, Dict]) -> Dict:
+    """Running totals summed over the per-ADID rows, as the dashboard used to do on every request"""
+    rows = analytics.values()
+    return {
+        "purchases": sum(a["purchases"] for a in rows),
+        "total_savings": sum(a["total_savings"] for a in rows),
+        "revenue_with_coupon": sum(a["revenue_with_coupon"] for a in rows),
+        "revenue_without_coupon": sum(a["revenue_without_coupon"] for a in rows),
+        "purchases_with_coupon": sum(a["purchases_with_coupon"] for a in rows),
+        "purchases_without_coupon": sum(a["purchases_without_coupon"] for a in rows),
+        "total_tracker_on": sum(a["total_revenue"] for a in rows if a["tracker_enabled"]),
+        "total_tracker_off": sum(a["total_revenue"] for a in rows if not a["tracker_enabled"]),
+        "purchases_tracker_on": sum(a["purchases"] for a in rows if a["tracker_enabled"]),
+        "purchases_tracker_off": sum(a["purchases"] for a in rows if not a["tracker_enabled"]),
+    }
+
+
+def _product_totals(product_analytics: Dict[str, Dict]) -> Dict:
+    return {
+        (bucket, field): sum(p[bucket][field] for p in product_analytics.values())
+        for bucket, field in RevenueAggregates.PRODUCT_TOTALS
+    }
+
+
+# Summed / unioned fields of each aggregate row type, for merging rows of different time ranges
+ADID_COUNTS = ("view_starts", "view_ends", "clicks", "total_view_duration")
+ADID_SETS = ("products_viewed", "products_clicked")
+PRODUCT_COUNTS = ("clicks", "total_view_duration")
+PERFORMANCE_COUNTS = ("clicks", "view_duration", "purchased", "revenue")
+PURCHASE_COUNTS = ("quantity", "revenue", "discounted")
+ADID_REVENUE_COUNTS = (
+    "purchases", "purchases_with_coupon", "purchases_without_coupon", "total_revenue",
+    "revenue_with_coupon", "revenue_without_coupon", "total_savings", "items_purchased",
+)
+PRODUCT_REVENUE_COUNTS = ("quantity", "revenue", "savings")
+
+
+def _add_counts(target: Dict, source: Dict, counts, sets=()):
+    """target += source for the `counts` fields; the `sets` fields are unioned"""
+    for key in counts:
+        target[key] += source[key]
+    for key in sets:
+        target[key] |= source[key]
+
+
+def _merge_rows(target: Dict[str, Dict], rows: Dict[str, Dict], counts):
+    """Fold rows of plain counters into target by key; rows seen for the first time are copied"""
+    for key, row in rows.items():
+        merged = target.get(key)
+        if merged is None:
+            target[key] = dict(row)
+        else:
+            _add_counts(merged, row, counts)
+
+
+def merge_realtime(parts: Iterable[RealtimeAggregates], distinct: Callable = set) -> Dict:
+    """
+    Combine RealtimeAggregates of disjoint time ranges into one snapshot.
+
+    The result equals recompute_realtime() over the events and purchases of
+    all parts together.
+    """
+    adid_stats: Dict[str, Dict] = {}
+    product_stats: Dict[str, Dict] = {}
+    adid_purchases: Dict[str, Dict[str, Dict]] = {}
+    adid_product_performance: Dict[str, Dict[str, Dict]] = {}
+
+    for part in parts:
+        for adid, stats in part.adid_stats.items():
+            merged = adid_stats.get(adid)
+            if merged is None:
+                merged = adid_stats[adid] = _new_adid_stats(distinct)
+            _add_counts(merged, stats, ADID_COUNTS, ADID_SETS)
+            if stats["last_activity"] is not None:
+                merged["last_activity"] = max(merged["last_activity"] or 0, stats["last_activity"])
+        for product_key, stats in part.product_stats.items():
+            merged = product_stats.get(product_key)
+            if merged is None:
+                merged = product_stats[product_key] = _new_product_stats(distinct)
+            _add_counts(merged, stats, PRODUCT_COUNTS, ("unique_adids",))
+        for adid, products in part.adid_purchases.items():
+            _merge_rows(adid_purchases.setdefault(adid, {}), products, PURCHASE_COUNTS)
+        for adid, products in part.adid_product_performance.items():
+            _merge_rows(adid_product_performance.setdefault(adid, {}), products, PERFORMANCE_COUNTS)
+
+    return {
+        "adid_stats": adid_stats,
+        "product_stats": product_stats,
+        "adid_purchases": adid_purchases,
+        "adid_product_performance": adid_product_performance,
+    }
+
+
+def merge_performance(parts: Iterable[Dict[str, Dict]]) -> Dict[str, Dict]:
+    """One ADID's adid_product_performance rows from disjoint time ranges, combined"""
+    performance: Dict[str, Dict] = {}
+    for products in parts:
+        _merge_rows(performance, products, PERFORMANCE_COUNTS)
+    return performance
+
+
+def merge_revenue(parts: Iterable[RevenueAggregates]) -> Dict:
+    """Combine RevenueAggregates of consecutive time ranges, oldest first, into one snapshot"""
+    return RevenueAggregates.merged(parts).snapshot()
+
+
+def diff_aggregates(expected, actual, path: str = "", limit: int = 20) -> List[str]:
+    """
+    List the paths where two aggregate structures disagree.
+
+    Dict key order is ignored and floats are compared with a relative
+    tolerance, since incremental sums accumulate in a different order.
+    """
+    mismatches: List[str] = []
+
+    def walk(a, b, where):
+        if len(mismatches) >= limit:
+            return
+        if isinstance(a, dict) and isinstance(b, dict):
+            for key in a.keys() | b.keys():
+                if key not in a or key not in b:
+                    mismatches.append(f"{where}/{key}: missing on one side")
+                else:
+                    walk(a[key], b[key], f"{where}/{key}")
+        elif isinstance(a, list) and isinstance(b, list):
+            if len(a) != len(b):
+                mismatches.append(f"{where}: length {len(a)} != {len(b)}")
+            for i, (x, y) in enumerate(zip(a, b)):
+                walk(x, y, f"{where}[{i}]")
+        elif isinstance(a, float) or isinstance(b, float):
+            if not (isinstance(a, (int, float)) and isinstance(b, (int, float))
+                    and math.isclose(a, b, rel_tol=1e-9, abs_tol=1e-6)):
+                mismatches.append(f"{where}: {a!r} != {b!r}")
+        elif a != b:
+            mismatches.append(f"{where}: {a!r} != {b!r}")
+
+    walk(expected, actual, path)
+    return mismatches
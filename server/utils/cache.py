@@ -0,0 +1,184 @@
+"""
+Small in-process caches for computed dashboard results and rendered responses
+"""
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional
+import gzip
+import hashlib
+import os
+
+from fastapi import Request
+from fastapi.responses import Response
+
+
+class VersionedLRUCache:
+    """
+    LRU cache whose entries remember the data version they were computed from.
+
+    A lookup only hits when the stored version equals the current one. When
+    every entry is versioned by the same counter (evict_stale), storing a
+    newer version also evicts every entry left over from older ones; entries
+    with versions of their own (e.g. one per parameter set) only age out LRU.
+    """
+
+    def __init__(self, maxsize: int = 32, evict_stale: bool = True):
+        self.maxsize = maxsize
+        self.evict_stale = evict_stale
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, version: int) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None or entry[0] != version:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, key: Hashable, version: int, value: Any):
+        if self.evict_stale:
+            stale = [k for k, (v, _) in self._entries.items() if v < version]
+            for k in stale:
+                del self._entries[k]
+        self._entries[key] = (version, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        return {"entries": len(self._entries), "maxsize": self.maxsize, "hits": self.hits, "misses": self.misses}
+
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if header is None:
+        return False
+    # Weak comparison: the same entity with or without gzip matches
+    tags = [tag.strip() for tag in header.split(",")]
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    return "*" in tags or any((tag[2:] if tag.startswith("W/") else tag) == opaque for tag in tags)
+
+
+class ResponseCache:
+    """
+    Rendered response bodies for GET routes, with ETags from the data version.
+
+    A route names its response by a key (path and parameters) and the
+    version of the data it shows (a counter that every write bumps). The
+    ETag is derived from both alone, so If-None-Match is answered 304 without
+    rendering anything, and a body rendered once serves every request until
+    the version changes. Bodies of at least `gzip_min_size` bytes are also
+    kept gzipped (compressed on first use) for clients that accept it, so a
+    hit does not compress the same bytes again. Entries are kept in LRU order
+    up to `maxsize` entries and `max_bytes` in total.
+    """
+
+    def __init__(self, maxsize: int = 64, max_bytes: int = 16 << 20, gzip_min_size: int = 1024):
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self.gzip_min_size = gzip_min_size
+        # Versions restart with the process; so must the ETags
+        self.boot = os.urandom(4).hex()
+        # key -> [version, body, gzipped body or None]
+        self._entries: "OrderedDict[Hashable, List]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0  # answered 304
+
+    def etag(self, key: Hashable, version: Hashable) -> str:
+        digest = hashlib.blake2b(repr((key, version)).encode(), digest_size=8).hexdigest()
+        return f'W/"{self.boot}-{digest}"'
+
+    def headers(self, key: Hashable, version: Hashable) -> Dict[str, str]:
+        """
+        ETag, and revalidate on every use (dashboards must not show stale data).
+
+        Every response for a key (identity, gzip or 304) varies on
+        Accept-Encoding, so a shared cache never hands one encoding to a
+        client that asked for the other.
+        """
+        return {"ETag": self.etag(key, version), "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+
+    def not_modified(self, request: Request, key: Hashable, version: Hashable) -> bool:
+        """Whether the request's If-None-Match names this version"""
+        if _etag_matches(request, self.etag(key, version)):
+            self.revalidated += 1
+            return True
+        return False
+
+    def lookup(self, request: Request, key: Hashable, version: Hashable, media_type: str) -> Optional[Response]:
+        """304 when the client has this version, the cached body if there is one, else None"""
+        headers = self.headers(key, version)
+        if self.not_modified(request, key, version):
+            return Response(status_code=304, headers=headers)
+        entry = self._entries.get(key)
+        if entry is None or entry[0] != version:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return self._response(request, entry, headers, media_type)
+
+    def _response(self, request: Request, entry: List, headers: Dict[str, str], media_type: str) -> Response:
+        """The entry's body, gzipped if the client accepts it"""
+        body = entry[1]
+        if len(body) >= self.gzip_min_size and "gzip" in request.headers.get("accept-encoding", ""):
+            if entry[2] is None:
+                entry[2] = gzip.compress(body)
+                self._bytes += len(entry[2])
+                self._shrink()
+            # GZipMiddleware passes responses with a Content-Encoding through
+            return Response(content=entry[2], media_type=media_type,
+                            headers={**headers, "Content-Encoding": "gzip"})
+        return Response(content=body, media_type=media_type, headers=headers)
+
+    def _evict(self, entry: List):
+        self._bytes -= len(entry[1]) + (len(entry[2]) if entry[2] is not None else 0)
+
+    def put(self, key: Hashable, version: Hashable, body: bytes):
+        if len(body) > self.max_bytes:
+            return
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self._evict(previous)
+        self._entries[key] = [version, body, None]
+        self._bytes += len(body)
+        self._shrink()
+
+    def _shrink(self):
+        """Drop least recently used entries until both limits hold"""
+        while len(self._entries) > self.maxsize or self._bytes > self.max_bytes:
+            self._evict(self._entries.popitem(last=False)[1])
+
+    def respond(self, request: Request, key: Hashable, version: Hashable, media_type: str,
+                render: Callable[[], bytes]) -> Response:
+        """lookup(), or render() the body now and cache it"""
+        response = self.lookup(request, key, version, media_type)
+        if response is None:
+            body = render()
+            self.put(key, version, body)
+            entry = self._entries.get(key)
+            headers = self.headers(key, version)
+            if entry is None:  # too large to cache
+                return Response(content=body, media_type=media_type, headers=headers)
+            # Compressed here rather than by GZipMiddleware, and kept for the next hit
+            response = self._response(request, entry, headers, media_type)
+        return response
+
+    def clear(self):
+        self._entries.clear()
+        self._bytes = 0
+
+    def stats(self) -> dict:
+        return {"entries": len(self._entries), "bytes": self._bytes, "maxsize": self.maxsize,
+                "max_bytes": self.max_bytes, "hits": self.hits, "misses": self.misses,
+                "revalidated": self.revalidated}
@@ -0,0 +1,548 @@
+"""
+Columnar, array-backed storage for analytics events
+"""
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional
+import json
+import os
+import pickle
+import re
+import shutil
+import time
+
+import numpy as np
+
+from utils.helpers import fsync_path
+
+# Stored in the duration column when an event has no viewDuration
+NO_DURATION = -1
+
+# Event types sent by the SDK get stable codes; anything else is interned after them
+EVENT_TYPES = ("view_start", "view_end", "view", "click")
+VIEW_START, VIEW_END, VIEW, CLICK = range(len(EVENT_TYPES))
+
+
+class StringTable:
+    """Interns hashable values (strings, tuples) to dense integer ids"""
+
+    def __init__(self, values: Iterable = ()):
+        self.values: List = []
+        self.ids: Dict = {}
+        for value in values:
+            self.intern(value)
+
+    def intern(self, value) -> int:
+        code = self.ids.get(value)
+        if code is None:
+            code = len(self.values)
+            self.ids[value] = code
+            self.values.append(value)
+        return code
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def __getitem__(self, code: int):
+        return self.values[code]
+
+    def copy(self) -> "StringTable":
+        table = StringTable.__new__(StringTable)
+        table.values = list(self.values)
+        table.ids = dict(self.ids)
+        return table
+
+    def frozen(self) -> "StringTable":
+        """Copy of the values only; the id lookup is rebuilt if the copy is ever searched"""
+        table = StringTable.__new__(StringTable)
+        table.values = list(self.values)
+        return table
+
+    def __getattr__(self, name):
+        # Only reached when ids is missing (frozen or unpickled tables)
+        if name == "ids":
+            self.ids = {value: code for code, value in enumerate(self.values)}
+            return self.ids
+        raise AttributeError(name)
+
+    def __getstate__(self):
+        # The id lookup is derived from values, so only ship the values
+        return self.values
+
+    def __setstate__(self, values):
+        self.values = values
+
+
+class Column:
+    """Growable typed array with amortized O(1) appends"""
+
+    def __init__(self, dtype, capacity: int = 1024):
+        self._data = np.empty(capacity, dtype=dtype)
+        self._size = 0
+
+    def _reserve(self, extra: int):
+        needed = self._size + extra
+        if needed > len(self._data):
+            capacity = max(needed, len(self._data) * 2)
+            grown = np.empty(capacity, dtype=self._data.dtype)
+            grown[:self._size] = self._data[:self._size]
+            # Views handed out earlier keep pointing at the old buffer, so readers stay valid
+            self._data = grown
+
+    def append(self, value):
+        self._reserve(1)
+        self._data[self._size] = value
+        self._size += 1
+
+    def extend(self, values):
+        values = np.asarray(values, dtype=self._data.dtype)
+        self._reserve(len(values))
+        self._data[self._size:self._size + len(values)] = values
+        self._size += len(values)
+
+    @property
+    def dtype(self) -> np.dtype:
+        return self._data.dtype
+
+    def view(self) -> np.ndarray:
+        """Read-only view of the filled part of the column"""
+        view = self._data[:self._size]
+        view.flags.writeable = False
+        return view
+
+    def __len__(self) -> int:
+        return self._size
+
+    def copy(self) -> "Column":
+        """Independent column holding exactly the filled values"""
+        column = Column.__new__(Column)
+        column._data = self._data[:self._size].copy()
+        column._size = self._size
+        return column
+
+    def frozen(self) -> "Column":
+        """Read-only column sharing the filled values (appends here never write over them)"""
+        column = Column.__new__(Column)
+        column._data = self.view()
+        column._size = self._size
+        return column
+
+    @classmethod
+    def from_array(cls, values: np.ndarray) -> "Column":
+        """Column that takes ownership of a writable array (no copy)"""
+        column = cls.__new__(cls)
+        column._data = values
+        column._size = len(values)
+        return column
+
+    @property
+    def nbytes(self) -> int:
+        return self._data.nbytes
+
+
+SEGMENT_PATTERN = re.compile(r"^segment-(\d{6})$")
+
+
+class SealedSegment:
+    """
+    An immutable run of events stored as one fixed-width .npy file per column.
+
+    Columns are opened with np.load(mmap_mode="r"): scans read straight from
+    the page cache and nothing is copied onto the Python heap. Pickles as its
+    path, so worker processes reopen the files instead of receiving the data.
+    meta.json records the receive-time range, so time-windowed scans can skip
+    the segment without touching its columns.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.columns = {
+            name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+            for name in EventStore.COLUMNS
+        }
+        meta_path = os.path.join(path, "meta.json")
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+            self.min_received_at = meta["min_received_at"]
+            self.max_received_at = meta["max_received_at"]
+        else:
+            received_at = self.columns["received_at"]
+            self.min_received_at = float(received_at.min())
+            self.max_received_at = float(received_at.max())
+
+    def __len__(self) -> int:
+        return len(self.columns["timestamp"])
+
+    @property
+    def name(self) -> str:
+        return os.path.basename(self.path)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(column.nbytes for column in self.columns.values())
+
+    @classmethod
+    def write(cls, path: str, columns: Dict[str, np.ndarray]) -> "SealedSegment":
+        """Write columns to a new segment directory (via a temporary one) and open it"""
+        tmp = os.path.join(os.path.dirname(path), f".tmp-{os.path.basename(path)}")
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        for name, values in columns.items():
+            with open(os.path.join(tmp, f"{name}.npy"), "wb") as f:
+                np.save(f, values)
+                f.flush()
+                os.fsync(f.fileno())
+        received_at = columns["received_at"]
+        with open(os.path.join(tmp, "meta.json"), "w") as f:
+            json.dump({
+                "events": len(received_at),
+                "min_received_at": float(received_at.min()),
+                "max_received_at": float(received_at.max()),
+            }, f)
+            f.flush()
+            os.fsync(f.fileno())
+        fsync_path(tmp)
+        # A segment left behind by a run that crashed before its next snapshot is rewritten
+        shutil.rmtree(path, ignore_errors=True)
+        os.rename(tmp, path)
+        fsync_path(os.path.dirname(path))
+        return cls(path)
+
+    def __getstate__(self):
+        return self.path
+
+    def __setstate__(self, path):
+        self.__init__(path)
+
+
+class EventRow(NamedTuple):
+    """One decoded analytics event, as returned by EventStore.rows()"""
+    adid: str
+    eventType: str
+    productId: str
+    productName: str
+    timestamp: int
+    viewDuration: Optional[int]
+    receivedAt: float
+
+    @property
+    def product_key(self) -> str:
+        return f"{self.productId} - {self.productName}"
+
+
+class EventStore:
+    """
+    Append-only columnar store for analytics events.
+
+    Each event costs a fixed number of bytes spread over typed columns.
+    ADIDs, event types and (productId, productName) pairs are interned once
+    and referenced by integer ids, so repeated strings are never stored twice.
+
+    With a segment_dir, recent ("hot") events live in growable in-memory
+    columns; once segment_events of them have accumulated they are sealed
+    into a memory-mapped SealedSegment and the hot columns start over. Scans
+    go through chunks(), one set of column arrays per segment plus the hot
+    part, so history is bounded by disk rather than by the Python heap.
+    """
+
+    COLUMNS = ("timestamp", "received_at", "duration", "event_type", "adid", "product")
+
+    def __init__(self, segment_dir: Optional[str] = None, segment_events: int = 1_000_000,
+                 retention: Optional[float] = None):
+        self.segment_dir = segment_dir
+        self.segment_events = segment_events
+        # Sealed segments whose newest event is older than this many seconds are deleted
+        self.retention = retention
+        self.segments: List[SealedSegment] = []
+        self.sealed_count = 0
+        self.next_segment = 0
+        self.expired_before: Optional[float] = None  # every event received before this is gone
+
+        self.adids = StringTable()
+        self.products = StringTable()  # (productId, productName) pairs
+        self.product_keys: List[str] = []  # "id - name" display key per product id
+        self.event_types = StringTable(EVENT_TYPES)
+
+        self.timestamp = Column(np.int64)  # client timestamp (ms)
+        self.received_at = Column(np.float64)  # server receive time (epoch seconds)
+        self.duration = Column(np.int64)  # view duration (ms) or NO_DURATION
+        self.event_type = Column(np.uint16)
+        self.adid = Column(np.uint32)
+        self.product = Column(np.uint32)
+
+        # Bumped on every append; derived results (e.g. similarity pages) are cached against it
+        self.version = 0
+
+    def __len__(self) -> int:
+        return self.sealed_count + len(self.timestamp)
+
+    def intern_product(self, product_id: str, product_name: str) -> int:
+        code = self.products.intern((product_id, product_name))
+        if code == len(self.product_keys):
+            self.product_keys.append(f"{product_id} - {product_name}")
+        return code
+
+    def append(self, adid: str, event_type: str, product_id: str, product_name: str,
+               timestamp: int, view_duration: Optional[int] = None,
+               received_at: Optional[float] = None):
+        """Append a single event"""
+        self._extend({
+            "timestamp": [timestamp],
+            "received_at": [time.time() if received_at is None else received_at],
+            "duration": [NO_DURATION if view_duration is None else view_duration],
+            "event_type": [self.event_types.intern(event_type)],
+            "adid": [self.adids.intern(adid)],
+            "product": [self.intern_product(product_id, product_name)],
+        })
+        self.version += 1
+        self._maybe_seal()
+
+    def append_batch(self, adid: str, events: Iterable, received_at: Optional[float] = None) -> int:
+        """Append a batch of SDK events (objects with AnalyticsEvent attributes) for one ADID"""
+        return self.append_batches([(adid, events)], received_at)
+
+    def append_batches(self, batches: Iterable, received_at: Optional[float] = None) -> int:
+        """
+        Append several (adid, events) batches with one extend per column
+
+        A batch may carry its own receive time as (adid, events, received_at);
+        the others get received_at (default: now).
+        """
+        received = time.time() if received_at is None else received_at
+        adid_codes, received_times, lengths, events = [], [], [], []
+        for adid, batch, *batch_received in batches:
+            batch = list(batch)
+            adid_codes.append(self.adids.intern(adid))
+            received_times.append(batch_received[0] if batch_received else received)
+            lengths.append(len(batch))
+            events.extend(batch)
+        if not events:
+            return 0
+        count = len(events)
+
+        self._extend({
+            "timestamp": [event.timestamp for event in events],
+            "received_at": np.repeat(np.array(received_times, dtype=np.float64), lengths),
+            "duration": [
+                NO_DURATION if event.viewDuration is None else event.viewDuration
+                for event in events
+            ],
+            "event_type": [self.event_types.intern(event.eventType) for event in events],
+            "adid": np.repeat(np.array(adid_codes, dtype=np.uint32), lengths),
+            "product": [self.intern_product(event.productId, event.productName) for event in events],
+        })
+        self.version += 1
+        self._maybe_seal()
+        return count
+
+    def _extend(self, values: Dict[str, Iterable]):
+        """
+        Append values to every column, or to none of them.
+
+        All values are converted to the columns' dtypes first, so a value that
+        does not fit (e.g. an out-of-range timestamp) raises before any column
+        has grown and the columns always stay the same length. Strings
+        interned for a failed append stay in the tables, unreferenced.
+        """
+        arrays = {name: np.asarray(values[name], dtype=getattr(self, name).dtype) for name in self.COLUMNS}
+        for name, array in arrays.items():
+            getattr(self, name).extend(array)
+
+    def _maybe_seal(self):
+        if self.segment_dir is not None and len(self.timestamp) >= self.segment_events:
+            self.seal()
+
+    def seal(self) -> Optional[SealedSegment]:
+        """Move the hot events into a new memory-mapped segment file set"""
+        if len(self.timestamp) == 0 or self.segment_dir is None:
+            return None
+        os.makedirs(self.segment_dir, exist_ok=True)
+        path = os.path.join(self.segment_dir, f"segment-{self.next_segment:06d}")
+        segment = SealedSegment.write(path, {name: getattr(self, name).view() for name in self.COLUMNS})
+        self.segments.append(segment)
+        self.next_segment += 1
+        self.sealed_count += len(segment)
+        for name in self.COLUMNS:
+            setattr(self, name, Column(getattr(self, name).view().dtype))
+        if self.retention is not None:
+            self.expire(segment.max_received_at - self.retention)
+        return segment
+
+    def expire(self, before: float) -> int:
+        """
+        Delete sealed segments holding only events received before `before`.
+
+        Readers that already mapped a segment keep reading it; the files are
+        unlinked, not truncated. Returns the number of events dropped.
+        """
+        dropped = 0
+        while self.segments and self.segments[0].max_received_at < before:
+            segment = self.segments.pop(0)
+            self.sealed_count -= len(segment)
+            dropped += len(segment)
+            self.expired_before = max(self.expired_before or -np.inf, segment.max_received_at)
+            shutil.rmtree(segment.path, ignore_errors=True)
+        if dropped:
+            self.version += 1
+        return dropped
+
+    def snapshot(self) -> "EventStore":
+        """
+        Read-only copy of the store as of now, cheap enough to take on the event loop.
+
+        Hot columns share their filled values (appends only write past them)
+        and the string tables copy their value lists only. Compact to pickle
+        (no spare column capacity), so it can be handed to a worker process
+        while this store keeps accepting appends.
+        """
+        copy = EventStore.__new__(EventStore)
+        copy.segment_dir = self.segment_dir
+        copy.segment_events = self.segment_events
+        # Sealed segments are immutable, so they are shared rather than copied
+        copy.segments = list(self.segments)
+        copy.sealed_count = self.sealed_count
+        copy.retention = self.retention
+        copy.next_segment = self.next_segment
+        copy.expired_before = self.expired_before
+        copy.adids = self.adids.frozen()
+        copy.products = self.products.frozen()
+        copy.product_keys = list(self.product_keys)
+        copy.event_types = self.event_types.frozen()
+        for name in self.COLUMNS:
+            setattr(copy, name, getattr(self, name).frozen())
+        copy.version = self.version
+        return copy
+
+    def save(self, directory: str):
+        """
+        Write each hot column as <name>.npy and the string tables as tables.pickle.
+
+        Sealed segments are already on disk and are only referenced by name.
+        """
+        for name in self.COLUMNS:
+            np.save(os.path.join(directory, f"{name}.npy"), getattr(self, name).view())
+        tables = {
+            "adids": self.adids,
+            "products": self.products,
+            "product_keys": self.product_keys,
+            "event_types": self.event_types,
+            "segments": [segment.name for segment in self.segments],
+            "next_segment": self.next_segment,
+            "expired_before": self.expired_before,
+            "version": self.version,
+        }
+        with open(os.path.join(directory, "tables.pickle"), "wb") as f:
+            pickle.dump(tables, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def restore(self, directory: str):
+        """Replace this store's contents with a copy written by save()"""
+        with open(os.path.join(directory, "tables.pickle"), "rb") as f:
+            tables = pickle.load(f)
+        self.adids = tables["adids"]
+        self.products = tables["products"]
+        self.product_keys = tables["product_keys"]
+        self.event_types = tables["event_types"]
+        listed = tables.get("segments", [])
+        # A segment may have expired after the snapshot was taken
+        names = [name for name in listed if os.path.isdir(os.path.join(self.segment_dir, name))]
+        self.segments = [SealedSegment(os.path.join(self.segment_dir, name)) for name in names]
+        self.sealed_count = sum(len(segment) for segment in self.segments)
+        self.next_segment = tables.get("next_segment", len(listed))
+        self.expired_before = tables.get("expired_before")
+        for name in self.COLUMNS:
+            setattr(self, name, Column.from_array(np.load(os.path.join(directory, f"{name}.npy"))))
+        self.version = tables["version"]
+        if len(names) < len(listed):
+            oldest = next(self.chunks(), None)
+            if oldest is not None:
+                self.expired_before = float(oldest["received_at"].min())
+
+    def chunks(self, since: Optional[float] = None, until: Optional[float] = None) -> Iterator[Dict[str, np.ndarray]]:
+        """
+        Read-only column arrays per sealed segment (memory-mapped), then the hot events.
+
+        With since/until only events received in [since, until) are included:
+        segments entirely outside the range are skipped by their receive-time
+        range, segments entirely inside it are passed through untouched, and
+        only chunks straddling an edge are filtered.
+        """
+        parts = [(segment.columns, segment.min_received_at, segment.max_received_at) for segment in self.segments]
+        if len(self.timestamp):
+            hot = {name: getattr(self, name).view() for name in self.COLUMNS}
+            parts.append((hot, float(hot["received_at"].min()), float(hot["received_at"].max())))
+        low = -np.inf if since is None else since
+        high = np.inf if until is None else until
+        for columns, first, last in parts:
+            if last < low or first >= high:
+                continue
+            if first >= low and last < high:
+                yield columns
+                continue
+            received_at = columns["received_at"]
+            mask = (received_at >= low) & (received_at < high)
+            if mask.any():
+                yield {name: values[mask] for name, values in columns.items()}
+
+    def columns(self) -> Dict[str, np.ndarray]:
+        """
+        Every column as one array of length len(self).
+
+        Views when nothing is sealed; otherwise the segments are concatenated
+        into new arrays, so prefer chunks() for scans over long histories.
+        """
+        chunks = list(self.chunks())
+        if len(chunks) == 1:
+            return dict(chunks[0])
+        if not chunks:
+            return {name: getattr(self, name).view() for name in self.COLUMNS}
+        return {name: np.concatenate([chunk[name] for chunk in chunks]) for name in self.COLUMNS}
+
+    def rows(self, start: int = 0) -> Iterator[EventRow]:
+        """Decode events back into rows, in arrival order"""
+        adids = self.adids.values
+        products = self.products.values
+        types = self.event_types.values
+        offset = 0
+        for cols in self.chunks():
+            count = len(cols["timestamp"])
+            skip = max(0, start - offset)
+            offset += count
+            if skip >= count:
+                continue
+            for ts, received, duration, type_code, adid_code, product_code in zip(
+                cols["timestamp"][skip:].tolist(),
+                cols["received_at"][skip:].tolist(),
+                cols["duration"][skip:].tolist(),
+                cols["event_type"][skip:].tolist(),
+                cols["adid"][skip:].tolist(),
+                cols["product"][skip:].tolist(),
+            ):
+                product_id, product_name = products[product_code]
+                yield EventRow(
+                    adid=adids[adid_code],
+                    eventType=types[type_code],
+                    productId=product_id,
+                    productName=product_name,
+                    timestamp=ts,
+                    viewDuration=None if duration == NO_DURATION else duration,
+                    receivedAt=received,
+                )
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes held by the in-memory (hot) column buffers (including spare capacity)"""
+        return sum(getattr(self, name).nbytes for name in self.COLUMNS)
+
+    @property
+    def mapped_bytes(self) -> int:
+        """Bytes in sealed, memory-mapped segment files"""
+        return sum(segment.nbytes for segment in self.segments)
+
+    def stats(self) -> dict:
+        return {
+            "events": len(self),
+            "hot_events": len(self.timestamp),
+            "segments": len(self.segments),
+            "expired_before": self.expired_before,
+            "heap_bytes": self.nbytes,
+            "mapped_bytes": self.mapped_bytes,
+        }
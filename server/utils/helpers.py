@@ -2,6 +2,8 @@
 Helper functions and utilities
 """
 from datetime import datetime
+import json
+import os
 import random
 import string
 
@@ -21,3 +23,16 @@ def generate_synthetic_adid(base_adid: str, index: int) -> str:
     """Generate synthetic ADID for demo purposes"""
     return f"{base_adid}-SYN{index}"
 
+def json_body(content) -> bytes:
+    """Serialize a response body the way FastAPI's JSONResponse does"""
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode()
+
+def fsync_path(path: str):
+    """fsync a file or directory by path (directories only where the OS allows opening them)"""
+    if os.path.isdir(path) and os.name != "posix":
+        return
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
@@ -0,0 +1,146 @@
+"""
+Bounded in-process ingest queue for analytics event batches
+"""
+from collections import deque
+from typing import Deque, List, Optional, Sequence, Tuple
+import asyncio
+import logging
+import time
+
+from utils.log import get_logger
+
+logger = get_logger("ingest")
+
+
+class IngestQueue:
+    """
+    Decouples /analytics-events from storage.
+
+    The request handler only calls offer(), which enqueues the batch or
+    refuses it when max_events events are already waiting (the handler then
+    answers 503 + Retry-After). A consumer task drains everything that is
+    queued in one go: it appends them to the event store with one extend
+    per column and folds them into each of `aggregates` (objects with
+    add_batch(), e.g. the realtime aggregates and the time rollups). Each
+    batch keeps the receive time the handler gave it, which is also the one
+    written to the WAL, so a replay puts events in the same rollup buckets.
+    If the store refuses a drain, the batches are retried one at a time and
+    only the ones that still fail are logged and dropped.
+    """
+
+    def __init__(self, store, aggregates: Sequence, max_events: int = 100_000, retry_after: int = 1):
+        self.store = store
+        self.aggregates = list(aggregates)
+        self.max_events = max_events
+        self.retry_after = retry_after  # seconds, sent as Retry-After when the queue is full
+
+        self._batches: Deque[Tuple[str, List, float]] = deque()
+        self._pending = 0  # events waiting in _batches
+        self._wakeup = asyncio.Event()
+        self._consumer: Optional[asyncio.Task] = None
+
+        self.accepted = 0
+        self.rejected = 0
+        self.stored = 0
+        self.failed = 0  # events in batches the store refused
+        self.drains = 0
+
+    def __len__(self) -> int:
+        return self._pending
+
+    def offer(self, adid: str, events: List, received_at: Optional[float] = None) -> bool:
+        """Enqueue one batch received at received_at (default: now); False when it does not fit (backpressure)"""
+        if self._pending + len(events) > self.max_events and self._pending > 0:
+            self.rejected += len(events)
+            return False
+        self._batches.append((adid, events, time.time() if received_at is None else received_at))
+        self._pending += len(events)
+        self.accepted += len(events)
+        self._wakeup.set()
+        return True
+
+    def drain(self) -> int:
+        """Store everything queued so far; returns the number of events stored"""
+        if not self._batches:
+            return 0
+        batches = list(self._batches)
+        try:
+            count = self.store.append_batches(batches)
+        except Exception:
+            # Nothing was stored (appends are all-or-nothing): retry one batch at a time
+            # so a bad batch only loses itself, not every batch queued with it
+            batches, count = self._append_each(batches)
+        self._batches.clear()
+        self._pending = 0
+
+        for aggregates in self.aggregates:
+            for adid, events, received_at in batches:
+                aggregates.add_batch(adid, events, received_at)
+        self.stored += count
+        self.drains += 1
+
+        logger.debug("Stored %d events from %d batches", count, len(batches),
+                     extra={"fields": {"events": count, "batches": len(batches)}})
+        # Per-event lines are skipped entirely (no formatting, no records) unless DEBUG is on
+        if logger.isEnabledFor(logging.DEBUG):
+            for adid, events, _ in batches:
+                for event in events:
+                    fields = {"adid": adid, "event_type": event.eventType,
+                              "product_id": event.productId, "view_duration": event.viewDuration}
+                    if event.viewDuration is not None:
+                        logger.debug("  - %s: %s - %s (duration: %dms)", event.eventType, event.productId,
+                                     event.productName, event.viewDuration,
+                                     extra={"sampled": True, "fields": fields})
+                    else:
+                        logger.debug("  - %s: %s - %s", event.eventType, event.productId, event.productName,
+                                     extra={"sampled": True, "fields": fields})
+        return count
+
+    def _append_each(self, batches: List[Tuple[str, List, float]]) -> Tuple[List, int]:
+        """Store batches one by one; returns the stored ones and their event count"""
+        stored, count = [], 0
+        for batch in batches:
+            adid, events, received_at = batch
+            try:
+                count += self.store.append_batches([batch])
+            except Exception:
+                self.failed += len(events)
+                logger.exception("Dropped %d events from %s that could not be stored", len(events), adid,
+                                 extra={"fields": {"adid": adid, "events": len(events), "received_at": received_at}})
+                continue
+            stored.append(batch)
+        return stored, count
+
+    def start(self):
+        """Start the consumer task (call from a running event loop)"""
+        if self._consumer is None:
+            self._consumer = asyncio.get_running_loop().create_task(self._consume())
+
+    async def stop(self):
+        """Stop the consumer and store whatever is still queued"""
+        if self._consumer is not None:
+            self._consumer.cancel()
+            self._consumer = None
+        self.drain()
+
+    async def _consume(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            try:
+                self.drain()
+            except Exception:
+                logger.exception("Event ingest failed")
+            # Let more handlers enqueue before the next drain
+            await asyncio.sleep(0)
+
+    def stats(self) -> dict:
+        return {
+            "queued_events": self._pending,
+            "max_events": self.max_events,
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+            "stored": self.stored,
+            "failed": self.failed,
+            "drains": self.drains,
+        }
@@ -0,0 +1,226 @@
+"""
+Force-directed graph layout that warm-starts from previous node positions
+"""
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+# Exact O(N^2) repulsion up to this many nodes; above it far-away nodes are grouped by grid cell
+EXACT_MAX_NODES = 300
+
+# Average nodes per cell for the grid-approximated repulsion
+GRID_CELL_NODES = 16
+
+COLD_ITERATIONS = 50
+WARM_ITERATIONS = 10
+
+# Initial temperature (max step per iteration), as a fraction of the [-1, 1] layout width
+COLD_TEMPERATURE = 0.1
+WARM_TEMPERATURE = 0.01
+
+# New nodes are seeded at the weighted mean of this many of their strongest placed neighbors
+SEED_NEIGHBORS = 3
+
+LAYOUT_METHODS = ("auto", "exact", "grid")
+
+MIN_DISTANCE = 1e-4
+
+
+def _repulsion_exact(pos: np.ndarray, k: float) -> np.ndarray:
+    dx = pos[:, 0, None] - pos[None, :, 0]
+    dy = pos[:, 1, None] - pos[None, :, 1]
+    strength = k * k / np.maximum(dx * dx + dy * dy, MIN_DISTANCE ** 2)
+    return np.stack([(dx * strength).sum(axis=1), (dy * strength).sum(axis=1)], axis=1)
+
+
+def _repulsion_grid(pos: np.ndarray, k: float) -> np.ndarray:
+    """
+    Grid-approximated repulsion.
+
+    Nodes are bucketed into a square grid of about GRID_CELL_NODES nodes per
+    cell. Pairs closer than one cell width repel exactly (found with a k-d
+    tree); every other cell acts on a node's cell as a single mass at its
+    centroid. Cost is O(N log N + close pairs + cells^2) instead of O(N^2).
+    """
+    n = len(pos)
+    side = max(1, int(np.sqrt(n / GRID_CELL_NODES)))
+    low = pos.min(axis=0)
+    width = max(np.ptp(pos, axis=0).max(), MIN_DISTANCE) / side
+    cell_xy = np.minimum(((pos - low) / width).astype(np.int64), side - 1)
+    cell = cell_xy[:, 0] * side + cell_xy[:, 1]
+
+    # Near field: exact forces between nodes less than one cell width apart
+    i, j = cKDTree(pos).query_pairs(width, output_type="ndarray").T
+    delta = pos[i] - pos[j]
+    dist2 = np.maximum(np.einsum("ij,ij->i", delta, delta), MIN_DISTANCE ** 2)
+    force = delta * (k * k / dist2)[:, None]
+    near = np.stack([
+        np.bincount(i, force[:, axis], n) - np.bincount(j, force[:, axis], n)
+        for axis in range(2)
+    ], axis=1)
+
+    # Far field: cell-to-cell forces between centroids, skipping each cell's 3 x 3 neighborhood
+    count = np.bincount(cell, minlength=side * side).astype(np.float64)
+    occupied = np.flatnonzero(count)
+    mass = count[occupied]
+    centroid = np.stack([np.bincount(cell, pos[:, axis], side * side)[occupied] for axis in range(2)], axis=1)
+    centroid /= mass[:, None]
+    grid_x, grid_y = divmod(occupied, side)
+    adjacent = ((np.abs(grid_x[:, None] - grid_x[None, :]) <= 1)
+                & (np.abs(grid_y[:, None] - grid_y[None, :]) <= 1))
+    dx = centroid[:, 0, None] - centroid[None, :, 0]
+    dy = centroid[:, 1, None] - centroid[None, :, 1]
+    strength = np.where(adjacent, 0.0, mass[None, :] * k * k / np.maximum(dx * dx + dy * dy, MIN_DISTANCE ** 2))
+    far = np.zeros((side * side, 2))
+    far[occupied, 0] = (dx * strength).sum(axis=1)
+    far[occupied, 1] = (dy * strength).sum(axis=1)
+    return near + far[cell]
+
+
+def _attraction(pos: np.ndarray, sources: np.ndarray, targets: np.ndarray,
+                weights: np.ndarray, k: float) -> np.ndarray:
+    delta = pos[sources] - pos[targets]
+    dist = np.sqrt(np.einsum("ij,ij->i", delta, delta))
+    force = delta * (weights * dist / k)[:, None]
+    n = len(pos)
+    return np.stack([
+        np.bincount(targets, force[:, axis], n) - np.bincount(sources, force[:, axis], n)
+        for axis in range(2)
+    ], axis=1)
+
+
+def rescale(pos: np.ndarray) -> np.ndarray:
+    """Center the layout on the origin and scale it to fit [-1, 1]"""
+    pos = pos - pos.mean(axis=0)
+    extent = np.abs(pos).max()
+    return pos / extent if extent > 0 else pos
+
+
+def force_layout(
+    n: int,
+    sources: np.ndarray,
+    targets: np.ndarray,
+    weights: np.ndarray,
+    initial: Optional[np.ndarray] = None,
+    iterations: int = COLD_ITERATIONS,
+    temperature: float = COLD_TEMPERATURE,
+    k: Optional[float] = None,  # as a fraction of the layout width
+    method: str = "auto",
+    seed: int = 42,
+) -> np.ndarray:
+    """
+    Fruchterman-Reingold layout of n nodes and weighted undirected edges.
+
+    Starts from `initial` (n x 2) when given, otherwise from random positions.
+    Each node moves at most the current temperature per iteration, cooling
+    linearly to zero. method="exact" computes all-pairs repulsion, "grid" the
+    grid approximation, "auto" picks exact up to EXACT_MAX_NODES nodes.
+
+    The ideal edge length k (default: layout width / sqrt(n)) and the
+    temperature are relative to the current width of the layout, so the
+    result does not depend on its absolute scale.
+    Returns an (n x 2) array scaled to [-1, 1].
+    """
+    if method not in LAYOUT_METHODS:
+        raise ValueError(f"Unknown layout method: {method!r} (expected one of {LAYOUT_METHODS})")
+    rng = np.random.default_rng(seed)
+    if initial is None:
+        pos = rng.uniform(-1.0, 1.0, size=(n, 2))
+    else:
+        pos = np.array(initial, dtype=np.float64)
+    if n < 2:
+        return np.zeros((n, 2))
+
+    if method == "auto":
+        method = "exact" if n <= EXACT_MAX_NODES else "grid"
+    repulsion = _repulsion_exact if method == "exact" else _repulsion_grid
+
+    sources = np.asarray(sources, dtype=np.int64)
+    targets = np.asarray(targets, dtype=np.int64)
+    weights = np.asarray(weights, dtype=np.float64)
+    for step in range(iterations):
+        width = max(np.ptp(pos, axis=0).max(), MIN_DISTANCE)
+        t = temperature * width * (1.0 - step / iterations)
+        ideal = (k if k is not None else 1.0 / np.sqrt(n)) * width
+        displacement = repulsion(pos, ideal) + _attraction(pos, sources, targets, weights, ideal)
+        length = np.sqrt(np.einsum("ij,ij->i", displacement, displacement))
+        factor = np.minimum(length, t) / np.maximum(length, MIN_DISTANCE)
+        pos += displacement * factor[:, None]
+
+    return rescale(pos)
+
+
+def seed_positions(
+    names: Sequence[str],
+    previous: Dict[str, Sequence[float]],
+    sources: np.ndarray,
+    targets: np.ndarray,
+    weights: np.ndarray,
+    seed: int = 42,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Initial positions for a warm start.
+
+    Nodes in `previous` (name -> [x, y]) keep their position. New nodes are
+    placed at the similarity-weighted mean of their SEED_NEIGHBORS strongest
+    previously placed neighbors, or at random if they have none. A little
+    jitter keeps seeded nodes from landing exactly on a neighbor.
+    Returns (positions, known) where known marks nodes taken from `previous`.
+    """
+    n = len(names)
+    rng = np.random.default_rng(seed)
+    pos = rng.uniform(-1.0, 1.0, size=(n, 2))
+    known = np.zeros(n, dtype=bool)
+    for i, name in enumerate(names):
+        xy = previous.get(name)
+        if xy is not None:
+            pos[i] = xy
+            known[i] = True
+    if known.all() or not known.any():
+        return pos, known
+
+    # Directed (new node -> placed neighbor) links, strongest first per node
+    node = np.concatenate([sources, targets]).astype(np.int64)
+    neighbor = np.concatenate([targets, sources]).astype(np.int64)
+    weight = np.concatenate([weights, weights]).astype(np.float64)
+    keep = ~known[node] & known[neighbor]
+    node, neighbor, weight = node[keep], neighbor[keep], weight[keep]
+    if len(node) > 0:
+        order = np.lexsort((-weight, node))
+        node, neighbor, weight = node[order], neighbor[order], weight[order]
+        starts = np.flatnonzero(np.r_[True, node[1:] != node[:-1]])
+        rank = np.arange(len(node)) - np.repeat(starts, np.diff(np.r_[starts, len(node)]))
+        keep = rank < SEED_NEIGHBORS
+        node, neighbor, weight = node[keep], neighbor[keep], weight[keep]
+
+        total = np.bincount(node, weight, n)
+        seeded = total > 0
+        for axis in range(2):
+            mean = np.bincount(node, weight * pos[neighbor, axis], n)
+            pos[seeded, axis] = mean[seeded] / total[seeded]
+        pos[seeded] += rng.normal(scale=0.02, size=(int(seeded.sum()), 2))
+    return pos, known
+
+
+def incremental_layout(
+    names: List[str],
+    sources: np.ndarray,
+    targets: np.ndarray,
+    weights: np.ndarray,
+    previous: Optional[Dict[str, Sequence[float]]] = None,
+    method: str = "auto",
+    seed: int = 42,
+) -> np.ndarray:
+    """
+    Layout that reuses `previous` positions (name -> [x, y]) when there are any.
+
+    A warm start runs WARM_ITERATIONS at a low temperature so existing nodes
+    barely move; otherwise this is a cold COLD_ITERATIONS layout.
+    """
+    if previous:
+        initial, known = seed_positions(names, previous, sources, targets, weights, seed)
+        if known.any():
+            return force_layout(len(names), sources, targets, weights, initial,
+                                WARM_ITERATIONS, WARM_TEMPERATURE, method=method, seed=seed)
+    return force_layout(len(names), sources, targets, weights, method=method, seed=seed)
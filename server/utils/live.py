@@ -0,0 +1,188 @@
+"""
+Live feed of realtime dashboard changes, pushed to open pages over Server-Sent Events
+"""
+from collections import deque
+from datetime import datetime
+from typing import AsyncIterator, Deque, Dict, Iterable, Optional, Set
+import asyncio
+import json
+
+from utils.log import get_logger
+
+logger = get_logger("live")
+
+# Keeps the stream's small messages out of GZipMiddleware, which would hold them back
+SSE_HEADERS = {"Cache-Control": "no-cache", "Content-Encoding": "identity", "X-Accel-Buffering": "no"}
+
+
+class LiveFeed:
+    """
+    Coalesced deltas of the realtime aggregates for /analytics-realtime/stream.
+
+    While anyone is subscribed, ingest only marks what changed: the product
+    keys and ADID of each event batch, and a short summary of each purchase.
+    Every `interval` seconds a publisher task turns the marks into one delta -
+    the current counters of the changed products (those in the aggregates'
+    rankings, when there are any), ADIDs seen for the first time, active
+    ADIDs and the new purchases - encodes it once and queues the
+    same bytes for every subscriber, so a viewer costs one queue put per
+    interval however busy ingest is. A subscriber more than `backlog`
+    messages behind is disconnected (its page reconnects and reloads).
+
+    add_batch() must run before `aggregates` sees the same batch: an ADID is
+    new when the aggregates do not know it yet.
+    """
+
+    def __init__(self, aggregates, interval: float = 1.0, backlog: int = 30, keepalive: float = 15.0,
+                 max_listed: int = 50):
+        self.aggregates = aggregates
+        self.interval = interval
+        self.backlog = backlog
+        self.keepalive = keepalive
+        self.max_listed = max_listed  # ADIDs / purchases listed per delta; the counts cover the rest
+
+        self._subscribers: Set[asyncio.Queue] = set()
+        self._products: Set[str] = set()
+        self._new_adids: Set[str] = set()
+        self._active_adids: Set[str] = set()
+        self._purchases: Deque[Dict] = deque(maxlen=max_listed)
+        self._purchase_count = 0
+        self._idle = 0.0  # seconds since the last message
+        self._publisher: Optional[asyncio.Task] = None
+
+        self.deltas = 0
+        self.messages = 0
+        self.dropped = 0
+
+    def add_batch(self, adid: str, events: Iterable, received_at):
+        """Mark the products and ADID of an event batch as changed"""
+        if not self._subscribers:
+            return
+        self._products.update(f"{event.productId} - {event.productName}" for event in events)
+        self._active_adids.add(adid)
+        if adid not in self.aggregates.adid_stats:
+            self._new_adids.add(adid)
+
+    def add_purchase(self, purchase: Dict):
+        """Queue a summary of a purchase record for the next delta"""
+        if not self._subscribers:
+            return
+        self._purchases.append({
+            "purchaseId": purchase["purchaseId"],
+            "adid": purchase["adid"],
+            "items": [item["name"] for item in purchase["items"]],
+            "total": purchase["total"],
+            "trackerEnabled": purchase["trackerEnabled"],
+            "timestamp": purchase["timestamp"],
+        })
+        self._purchase_count += 1
+        self._active_adids.add(purchase["adid"])
+
+    def delta(self) -> Optional[Dict]:
+        """What changed since the last delta (None if nothing did); clears the marks"""
+        if not (self._products or self._active_adids or self._purchases):
+            return None
+        product_stats = self.aggregates.product_stats
+        # With rankings, only their products can be in a live page's table
+        rankings = [ranking.values for ranking in self.aggregates.rankings.values()]
+        products = {}
+        for product_key in self._products:
+            stats = product_stats.get(product_key)
+            if stats is not None and (not rankings or any(product_key in ranking for ranking in rankings)):
+                products[product_key] = {
+                    "clicks": stats["clicks"],
+                    "total_view_duration": stats["total_view_duration"],
+                    "unique_adids": len(stats["unique_adids"]),
+                }
+        delta = {
+            "updated": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            "adid_count": len(self.aggregates.adid_stats),
+            "product_count": len(product_stats),
+            "products": products,
+            "new_adid_count": len(self._new_adids),
+            "new_adids": sorted(self._new_adids)[:self.max_listed],
+            "active_adid_count": len(self._active_adids),
+            "active_adids": sorted(self._active_adids)[:self.max_listed],
+            "purchase_count": self._purchase_count,
+            "purchases": list(self._purchases),
+        }
+        self._products, self._new_adids, self._active_adids = set(), set(), set()
+        self._purchases.clear()
+        self._purchase_count = 0
+        return delta
+
+    def publish(self):
+        """Send the pending delta (or a keepalive comment when one is due) to every subscriber"""
+        if not self._subscribers:
+            return
+        delta = self.delta()
+        if delta is not None:
+            message = f"event: delta\ndata: {json.dumps(delta, separators=(',', ':'))}\n\n".encode()
+            self.deltas += 1
+        elif self._idle >= self.keepalive:
+            message = b": keepalive\n\n"
+        else:
+            self._idle += self.interval
+            return
+        self._idle = 0.0
+        for queue in list(self._subscribers):
+            try:
+                queue.put_nowait(message)
+                self.messages += 1
+            except asyncio.QueueFull:
+                self._disconnect(queue)
+                self.dropped += 1
+
+    def _disconnect(self, queue: asyncio.Queue):
+        self._subscribers.discard(queue)
+        while not queue.empty():
+            queue.get_nowait()
+        queue.put_nowait(None)
+
+    async def stream(self) -> AsyncIterator[bytes]:
+        """One subscriber's SSE stream; ends when it falls behind or the feed stops"""
+        queue: asyncio.Queue = asyncio.Queue(self.backlog)
+        self._subscribers.add(queue)
+        try:
+            yield f"retry: {int(self.interval * 2000)}\n\n".encode()
+            while True:
+                message = await queue.get()
+                if message is None:
+                    return
+                yield message
+        finally:
+            self._subscribers.discard(queue)
+
+    def close_streams(self):
+        """End every open stream"""
+        for queue in list(self._subscribers):
+            self._disconnect(queue)
+
+    def start(self):
+        """Start the publisher task (call from a running event loop)"""
+        if self._publisher is None:
+            self._publisher = asyncio.get_running_loop().create_task(self._publish_loop())
+
+    async def stop(self):
+        """Stop publishing and end every open stream"""
+        if self._publisher is not None:
+            self._publisher.cancel()
+            self._publisher = None
+        self.close_streams()
+
+    async def _publish_loop(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                self.publish()
+            except Exception:
+                logger.exception("Live feed publish failed")
+
+    def stats(self) -> dict:
+        return {
+            "subscribers": len(self._subscribers),
+            "interval": self.interval,
+            "deltas": self.deltas,
+            "messages": self.messages,
+            "dropped": self.dropped,
+        }
@@ -0,0 +1,122 @@
+"""
+Leveled, sampled, queue-backed logging for the server
+"""
+from typing import Optional, TextIO
+import atexit
+import itertools
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+
+LOGGER_NAME = "server"
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def get_logger(name: str) -> logging.Logger:
+    """Logger under the server hierarchy, e.g. get_logger("ingest") -> "server.ingest" """
+    return logging.getLogger(f"{LOGGER_NAME}.{name}")
+
+
+class SampleFilter(logging.Filter):
+    """
+    Keeps 1 in every `rate` records logged with extra={"sampled": True}.
+
+    Used for per-event / per-item lines; every other record passes.
+    """
+
+    def __init__(self, rate: int = 1):
+        super().__init__()
+        self.rate = max(1, int(rate))
+        self._seen = itertools.count()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.rate == 1 or not getattr(record, "sampled", False):
+            return True
+        return next(self._seen) % self.rate == 0
+
+
+class RecordQueueHandler(logging.handlers.QueueHandler):
+    """
+    Enqueues records as logged, so the listener thread does all the formatting.
+
+    QueueHandler.prepare() would format the message and traceback on the
+    calling thread (and drop exc_info). Records never leave the process, so
+    they need no flattening; log arguments just must not change after the call.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+class TextFormatter(logging.Formatter):
+    """The classic "[Server] message" lines, with the level for warnings and errors"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        message = record.getMessage()
+        if record.levelno >= logging.WARNING:
+            message = f"{record.levelname}: {message}"
+        line = f"[Server] {message}"
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        return line
+
+
+class JsonFormatter(logging.Formatter):
+    """One compact JSON object per line; structured values come from extra={"fields": {...}}"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        entry.update(getattr(record, "fields", None) or {})
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, separators=(",", ":"), default=str)
+
+
+def setup_logging(level: str = "INFO", json_lines: bool = False, sample_rate: int = 1,
+                  stream: Optional[TextIO] = None) -> logging.handlers.QueueListener:
+    """
+    Route the server loggers through a queue to a background writer thread.
+
+    Request handlers only pay for building the record and a queue put; the
+    formatting (message, traceback) and the write to `stream` (stdout by
+    default) happen on the listener thread. Sampled records that are dropped
+    never reach the queue.
+    """
+    global _listener
+    shutdown_logging()
+
+    logger = logging.getLogger(LOGGER_NAME)
+    logger.setLevel(level.upper() if isinstance(level, str) else level)
+    logger.propagate = False
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+
+    records = queue.SimpleQueue()
+    queue_handler = RecordQueueHandler(records)
+    queue_handler.addFilter(SampleFilter(sample_rate))
+    logger.addHandler(queue_handler)
+
+    writer = logging.StreamHandler(stream or sys.stdout)
+    writer.setFormatter(JsonFormatter() if json_lines else TextFormatter())
+    _listener = logging.handlers.QueueListener(records, writer)
+    _listener.start()
+    return _listener
+
+
+def shutdown_logging():
+    """Flush queued records and stop the writer thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(shutdown_logging)
@@ -0,0 +1,259 @@
+"""
+Time-bucketed rollups of the dashboard aggregates, for windowed queries
+"""
+from datetime import datetime
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+import math
+import re
+import time
+
+from utils.aggregates import RealtimeAggregates, RevenueAggregates, merge_performance, merge_realtime, merge_revenue
+
+MINUTE = 60
+HOUR = 3600
+DAY = 24 * HOUR
+
+WINDOW_PATTERN = re.compile(r"^(\d+(?:\.\d+)?)([smhd]?)$")
+WINDOW_UNITS = {"": 1, "s": 1, "m": MINUTE, "h": HOUR, "d": DAY}
+
+
+def parse_time(value: str) -> float:
+    """Epoch seconds, or an ISO 8601 date/time (naive values are local time)"""
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        raise ValueError(f"Invalid time: {value!r} (expected epoch seconds or ISO 8601)")
+
+
+def parse_window(value: str) -> float:
+    """A duration such as 900, 15m, 1h or 7d, in seconds"""
+    match = WINDOW_PATTERN.match(value.strip().lower())
+    if match is None:
+        raise ValueError(f"Invalid window: {value!r} (expected e.g. 900, 15m, 1h or 7d)")
+    return float(match.group(1)) * WINDOW_UNITS[match.group(2)]
+
+
+def resolve_window(since: Optional[str] = None, until: Optional[str] = None, window: Optional[str] = None,
+                   now: Optional[float] = None) -> Tuple[Optional[float], Optional[float]]:
+    """
+    Turn since/until/window query parameters into an epoch (since, until) range.
+
+    window is a rolling duration ending at until (or now); it cannot be combined
+    with since. (None, None) means the whole history.
+    """
+    if window is not None and since is not None:
+        raise ValueError("Use either since or window, not both")
+    start = parse_time(since) if since is not None else None
+    end = parse_time(until) if until is not None else None
+    if window is not None:
+        end_or_now = end if end is not None else (time.time() if now is None else now)
+        start = end_or_now - parse_window(window)
+    if start is not None and end is not None and start >= end:
+        raise ValueError("since must be before until")
+    return start, end
+
+
+def purchase_time(purchase: Dict) -> float:
+    return datetime.fromisoformat(purchase["timestamp"]).timestamp()
+
+
+class Bucket:
+    """Dashboard aggregates for everything received in one time bucket"""
+
+    __slots__ = ("realtime", "revenue")
+
+    def __init__(self, distinct: Callable = set):
+        self.realtime = RealtimeAggregates(distinct)
+        self.revenue = RevenueAggregates()
+
+    @classmethod
+    def merged(cls, parts: List["Bucket"], distinct: Callable = set) -> "Bucket":
+        """One bucket for a longer period, from its sub-buckets in time order"""
+        bucket = cls.__new__(cls)
+        bucket.realtime = RealtimeAggregates.merged((part.realtime for part in parts), distinct)
+        bucket.revenue = RevenueAggregates.merged(part.revenue for part in parts)
+        return bucket
+
+
+class TimeRollups:
+    """
+    Minute, hour and day buckets of the /analytics-realtime and /analytics aggregates.
+
+    Events are bucketed by their server receive time and purchases by their
+    timestamp. Ingest only updates minute buckets; once an hour (day) has
+    passed, its minute (hour) buckets are merged into one hour (day) bucket.
+    Late records for an already merged period also go straight into it.
+
+    A window is answered by merging the coarsest complete buckets that fit
+    it, so the cost depends on the number of buckets and the entities in
+    them, not on the number of events. Each tier is dropped after its
+    retention (None keeps it forever); a window edge is rounded out to the
+    finest tier still kept there (minutes, then hours, then days).
+
+    With HyperLogLog `distinct` (see RealtimeAggregates) the unique counts
+    of a window are unions of the buckets' sketches, so they keep the
+    sketch's error bound however many buckets the window spans.
+    """
+
+    WIDTHS = (MINUTE, HOUR, DAY)
+    distinct: Callable = set
+
+    def __init__(self, retention: Optional[Dict[int, Optional[float]]] = None, distinct: Callable = set):
+        self.distinct = distinct
+        self.retention = {MINUTE: 2 * DAY, HOUR: 90 * DAY, DAY: None}
+        self.retention.update(retention or {})
+        self.buckets: Dict[int, Dict[int, Bucket]] = {width: {} for width in self.WIDTHS}
+        # Buckets of this width starting before complete[width] are merged (or their period had no data)
+        self.complete = {HOUR: None, DAY: None}
+        # Buckets of this width starting before horizon[width] have been dropped
+        self.horizon = {width: -math.inf for width in self.WIDTHS}
+        self._minute = None  # newest minute seen; rolling up happens when it advances
+
+    def restore(self, other: "TimeRollups"):
+        """Take over the buckets of another instance (e.g. from a snapshot), keeping this retention"""
+        self.distinct = other.distinct
+        self.buckets = other.buckets
+        self.complete = other.complete
+        self.horizon = other.horizon
+        self._minute = other._minute
+        if self._minute is not None:
+            self.expire(self._minute)
+
+    def _buckets_at(self, timestamp: float) -> Iterator[Bucket]:
+        """The minute bucket for timestamp, plus its hour/day buckets where those are already merged"""
+        minute = int(timestamp // MINUTE) * MINUTE
+        if self._minute is None or minute > self._minute:
+            self._minute = minute
+            self.roll_up(minute)
+        for width in self.WIDTHS:
+            start = int(timestamp // width) * width
+            if start < self.horizon[width]:
+                continue
+            if width != MINUTE and (self.complete[width] is None or start >= self.complete[width]):
+                continue
+            bucket = self.buckets[width].get(start)
+            if bucket is None:
+                bucket = self.buckets[width][start] = Bucket(self.distinct)
+            yield bucket
+
+    def add_batch(self, adid: str, events: Iterable, received_at: float):
+        """Fold a batch of SDK events for one ADID, all received at received_at"""
+        events = list(events)
+        for bucket in self._buckets_at(received_at):
+            bucket.realtime.add_batch(adid, events, received_at)
+
+    def add_purchase(self, purchase: Dict):
+        for bucket in self._buckets_at(purchase_time(purchase)):
+            bucket.realtime.add_purchase(purchase)
+            bucket.revenue.add_purchase(purchase)
+
+    def roll_up(self, now: float):
+        """Merge every hour and day that ended before `now`, then drop expired buckets"""
+        for width, finer in ((HOUR, MINUTE), (DAY, HOUR)):
+            finer_buckets = self.buckets[finer]
+            end = int(now // width) * width
+            if width == DAY:
+                if self.complete[HOUR] is None:
+                    continue
+                end = min(end, int(self.complete[HOUR] // DAY) * DAY)
+            start = self.complete[width]
+            if start is None:
+                if not finer_buckets:
+                    continue
+                start = int(min(finer_buckets) // width) * width
+            buckets = self.buckets[width]
+            for period in range(int(start), end, width):
+                parts = [finer_buckets[t] for t in range(period, period + width, finer) if t in finer_buckets]
+                if parts:
+                    buckets[period] = Bucket.merged(parts, self.distinct)
+            self.complete[width] = max(start, end)
+        self.expire(now)
+
+    def expire(self, now: float):
+        """Drop buckets older than their tier's retention, in whole periods of the next tier"""
+        for width, coarser in ((MINUTE, HOUR), (HOUR, DAY), (DAY, DAY)):
+            retention = self.retention[width]
+            if retention is None:
+                continue
+            horizon = int((now - retention) // coarser) * coarser
+            if coarser in self.complete:
+                # Never drop anything that is not merged into the next tier yet
+                complete = self.complete[coarser]
+                horizon = min(horizon, complete if complete is not None else -math.inf)
+            if horizon <= self.horizon[width]:
+                continue
+            buckets = self.buckets[width]
+            for start in [start for start in buckets if start < horizon]:
+                del buckets[start]
+            self.horizon[width] = horizon
+
+    def _finest_width(self, timestamp: float) -> int:
+        for width in self.WIDTHS:
+            if timestamp >= self.horizon[width]:
+                return width
+        return DAY
+
+    def cover(self, since: Optional[float], until: Optional[float]) -> List[Bucket]:
+        """Existing buckets that together cover [since, until), in time order"""
+        kept = [(min(buckets), max(buckets) + width) for width, buckets in self.buckets.items() if buckets]
+        if not kept:
+            return []
+        # Clamped to the buckets that exist, so far-away bounds cost nothing
+        start, end = min(first for first, _ in kept), max(last for _, last in kept)
+        if since is not None:
+            width = self._finest_width(since)
+            start = max(start, math.floor(since / width) * width)
+        if until is not None:
+            width = self._finest_width(until)
+            end = min(end, math.ceil(until / width) * width)
+
+        covered = []
+        position = start
+        while position < end:
+            for width in (DAY, HOUR):
+                complete = self.complete[width]
+                if position % width == 0 and position + width <= end and complete is not None \
+                        and position + width <= complete:
+                    break
+            else:
+                width = MINUTE
+            bucket = self.buckets[width].get(position)
+            position += width
+            if bucket is not None:
+                covered.append(bucket)
+        return covered
+
+    def realtime(self, since: Optional[float] = None, until: Optional[float] = None) -> Dict:
+        """/analytics-realtime aggregates for a window, shaped like RealtimeAggregates.snapshot()"""
+        return merge_realtime((bucket.realtime for bucket in self.cover(since, until)), self.distinct)
+
+    def revenue(self, since: Optional[float] = None, until: Optional[float] = None) -> Dict:
+        """/analytics aggregates for a window, shaped like RevenueAggregates.snapshot()"""
+        return merge_revenue(bucket.revenue for bucket in self.cover(since, until))
+
+    def adids(self, since: Optional[float] = None, until: Optional[float] = None) -> set:
+        """ADIDs with analytics events in a window"""
+        adids = set()
+        for bucket in self.cover(since, until):
+            adids.update(bucket.realtime.adid_stats)
+        return adids
+
+    def adid_performance(self, adid: str, since: Optional[float] = None,
+                         until: Optional[float] = None) -> Dict[str, Dict]:
+        """One ADID's per-product performance for a window, without merging any other ADID"""
+        return merge_performance(
+            products for products in (bucket.realtime.adid_product_performance.get(adid)
+                                      for bucket in self.cover(since, until))
+            if products
+        )
+
+    def complete_history(self) -> bool:
+        """True while the coarsest tier still covers everything ever added"""
+        return self.horizon[DAY] == -math.inf
+
+    def stats(self) -> dict:
+        return {f"{width}s_buckets": len(self.buckets[width]) for width in self.WIDTHS}
@@ -0,0 +1,297 @@
+"""
+Product similarity engine (weighted Jaccard over user engagement vectors)
+"""
+from typing import Iterator, List, Optional, Tuple, Union
+import math
+
+import numpy as np
+import scipy.sparse as sp
+
+from utils.event_store import EventStore, CLICK, VIEW, NO_DURATION
+
+# Upper bound for the (rows x cols x users) temporary built per block
+DEFAULT_BLOCK_BYTES = 8 * 2**20
+
+# Upper bound on co-engaged pairs expanded at once by the sparse backend
+DEFAULT_MAX_PAIRS = 4_000_000
+
+# backend="auto" switches to sparse once the dense matrix would exceed this many cells
+AUTO_SPARSE_CELLS = 2_000_000
+
+BACKENDS = ("auto", "dense", "sparse")
+
+# Engagement weights: each click = 10 points, each second of view = 0.1 points
+# This gives clicks 100x more weight than views (80/20 effective ratio)
+CLICK_WEIGHT = 10.0
+VIEW_WEIGHT_PER_SECOND = 0.1
+
+
+def _sorted_index(keys: List[str], present: List[int]) -> Tuple[List[str], np.ndarray]:
+    """
+    Map interned codes to positions in the sorted list of their distinct keys.
+
+    Returns (sorted_keys, index) where index[code] is the row/column for that code.
+    Distinct codes that render to the same key share a position.
+    """
+    sorted_keys = sorted({keys[code] for code in present})
+    position = {key: i for i, key in enumerate(sorted_keys)}
+    index = np.zeros(len(keys), dtype=np.int64)
+    for code in present:
+        index[code] = position[keys[code]]
+    return sorted_keys, index
+
+
+def event_weights(event_type: np.ndarray, duration: np.ndarray) -> np.ndarray:
+    """Engagement points contributed by each event"""
+    view_seconds = np.where(duration == NO_DURATION, 0, duration) / 1000.0
+    return np.where(
+        event_type == CLICK, CLICK_WEIGHT,
+        np.where(event_type == VIEW, view_seconds * VIEW_WEIGHT_PER_SECOND, 0.0)
+    )
+
+
+def build_engagement_matrix(
+    store: EventStore, backend: str = "dense", since: Optional[float] = None, until: Optional[float] = None
+) -> Tuple[List[str], List[str], Union[np.ndarray, sp.csr_matrix]]:
+    """
+    Build the products x users engagement matrix from the event store.
+
+    Events are mapped to (row, column) through interned-id lookup tables and
+    accumulated chunk by chunk (bincount for dense, COO duplicate-summing for
+    sparse), so the build is linear in events and reads sealed segments
+    straight from their memory maps. With backend="sparse" the
+    result is a CSR matrix whose memory scales with engaged (product, user)
+    pairs; "auto" picks sparse for large catalogs. since/until restrict it to
+    events received in that epoch range.
+    Returns (products_list, users_list, matrix), both lists sorted.
+    """
+    chunks = list(store.chunks(since, until))
+    if not chunks:
+        return [], [], np.zeros((0, 0))
+
+    # Interned codes that occur in any chunk
+    seen_products = np.zeros(len(store.products), dtype=bool)
+    seen_users = np.zeros(len(store.adids), dtype=bool)
+    for cols in chunks:
+        seen_products[cols["product"]] = True
+        seen_users[cols["adid"]] = True
+    products_list, product_index = _sorted_index(store.product_keys, np.flatnonzero(seen_products).tolist())
+    users_list, user_index = _sorted_index(store.adids.values, np.flatnonzero(seen_users).tolist())
+    n_products, n_users = len(products_list), len(users_list)
+
+    if backend == "auto":
+        backend = "sparse" if n_products * n_users > AUTO_SPARSE_CELLS else "dense"
+
+    # One chunk (sealed segment or the hot events) at a time, so only per-chunk temporaries are allocated
+    if backend == "sparse":
+        matrix = sp.csr_matrix((n_products, n_users))
+        for cols in chunks:
+            weights = event_weights(cols["event_type"], cols["duration"])
+            matrix = matrix + sp.csr_matrix(
+                (weights, (product_index[cols["product"]], user_index[cols["adid"]])), shape=(n_products, n_users)
+            )
+        matrix.eliminate_zeros()
+        return products_list, users_list, matrix
+
+    matrix = np.zeros(n_products * n_users)
+    for cols in chunks:
+        cells = product_index[cols["product"]] * n_users + user_index[cols["adid"]]
+        weights = event_weights(cols["event_type"], cols["duration"])
+        matrix += np.bincount(cells, weights=weights, minlength=n_products * n_users)
+    return products_list, users_list, matrix.reshape(n_products, n_users)
+
+
+def engagement_totals(engagement: Union[np.ndarray, sp.spmatrix]) -> np.ndarray:
+    """Total engagement per product (row sums) for either backend"""
+    return np.asarray(engagement.sum(axis=1), dtype=np.float64).ravel()
+
+
+def _block_size(n_users: int, max_block_bytes: int) -> int:
+    """Rows per block so that a block x block x users float64 temporary fits the budget"""
+    per_pair = 8 * max(n_users, 1)
+    return max(1, int(math.sqrt(max_block_bytes / per_pair)))
+
+
+def iter_similarity_blocks(
+    engagement: np.ndarray, max_block_bytes: int = DEFAULT_BLOCK_BYTES
+) -> Iterator[Tuple[int, int, int, int, np.ndarray]]:
+    """
+    Yield (row_start, row_stop, col_start, col_stop, block) tiles of the
+    product x product similarity matrix, covering the upper triangle.
+
+    similarity(i, j) = sum(min(e_i, e_j)) / sum(max(e_i, e_j)), computed
+    per tile with array operations; sum(max) is derived as
+    total_i + total_j - sum(min), so only the minimum is materialized.
+    """
+    engagement = np.asarray(engagement, dtype=np.float64)
+    n_products, n_users = engagement.shape
+    totals = engagement.sum(axis=1)
+    block = _block_size(n_users, max_block_bytes)
+
+    for row_start in range(0, n_products, block):
+        row_stop = min(n_products, row_start + block)
+        rows = engagement[row_start:row_stop, None, :]
+        for col_start in range(row_start, n_products, block):
+            col_stop = min(n_products, col_start + block)
+            shared = np.minimum(rows, engagement[None, col_start:col_stop, :]).sum(axis=2)
+            union = totals[row_start:row_stop, None] + totals[None, col_start:col_stop] - shared
+            tile = np.divide(shared, union, out=np.zeros_like(shared), where=union > 0)
+            if row_start == col_start:
+                np.fill_diagonal(tile, 1.0)
+            yield row_start, row_stop, col_start, col_stop, tile
+
+
+def similarity_matrix(engagement: np.ndarray, max_block_bytes: int = DEFAULT_BLOCK_BYTES) -> np.ndarray:
+    """Full symmetric similarity matrix with 1.0 on the diagonal"""
+    n_products = len(engagement)
+    matrix = np.zeros((n_products, n_products))
+    for row_start, row_stop, col_start, col_stop, tile in iter_similarity_blocks(engagement, max_block_bytes):
+        matrix[row_start:row_stop, col_start:col_stop] = tile
+        matrix[col_start:col_stop, row_start:row_stop] = tile.T
+    return matrix
+
+
+def _dense_similarity_pairs(engagement: np.ndarray, threshold: float,
+                            max_block_bytes: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    rows, cols, sims = [], [], []
+    for row_start, _, col_start, _, tile in iter_similarity_blocks(engagement, max_block_bytes):
+        mask = tile > threshold
+        if row_start == col_start:
+            mask = np.triu(mask, k=1)
+        i, j = np.nonzero(mask)
+        rows.append(i + row_start)
+        cols.append(j + col_start)
+        sims.append(tile[i, j])
+    if not rows:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0)
+    return np.concatenate(rows), np.concatenate(cols), np.concatenate(sims)
+
+
+def sparse_shared_engagement(engagement: sp.spmatrix, max_pairs: int = DEFAULT_MAX_PAIRS) -> sp.csr_matrix:
+    """
+    sum(min(e_i, e_j)) for every product pair i < j that shares a user.
+
+    Works column by column of the CSC matrix (each column lists the products
+    one user engaged with), expanding only co-engaged pairs. Users are taken
+    in chunks of at most ~max_pairs pairs to bound temporary memory.
+    """
+    n_products, n_users = engagement.shape
+    csc = sp.csc_matrix(engagement)
+    csc.sort_indices()
+    indptr, indices, data = csc.indptr, csc.indices, csc.data
+    lengths = np.diff(indptr)
+    cumulative_pairs = np.cumsum(lengths * (lengths - 1) // 2)
+
+    shared = sp.csr_matrix((n_products, n_products))
+    user_start = 0
+    while user_start < n_users:
+        done = cumulative_pairs[user_start - 1] if user_start > 0 else 0
+        user_stop = int(np.searchsorted(cumulative_pairs, done + max_pairs, side="right"))
+        user_stop = max(user_stop, user_start + 1)  # a single heavy user still forms a chunk
+
+        first, last = indptr[user_start], indptr[user_stop]
+        positions = np.arange(first, last)
+        column = np.repeat(np.arange(user_start, user_stop), lengths[user_start:user_stop])
+        # Each entry pairs with the entries after it in the same user column
+        following = indptr[column + 1] - positions - 1
+        left = np.repeat(positions, following)
+        starts = np.cumsum(following) - following
+        right = left + 1 + (np.arange(len(left)) - np.repeat(starts, following))
+        if len(left):
+            chunk = sp.coo_matrix(
+                (np.minimum(data[left], data[right]), (indices[left], indices[right])),
+                shape=(n_products, n_products),
+            )
+            shared = shared + chunk.tocsr()
+        user_start = user_stop
+    return shared
+
+
+def _sparse_similarity_pairs(engagement: sp.spmatrix, threshold: float,
+                             max_pairs: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    totals = engagement_totals(engagement)
+    shared = sparse_shared_engagement(engagement, max_pairs).tocoo()
+    union = totals[shared.row] + totals[shared.col] - shared.data
+    sims = np.divide(shared.data, union, out=np.zeros_like(shared.data), where=union > 0)
+    mask = sims > threshold
+    return shared.row[mask].astype(np.int64), shared.col[mask].astype(np.int64), sims[mask]
+
+
+def similarity_pairs(
+    engagement: Union[np.ndarray, sp.spmatrix], threshold: float = 0.0,
+    max_block_bytes: int = DEFAULT_BLOCK_BYTES, max_pairs: int = DEFAULT_MAX_PAIRS,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    (rows, cols, similarities) for every product pair i < j whose similarity
+    exceeds threshold, sorted by (i, j). Sparse input uses the co-engagement
+    backend; dense input uses the blocked tile engine.
+    """
+    if sp.issparse(engagement):
+        rows, cols, sims = _sparse_similarity_pairs(engagement, threshold, max_pairs)
+    else:
+        rows, cols, sims = _dense_similarity_pairs(engagement, threshold, max_block_bytes)
+    order = np.lexsort((cols, rows))
+    return rows[order], cols[order], sims[order]
+
+
+def nearest_neighbors(
+    engagement: Union[np.ndarray, sp.spmatrix], k: Optional[int] = None, threshold: float = 0.0,
+    max_pairs: int = DEFAULT_MAX_PAIRS,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Directed (product, neighbor, similarity) triples: for every product, the
+    neighbors above threshold, best first, truncated to k when given.
+
+    Candidates come from the user -> products inverted index (the CSC columns
+    of the engagement matrix), so the work scales with co-engagement rather
+    than with products squared.
+    """
+    csr = engagement if sp.issparse(engagement) else sp.csr_matrix(engagement)
+    rows, cols, sims = _sparse_similarity_pairs(csr, threshold, max_pairs)
+    products = np.concatenate([rows, cols])
+    neighbors = np.concatenate([cols, rows])
+    sims = np.concatenate([sims, sims])
+
+    order = np.lexsort((neighbors, -sims, products))
+    products, neighbors, sims = products[order], neighbors[order], sims[order]
+    if k is not None:
+        rank = np.arange(len(products)) - np.searchsorted(products, products, side="left")
+        keep = rank < k
+        products, neighbors, sims = products[keep], neighbors[keep], sims[keep]
+    return products, neighbors, sims
+
+
+def product_neighbors(
+    engagement: Union[np.ndarray, sp.spmatrix], product: int, k: Optional[int] = None,
+    threshold: float = 0.0,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    (neighbors, similarities) for a single product, best first.
+
+    Only products sharing at least one of this product's users are scored.
+    """
+    csr = sp.csr_matrix(engagement)
+    totals = engagement_totals(csr)
+    row = csr.getrow(product)
+    users, values = row.indices, row.data
+    candidates = np.unique(csr[:, users].tocoo().row) if len(users) else np.zeros(0, dtype=np.int64)
+    candidates = candidates[candidates != product]
+
+    shared = np.minimum(csr[candidates][:, users].toarray(), values).sum(axis=1)
+    union = totals[product] + totals[candidates] - shared
+    sims = np.divide(shared, union, out=np.zeros_like(shared), where=union > 0)
+
+    mask = sims > threshold
+    candidates, sims = candidates[mask], sims[mask]
+    order = np.lexsort((candidates, -sims))[:k]
+    return candidates[order], sims[order]
+
+
+def neighbor_edges(products: np.ndarray, neighbors: np.ndarray,
+                   sims: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Collapse directed neighbor triples into undirected (i < j) edges, sorted by (i, j)"""
+    rows = np.minimum(products, neighbors)
+    cols = np.maximum(products, neighbors)
+    width = int(cols.max(initial=0)) + 1
+    _, first = np.unique(rows * width + cols, return_index=True)
+    return rows[first], cols[first], sims[first]
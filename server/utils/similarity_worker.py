@@ -0,0 +1,156 @@
+"""
+Background recomputation of similarity results in a worker process
+"""
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, Hashable, NamedTuple, Optional
+import asyncio
+import functools
+import os
+import time
+
+from utils.log import get_logger
+from utils.singleflight import SingleFlight
+
+logger = get_logger("similarity")
+
+
+class SimilarityResult(NamedTuple):
+    """A completed computation and the event-store state it was computed from"""
+    version: int
+    event_count: int
+    computed_at: float
+    content: Any
+
+    @property
+    def age(self) -> float:
+        return time.time() - self.computed_at
+
+
+class SimilarityWorker:
+    """
+    Keeps the latest similarity result per parameter set and recomputes it in
+    a process pool, so NumPy/NetworkX work never runs on the event loop.
+
+    Readers always get the latest completed result immediately (only the very
+    first request for a parameter set waits). A result is refreshed in the
+    background once it is behind the event store and either min_new_events
+    events have arrived or refresh_interval seconds have passed. Computations
+    run through `flights`, so requests and refreshes for the same parameters
+    share one; waiting requests are counted under `route`.
+    """
+
+    def __init__(self, store, compute: Callable, refresh_interval: float = 30.0,
+                 min_new_events: int = 500, max_results: int = 16, max_workers: int = 1,
+                 poll_interval: float = 1.0, warm_start: Optional[Callable] = None,
+                 flights: Optional[SingleFlight] = None, route: Optional[str] = None):
+        self.store = store
+        self.compute = compute  # module-level function: compute(store_snapshot, *params)
+        # Optional: warm_start(previous_content) -> state passed on as compute(..., previous=state)
+        self.warm_start = warm_start
+        self.refresh_interval = refresh_interval
+        self.min_new_events = min_new_events
+        self.max_results = max_results
+        self.max_workers = max_workers
+        self.poll_interval = poll_interval
+        self.flights = flights if flights is not None else SingleFlight()
+        self.route = route
+
+        self.results: "OrderedDict[Hashable, SimilarityResult]" = OrderedDict()
+        self._pending: Dict[Hashable, asyncio.Future] = {}
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._poller: Optional[asyncio.Task] = None
+        self.computations = 0
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self._executor
+
+    def start(self):
+        """Start the pool and the periodic refresh loop (call from a running event loop)"""
+        # Fork the worker up front rather than inside the first request (the pool starts processes on first use)
+        self._get_executor().submit(os.getpid)
+        if self._poller is None:
+            self._poller = asyncio.get_running_loop().create_task(self._poll())
+
+    async def stop(self):
+        if self._poller is not None:
+            self._poller.cancel()
+            self._poller = None
+        if self._executor is not None:
+            await asyncio.get_running_loop().run_in_executor(
+                None, lambda executor=self._executor: executor.shutdown(wait=True, cancel_futures=True)
+            )
+            self._executor = None
+
+    def is_stale(self, result: SimilarityResult) -> bool:
+        if result.version == self.store.version:
+            return False
+        new_events = len(self.store) - result.event_count
+        return new_events >= self.min_new_events or result.age >= self.refresh_interval
+
+    async def get(self, params: Hashable) -> SimilarityResult:
+        """Latest completed result for params, computing it first if there is none yet"""
+        result = self.results.get(params)
+        if result is None:
+            return await self.refresh(params)
+        self.results.move_to_end(params)
+        if self.is_stale(result):
+            self._schedule(params)
+        return result
+
+    async def refresh(self, params: Hashable) -> SimilarityResult:
+        """Recompute params now, joining a computation that is already running"""
+        return await asyncio.shield(self._schedule(params, self.route))
+
+    def _schedule(self, params: Hashable, route: Optional[str] = None) -> asyncio.Future:
+        task = self.flights.start(("similarity", params), lambda: self._compute(params), route)
+        if params not in self._pending:
+            self._pending[params] = task
+            task.add_done_callback(lambda done: self._finished(params, done))
+        return task
+
+    def _finished(self, params: Hashable, task: asyncio.Future):
+        self._pending.pop(params, None)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("Similarity refresh failed for %s", params, exc_info=task.exception())
+
+    async def run(self, function: Callable, *args, **kwargs):
+        """function(store snapshot, *args, **kwargs) in the worker pool, on the store as of now"""
+        # The snapshot shares the store's filled columns, so taking it does not stall ingest
+        compute = functools.partial(function, self.store.snapshot(), *args, **kwargs)
+        return await asyncio.get_running_loop().run_in_executor(self._get_executor(), compute)
+
+    async def _compute(self, params: Hashable) -> SimilarityResult:
+        version, event_count = self.store.version, len(self.store)
+        previous = self.results.get(params)
+        if self.warm_start is not None and previous is not None:
+            content = await self.run(self.compute, *params, previous=self.warm_start(previous.content))
+        else:
+            content = await self.run(self.compute, *params)
+        self.computations += 1
+
+        result = SimilarityResult(version, event_count, time.time(), content)
+        current = self.results.get(params)
+        if current is None or current.version <= version:
+            self.results[params] = result
+            self.results.move_to_end(params)
+            while len(self.results) > self.max_results:
+                self.results.popitem(last=False)
+        return result
+
+    async def _poll(self):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            for params, result in list(self.results.items()):
+                if self.is_stale(result):
+                    self._schedule(params)
+
+    def stats(self) -> dict:
+        return {
+            "results": len(self.results),
+            "pending": len(self._pending),
+            "computations": self.computations,
+            "event_store_version": self.store.version,
+        }
@@ -0,0 +1,123 @@
+"""
+Request coalescing: concurrent identical requests share one in-progress computation
+"""
+from typing import AsyncIterator, Awaitable, Callable, Dict, Hashable, List, Optional
+import asyncio
+
+from utils.log import get_logger
+
+logger = get_logger("singleflight")
+
+
+class _Broadcast:
+    """Chunks of one streamed body, readable by any number of requests while it is produced"""
+
+    def __init__(self):
+        self.chunks: List[bytes] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.changed = asyncio.Event()
+
+    def publish(self, chunk: Optional[bytes] = None, error: Optional[BaseException] = None, done: bool = False):
+        if chunk is not None:
+            self.chunks.append(chunk)
+        self.error = error
+        self.done = done
+        changed, self.changed = self.changed, asyncio.Event()
+        changed.set()
+
+    async def read(self) -> AsyncIterator[bytes]:
+        sent = 0
+        while True:
+            changed = self.changed
+            while sent < len(self.chunks):
+                yield self.chunks[sent]
+                sent += 1
+            if self.error is not None:
+                raise self.error
+            if self.done:
+                return
+            await changed.wait()
+
+
+class SingleFlight:
+    """
+    At most one computation per key at a time; callers that ask for a key
+    while its computation is running wait for it and get the same result.
+
+    do() shares an awaitable's result, share() a streamed body: the body is
+    produced by its own task, so a request that disconnects early does not
+    cut it short for the others. Keys must include everything the result
+    depends on (route, parameters, data version). Counts per route how many
+    requests there were, how many computations ran for them and how many
+    requests were coalesced into a running one.
+    """
+
+    def __init__(self):
+        self._flights: Dict[Hashable, asyncio.Future] = {}
+        self._broadcasts: Dict[Hashable, _Broadcast] = {}
+        self.routes: Dict[str, Dict[str, int]] = {}
+
+    def _count(self, route: Optional[str], joined: bool):
+        if route is None:
+            return
+        counts = self.routes.get(route)
+        if counts is None:
+            counts = self.routes[route] = {"requests": 0, "computations": 0, "coalesced": 0}
+        counts["requests"] += 1
+        counts["coalesced" if joined else "computations"] += 1
+
+    def start(self, key: Hashable, compute: Callable[[], Awaitable], route: Optional[str] = None) -> asyncio.Future:
+        """
+        The running computation for key, or compute() started now
+
+        route is the name the call is counted under (None for background work).
+        """
+        future = self._flights.get(key)
+        self._count(route, future is not None)
+        if future is None:
+            future = asyncio.ensure_future(compute())
+            self._flights[key] = future
+            future.add_done_callback(lambda done: self._flights.pop(key, None))
+        return future
+
+    async def do(self, key: Hashable, compute: Callable[[], Awaitable], route: Optional[str] = None):
+        """Result of the computation for key, joining one that is already running"""
+        # A caller that gives up (client gone) must not cancel the others' computation
+        return await asyncio.shield(self.start(key, compute, route))
+
+    def share(self, key: Hashable, source: Callable[[], AsyncIterator[bytes]], route: Optional[str] = None,
+              on_complete: Optional[Callable[[bytes], None]] = None) -> AsyncIterator[bytes]:
+        """
+        A body streamed from source(), or from the stream already being produced for key
+
+        source() is called here, so whatever it computes up front fails this
+        request rather than the stream. on_complete gets the whole body once
+        it has been produced (e.g. to cache it).
+        """
+        broadcast = self._broadcasts.get(key)
+        self._count(route, broadcast is not None)
+        if broadcast is None:
+            chunks = source()
+            broadcast = self._broadcasts[key] = _Broadcast()
+            task = asyncio.ensure_future(self._produce(key, broadcast, chunks, on_complete))
+            task.add_done_callback(lambda done: self._broadcasts.pop(key, None))
+        return broadcast.read()
+
+    async def _produce(self, key: Hashable, broadcast: _Broadcast, chunks: AsyncIterator[bytes],
+                       on_complete: Optional[Callable[[bytes], None]]):
+        try:
+            async for chunk in chunks:
+                broadcast.publish(chunk)
+                # Sources may render synchronously; let the readers send each chunk before the next
+                await asyncio.sleep(0)
+        except Exception as e:
+            logger.exception("Shared response for %s failed", key)
+            broadcast.publish(error=e, done=True)
+        else:
+            broadcast.publish(done=True)
+            if on_complete is not None:
+                on_complete(b"".join(broadcast.chunks))
+
+    def stats(self) -> dict:
+        return {"in_flight": len(self._flights) + len(self._broadcasts), "routes": self.routes}
@@ -0,0 +1,76 @@
+"""
+On-disk snapshots: event store columns (.npy) plus pickled dashboard state
+"""
+from typing import List, Optional, Tuple
+import json
+import os
+import pickle
+import re
+import shutil
+import time
+
+from utils.event_store import EventStore
+from utils.helpers import fsync_path
+
+SNAPSHOT_PATTERN = re.compile(r"^snapshot-(\d{12})$")
+
+
+def list_snapshots(directory: str) -> List[str]:
+    """Complete snapshot directories, oldest first"""
+    if not os.path.isdir(directory):
+        return []
+    names = sorted(name for name in os.listdir(directory) if SNAPSHOT_PATTERN.match(name))
+    return [os.path.join(directory, name) for name in names]
+
+
+def snapshot_path(directory: str, lsn: int) -> str:
+    return os.path.join(directory, f"snapshot-{lsn:012d}")
+
+
+def save_snapshot(directory: str, lsn: int, store: EventStore, state: bytes, keep: int = 2) -> str:
+    """
+    Write a snapshot covering every log record up to lsn.
+
+    `state` is the already pickled non-columnar state. The snapshot is built
+    in a temporary directory and renamed into place, so a crash never leaves
+    a half-written snapshot behind, and everything is fsynced before this
+    returns: callers delete the log records the snapshot covers right after.
+    Only the newest `keep` snapshots are kept.
+    """
+    os.makedirs(directory, exist_ok=True)
+    path = snapshot_path(directory, lsn)
+    if os.path.exists(path):
+        return path
+    tmp = os.path.join(directory, f".tmp-{os.path.basename(path)}")
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+
+    store.save(tmp)
+    with open(os.path.join(tmp, "state.pickle"), "wb") as f:
+        f.write(state)
+    with open(os.path.join(tmp, "meta.json"), "w") as f:
+        json.dump({"lsn": lsn, "events": len(store), "created_at": time.time()}, f)
+    for name in os.listdir(tmp):
+        fsync_path(os.path.join(tmp, name))
+    fsync_path(tmp)
+    os.rename(tmp, path)
+    fsync_path(directory)
+
+    for old in list_snapshots(directory)[:-keep]:
+        shutil.rmtree(old, ignore_errors=True)
+    return path
+
+
+def load_snapshot(path: str, store: EventStore) -> Tuple[int, dict]:
+    """Restore the event store from a snapshot; returns (lsn, unpickled state)"""
+    with open(os.path.join(path, "meta.json")) as f:
+        lsn = json.load(f)["lsn"]
+    store.restore(path)
+    with open(os.path.join(path, "state.pickle"), "rb") as f:
+        state = pickle.load(f)
+    return lsn, state
+
+
+def latest_snapshot(directory: str) -> Optional[str]:
+    snapshots = list_snapshots(directory)
+    return snapshots[-1] if snapshots else None
@@ -0,0 +1,54 @@
+"""
+Jinja2 templates for the dashboards, compiled once and streamed in chunks
+"""
+from typing import AsyncIterator
+import os
+
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+from markupsafe import Markup
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "templates")
+
+# Rendered output is sent in pieces of about this many characters
+STREAM_CHUNK_CHARS = 16384
+
+environment = Environment(
+    loader=FileSystemLoader(TEMPLATE_DIR),
+    autoescape=select_autoescape(["html"]),
+    auto_reload=False,
+    trim_blocks=True,
+    lstrip_blocks=True,
+)
+
+
+def showing(shown: int, total: int) -> str:
+    """Table title suffix when only the top rows are shown"""
+    return f" (top {shown} of {total})" if shown < total else ""
+
+
+def money(value: float) -> Markup:
+    """Two decimals; a formatted number needs no escaping"""
+    return Markup(f"{value:.2f}")
+
+
+environment.globals["showing"] = showing
+environment.filters["money"] = money
+
+
+async def template_chunks(name: str, context: dict) -> AsyncIterator[bytes]:
+    """A template rendered in pieces: the page head at once, the rest in STREAM_CHUNK_CHARS batches"""
+    buffer, size, first = [], 0, True
+    for text in environment.get_template(name).generate(**context):
+        buffer.append(text)
+        size += len(text)
+        if first or size >= STREAM_CHUNK_CHARS:
+            yield "".join(buffer).encode()
+            buffer, size, first = [], 0, False
+    if buffer:
+        yield "".join(buffer).encode()
+
+
+def precompile(*names: str):
+    """Compile templates up front so the first request does not pay for it"""
+    for name in names:
+        environment.get_template(name)
@@ -0,0 +1,83 @@
+"""
+Top-K rankings maintained at ingest time (heavy hitters for the dashboards' tables)
+"""
+from operator import itemgetter
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+import heapq
+
+
+class TopK:
+    """
+    The k keys with the largest values, for values that only grow (counts, running sums).
+
+    Uses Space-Saving's rule - a key that overtakes the smallest tracked
+    value replaces it - but on the exact values the aggregates already keep,
+    so there is no overestimate: as long as update() is called after every
+    increase, no untracked key exceeds any tracked one and the ranking is
+    exact. Most updates cost one dict lookup and one comparison; a
+    replacement costs O(k).
+    """
+
+    def __init__(self, k: int):
+        self.k = k
+        self.values: Dict[Hashable, Any] = {}
+        # Never above the smallest tracked value once k keys are tracked
+        self.floor = None
+
+    @classmethod
+    def from_rows(cls, k: int, rows: Dict, key: Callable) -> "TopK":
+        ranking = cls(k)
+        for name, row in rows.items():
+            ranking.update(name, key(row))
+        return ranking
+
+    def update(self, name: Hashable, value):
+        """Record that `name` now has `value` (never less than before)"""
+        values = self.values
+        if name in values or len(values) < self.k:
+            values[name] = value
+            if self.floor is None and len(values) == self.k:
+                self.floor = min(values.values())
+        elif value > self.floor:
+            smallest = min(values, key=values.__getitem__)
+            if value > values[smallest]:
+                del values[smallest]
+                values[name] = value
+            self.floor = min(values.values())
+
+    def top(self, n: Optional[int] = None) -> List[Tuple[Hashable, Any]]:
+        """(name, value) pairs, largest first"""
+        return sorted(self.values.items(), key=itemgetter(1), reverse=True)[:n]
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+
+def top_rows(rows: Dict, key: Callable, n: int, ranking: Optional[TopK] = None) -> List[Tuple[Hashable, Dict]]:
+    """
+    The n (name, row) pairs of `rows` with the largest key(row), largest first.
+
+    Served from `ranking` in O(k) when it tracks at least n keys; otherwise
+    (windowed snapshots, or more rows than are ranked) a heap over all rows.
+    """
+    if ranking is not None and n <= ranking.k:
+        return [(name, rows[name]) for name, _ in ranking.top(n)]
+    return heapq.nlargest(n, rows.items(), key=lambda item: key(item[1]))
+
+
+def diff_ranking(ranking: TopK, rows: Dict, key: Callable) -> List[str]:
+    """Where a ranking's values disagree with a full sort of the rows (ties may pick different keys)"""
+    expected = [key(row) for _, row in heapq.nlargest(ranking.k, rows.items(), key=lambda item: key(item[1]))]
+    actual = [value for _, value in ranking.top()]
+    mismatches = []
+    if len(expected) != len(actual):
+        mismatches.append(f"ranks {len(actual)} keys, expected {len(expected)}")
+    for rank, (a, b) in enumerate(zip(expected, actual)):
+        if a != b:
+            mismatches.append(f"rank {rank + 1}: {b!r} != {a!r}")
+            break
+    for name, value in ranking.values.items():
+        if key(rows[name]) != value:
+            mismatches.append(f"{name}: {value!r} != {key(rows[name])!r}")
+            break
+    return mismatches
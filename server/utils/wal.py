@@ -0,0 +1,274 @@
+"""
+Segmented, append-only write-ahead log for events, purchases and coupons
+"""
+from typing import Dict, Iterator, List, Optional
+import asyncio
+import json
+import os
+import re
+import struct
+import zlib
+
+from utils.log import get_logger
+
+logger = get_logger("wal")
+
+# Each record: payload length and CRC32, then the JSON payload
+HEADER = struct.Struct("<II")
+
+SEGMENT_PATTERN = re.compile(r"^wal-(\d{8})\.log$")
+
+DURABILITY_MODES = ("none", "group", "fsync")
+
+
+def encode_record(record: Dict) -> bytes:
+    payload = json.dumps(record, separators=(",", ":")).encode()
+    return HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+def decode_records(data: bytes) -> Iterator[tuple]:
+    """Yield (end_offset, record) for every intact record; stops at the first torn or corrupt one"""
+    offset = 0
+    while offset + HEADER.size <= len(data):
+        length, crc = HEADER.unpack_from(data, offset)
+        start = offset + HEADER.size
+        payload = data[start:start + length]
+        if len(payload) < length or zlib.crc32(payload) != crc:
+            return
+        offset = start + length
+        yield offset, json.loads(payload)
+
+
+class WriteAheadLog:
+    """
+    Append-only log split into numbered segment files (wal-00000001.log, ...).
+
+    Durability modes:
+    - "none":  records go to a buffered file that is flushed to the OS every
+               flush_interval seconds; a machine crash can lose recent records
+    - "group": group commit; append() waits until its record is fsynced.
+               Records that arrive while an fsync is in flight are committed
+               together by the next one. commit_delay optionally holds a
+               group open a little longer, unless flush_bytes are buffered.
+    - "fsync": every append() writes and fsyncs before returning
+
+    A new segment is started on open() and whenever the current one exceeds
+    segment_bytes, so a torn tail from a crash is only ever in the last
+    segment of the previous run.
+
+    Every record gets a log sequence number ("lsn"), increasing across runs.
+    A snapshot covering everything up to some lsn makes the segments that
+    only hold older records redundant; prune() deletes them.
+    """
+
+    def __init__(self, directory: str, mode: str = "group", segment_bytes: int = 64 * 2**20,
+                 flush_interval: float = 1.0, commit_delay: float = 0.0, flush_bytes: int = 2**20):
+        if mode not in DURABILITY_MODES:
+            raise ValueError(f"Unknown durability mode: {mode!r} (expected one of {DURABILITY_MODES})")
+        self.directory = directory
+        self.mode = mode
+        self.segment_bytes = segment_bytes
+        self.flush_interval = flush_interval
+        self.commit_delay = commit_delay
+        self.flush_bytes = flush_bytes
+
+        self._file = None
+        self._segment = 0
+        self._segment_size = 0
+        self._segment_lsn: Dict[str, int] = {}  # segment path -> highest lsn written to it
+
+        self.lsn = 0  # last assigned log sequence number
+
+        self._buffer: List[bytes] = []  # group mode: encoded records waiting for the next commit
+        self._buffered = 0
+        self._buffer_lsn = 0
+        self._commit: Optional[asyncio.Future] = None  # resolved when the buffered records are durable
+        self._wakeup: Optional[asyncio.Event] = None
+        self._flusher: Optional[asyncio.Task] = None
+        self._closing = False
+
+        self.records = 0
+        self.commits = 0
+        self.fsyncs = 0
+
+    def segments(self) -> List[str]:
+        """Segment file paths, oldest first"""
+        if not os.path.isdir(self.directory):
+            return []
+        names = sorted(name for name in os.listdir(self.directory) if SEGMENT_PATTERN.match(name))
+        return [os.path.join(self.directory, name) for name in names]
+
+    def replay(self, after_lsn: int = 0) -> Iterator[Dict]:
+        """
+        Every intact record with an lsn above after_lsn, in append order.
+
+        A torn tail is truncated away. Continues lsn numbering after the last record.
+        """
+        for path in self.segments():
+            with open(path, "rb") as f:
+                data = f.read()
+            end = 0
+            for end, record in decode_records(data):
+                lsn = record.get("lsn", 0)
+                self.lsn = max(self.lsn, lsn)
+                self._segment_lsn[path] = max(self._segment_lsn.get(path, 0), lsn)
+                if lsn > after_lsn:
+                    yield record
+            if end < len(data):
+                logger.warning("Truncating %d bytes of torn records at the end of %s", len(data) - end, path)
+                with open(path, "r+b") as f:
+                    f.truncate(end)
+
+    def open(self):
+        """Start a fresh segment for appends (call after replay)"""
+        os.makedirs(self.directory, exist_ok=True)
+        existing = self.segments()
+        last = int(SEGMENT_PATTERN.match(os.path.basename(existing[-1])).group(1)) if existing else 0
+        self._roll(last + 1)
+
+    def _roll(self, segment: int):
+        if self._file is not None:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+        self._segment = segment
+        self._segment_size = 0
+        self._file = open(os.path.join(self.directory, f"wal-{segment:08d}.log"), "ab")
+
+    def _write(self, data: bytes, lsn: int):
+        if self._segment_size >= self.segment_bytes:
+            self._roll(self._segment + 1)
+        self._file.write(data)
+        self._segment_size += len(data)
+        self._segment_lsn[self._file.name] = lsn
+
+    def _sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self.fsyncs += 1
+
+    def submit(self, record: Dict) -> Optional[asyncio.Future]:
+        """
+        Give the record the next lsn and write or buffer it, without waiting.
+
+        Returns a future to await before acknowledging (group mode), or None
+        when the record is already as durable as the mode promises. Apply the
+        record to in-memory state right after submit(), before awaiting, so a
+        snapshot never sees a logged record that is not yet applied.
+        """
+        self.lsn += 1
+        record["lsn"] = self.lsn
+        data = encode_record(record)
+        self.records += 1
+        if self.mode == "none":
+            self._write(data, self.lsn)
+            return None
+        if self.mode == "fsync":
+            self._write(data, self.lsn)
+            self._sync()
+            return None
+
+        self._buffer.append(data)
+        self._buffered += len(data)
+        self._buffer_lsn = self.lsn
+        if self._commit is None:
+            # First record of a new group wakes the flusher
+            self._commit = asyncio.get_running_loop().create_future()
+            self._wakeup.set()
+        elif self._buffered >= self.flush_bytes:
+            self._wakeup.set()
+        return asyncio.shield(self._commit)
+
+    async def append(self, record: Dict):
+        """Append one record; returns once it is as durable as the mode promises"""
+        commit = self.submit(record)
+        if commit is not None:
+            await commit
+
+    def _commit_group(self, data: bytes, lsn: int):
+        """Runs in a worker thread: one write and one fsync for a whole group"""
+        self._write(data, lsn)
+        self._sync()
+
+    async def _flush_loop(self):
+        loop = asyncio.get_running_loop()
+        while not self._closing:
+            if self.mode == "none":
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+            else:
+                await self._wakeup.wait()
+                self._wakeup.clear()
+                if self.commit_delay > 0 and not self._closing and self._buffered < self.flush_bytes:
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), self.commit_delay)
+                    except asyncio.TimeoutError:
+                        pass
+            self._wakeup.clear()
+            await self._flush(loop)
+
+    async def _flush(self, loop):
+        if self.mode == "none":
+            self._file.flush()
+            return
+        if not self._buffer:
+            return
+        data = b"".join(self._buffer)
+        commit, lsn = self._commit, self._buffer_lsn
+        self._buffer, self._buffered, self._commit = [], 0, None
+        try:
+            # Appends keep filling the next group while this one is fsynced off the event loop
+            await loop.run_in_executor(None, self._commit_group, data, lsn)
+        except Exception as e:
+            commit.set_exception(e)
+            logger.exception("WAL commit failed")
+        else:
+            self.commits += 1
+            commit.set_result(None)
+
+    def start(self):
+        """Start the background flusher (call from a running event loop, after open())"""
+        if self._flusher is None and self.mode != "fsync":
+            self._wakeup = asyncio.Event()
+            self._flusher = asyncio.get_running_loop().create_task(self._flush_loop())
+
+    async def close(self):
+        """Commit whatever is buffered, fsync and close the segment"""
+        if self._flusher is not None:
+            # Let an in-flight commit finish rather than cancelling it halfway
+            self._closing = True
+            self._wakeup.set()
+            await self._flusher
+            self._flusher = None
+        if self._file is None:
+            return
+        await self._flush(asyncio.get_running_loop())
+        self._sync()
+        self._file.close()
+        self._file = None
+
+    def prune(self, lsn: int) -> int:
+        """Delete closed segments whose records all have lsn <= lsn (covered by a snapshot)"""
+        # Never touch the segment being written (or one a commit thread is rolling over to)
+        current = self._segment if self._file is not None else float("inf")
+        removed = 0
+        for path in self.segments():
+            number = int(SEGMENT_PATTERN.match(os.path.basename(path)).group(1))
+            if number < current and self._segment_lsn.get(path, 0) <= lsn:
+                os.remove(path)
+                self._segment_lsn.pop(path, None)
+                removed += 1
+        return removed
+
+    def stats(self) -> dict:
+        return {
+            "mode": self.mode,
+            "lsn": self.lsn,
+            "segment": self._segment,
+            "segments": len(self.segments()),
+            "records": self.records,
+            "commits": self.commits,
+            "fsyncs": self.fsyncs,
+        }